@@ -7,12 +7,18 @@ import packaging
 import copy
 import pickle
 from generate_API_profile import *
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from core.blob_store import BlobStore, is_blob_id, load_source, load_source_lines
+from core.source_archive import SourceArchive, write_source_archive
+from core.profile_shards import ShardedProfile, write_sharded_profile, is_sharded_profile
 import difflib
 
-class AggeragatedModuleOrPackageNode:
+class AggeragatedModuleOrPackageNode(CompactNode):
+    # the root of an aggregate keeps its full-name index, see tree_index
+    __slots__ = ('name', 'full_name', 'children', 'parent', 'available_versions', '_full_name_index')
+
     def __init__(self, name):
-        self.name = name
+        self.name = intern_name(name)
         self.full_name = None
         self.children = []
         self.parent = None
@@ -22,9 +28,11 @@ class AggeragatedModuleOrPackageNode:
     def __hash__(self):
         return hash(id(self))
 
-class AggeragatedClassNode:
+class AggeragatedClassNode(CompactNode):
+    __slots__ = ('name', 'full_name', 'parent', 'children', 'aliases', 'available_versions', 'source')
+
     def __init__(self, name):
-        self.name = name
+        self.name = intern_name(name)
         self.full_name = None
         self.parent = None
         self.children = []
@@ -36,9 +44,11 @@ class AggeragatedClassNode:
     def __hash__(self):
         return hash(id(self))
 
-class AggeragatedClassAliasNode:
+class AggeragatedClassAliasNode(CompactNode):
+    __slots__ = ('name', 'full_name', 'parent', 'children', 'real_class', 'available_versions')
+
     def __init__(self, name):
-        self.name = name
+        self.name = intern_name(name)
         self.full_name = None
         self.parent = None
         self.children = []
@@ -49,9 +59,12 @@ class AggeragatedClassAliasNode:
     def __hash__(self):
         return hash(id(self))
 
-class AggeragatedAPINode:
+class AggeragatedAPINode(CompactNode):
+    __slots__ = ('name', 'full_name', 'parent', 'source', 'aliases', 'ast', 'kws', 'default_values', 'signatures',
+                 'available_versions')
+
     def __init__(self, name):
-        self.name = name
+        self.name = intern_name(name)
         self.full_name = None
         self.parent = None
         self.source = OrderedDict()
@@ -59,6 +72,7 @@ class AggeragatedAPINode:
         self.ast = None
         self.kws={}
         self.default_values=OrderedDict()
+        self.signatures=OrderedDict()
         self.available_versions = []
     def __str__(self):
         return str(self.name)
@@ -66,9 +80,11 @@ class AggeragatedAPINode:
         return hash(id(self))
 
 
-class AggeragatedAPIAliasNode:
+class AggeragatedAPIAliasNode(CompactNode):
+    __slots__ = ('name', 'full_name', 'parent', 'real_API', 'available_versions')
+
     def __init__(self, name):
-        self.name = name
+        self.name = intern_name(name)
         self.full_name = None
         self.parent = None
         self.real_API = OrderedDict()
@@ -79,6 +95,20 @@ class AggeragatedAPIAliasNode:
         return hash(id(self))
 
 
+def signature_changes(agg_node):
+    """[(version, next version)] where the signature of an aggregated API changed,
+    versions without a fingerprint are skipped."""
+    changes = []
+    last = None
+    for v, fingerprint in getattr(agg_node, "signatures", {}).items():
+        if fingerprint is None:
+            continue
+        if last is not None and fingerprint != last[1]:
+            changes.append((last[0], v))
+        last = (v, fingerprint)
+    return changes
+
+
 def aggregate_deprecation_history(lib_name, output_dir, output_dir_aggregate):
     #with open(os.path.join(output_dir, "package_lib_map.json"), 'r') as f:
         #API_dict = json.load(f)
@@ -102,12 +132,12 @@ def create_new_agg_tree(pf_tree,version):
     pf_agg_node_dict={}
 
     pf_leaf_stack = []
-    pf_working_queue = []
+    pf_working_queue = deque()
     pf_working_queue.append(pf_tree)
 
     # bfs to search all I leafs
     while len(pf_working_queue) > 0:
-        tmp_node = pf_working_queue.pop(0)
+        tmp_node = pf_working_queue.popleft()
         pf_leaf_stack.append(tmp_node)
         if hasattr(tmp_node, "children"):
             pf_working_queue.extend(tmp_node.children)
@@ -127,6 +157,8 @@ def create_new_agg_tree(pf_tree,version):
             agg_node.kws[version]=node.kws
             agg_node.source[version]={"no_diff":-1,"source":node.source}
             agg_node.default_values[version]=node.default_values
+            # profiles written before fingerprints existed have none
+            agg_node.signatures[version]=getattr(node, "signature", None)
         if isinstance(node,ClassNode):
             agg_node = AggeragatedClassNode(node.name)
             agg_node.available_versions.append(version)
@@ -158,52 +190,39 @@ def create_new_agg_tree(pf_tree,version):
                 agg_node.aliases[version]=set()
             for alias in node.aliases:
                 agg_node.aliases[version].add(pf_agg_node_dict[alias])
+    # the index of the profile tree, with its nodes swapped for theirs
+    pf_agg_node_dict[pf_tree]._full_name_index = OrderedDict(
+        (key, pf_agg_node_dict[node]) for key, node in tree_index(pf_tree).items())
     return pf_agg_node_dict[pf_tree]
     #construct_agg_tree_recursive(agg_tree,pf_tree,version)
 
 
 def all_nodes(root_node):
     pf_leaf_stack = []
-    pf_working_queue = []
+    pf_working_queue = deque()
     pf_working_queue.append(root_node)
 
     # bfs to search all I leafs
     while len(pf_working_queue) > 0:
-        tmp_node = pf_working_queue.pop(0)
+        tmp_node = pf_working_queue.popleft()
         pf_leaf_stack.append(tmp_node)
         if hasattr(tmp_node, "children"):
             pf_working_queue.extend(tmp_node.children)
     return pf_leaf_stack
 
-def add_tree_to_agg_tree(pf_tree, pf_agg_tree,version):
+def full_name_index(nodes):
+    # a class and its constructor share a full name, so apart from modules the key is (full name, kind)
+    table = OrderedDict()
+    index_nodes(table, nodes)
+    return table
+
+def add_tree_to_agg_tree(pf_tree, pf_agg_tree,version,source_store=None):
     new_agg_tree = create_new_agg_tree(pf_tree,version)
     #pf_agg_tree.available_versions.append(version)
     new_leaf_stack = all_nodes(new_agg_tree)
-    old_leaf_stack = all_nodes(pf_agg_tree)
-    old_table = OrderedDict()
-    new_table = OrderedDict()
-    for old_node in old_leaf_stack:
-        if isinstance(old_node,AggeragatedClassNode):
-            old_table[(old_node.full_name,"class")]=old_node
-        elif isinstance(old_node,AggeragatedClassAliasNode):
-            old_table[(old_node.full_name, "class_alias")] = old_node
-        elif isinstance(old_node,AggeragatedModuleOrPackageNode):
-            old_table[old_node.full_name]=old_node
-        elif isinstance(old_node,AggeragatedAPINode):
-            old_table[(old_node.full_name,"api")] = old_node
-        else:
-            old_table[(old_node.full_name, "api_alias")] = old_node
-    for new_node in new_leaf_stack:
-        if isinstance(new_node,AggeragatedClassNode):
-            new_table[(new_node.full_name,"class")]=new_node
-        elif isinstance(new_node,AggeragatedClassAliasNode):
-            new_table[(new_node.full_name, "class_alias")] = new_node
-        elif isinstance(new_node,AggeragatedModuleOrPackageNode):
-            new_table[new_node.full_name]=new_node
-        elif isinstance(new_node, AggeragatedAPINode):
-            new_table[(new_node.full_name, "api")] = new_node
-        else:
-            new_table[(new_node.full_name, "api_alias")] = new_node
+    # the aggregate's own index, updated as nodes are added, so a version costs its own size
+    old_table = tree_index(pf_agg_tree)
+    new_table = tree_index(new_agg_tree)
     for new_node in new_leaf_stack:
         if hasattr(new_node, "real_API"):
             for version in new_node.real_API:
@@ -220,12 +239,17 @@ def add_tree_to_agg_tree(pf_tree, pf_agg_tree,version):
 
     not_exist_nodes = [key for key in new_table if key not in old_table]
     already_exist_nodes = [key for key in new_table if key in old_table]
+    # the nodes that may hold full names in place of nodes, connected below
+    touched = []
     for key in not_exist_nodes:
         n = new_table[key]
-        add_new_node_to_agg_tree(n, pf_agg_tree)
+        branch = add_new_node_to_agg_tree(n, pf_agg_tree)
+        if branch is not None:
+            touched.extend(all_nodes(branch))
     for key in already_exist_nodes:
         n = new_table[key]
         n_old = old_table[key]
+        touched.append(n_old)
         n_old.available_versions.append(n.available_versions[0])
         if hasattr(n_old, "kws"):
             for key in n.kws:
@@ -233,21 +257,21 @@ def add_tree_to_agg_tree(pf_tree, pf_agg_tree,version):
         if hasattr(n_old, "default_values"):
             for key in n.default_values:
                 n_old.default_values[key] = n.default_values[key]
+        if hasattr(n_old, "signatures"):
+            for key in n.signatures:
+                n_old.signatures[key] = n.signatures[key]
         if hasattr(n_old, "source"):
             last_value = list(n_old.source.items())[-1]
             new_value = list(n.source.items())[-1]
-            last_src_file = last_value[1]["source"]
-            new_src_file = new_value[1]["source"]
-            if last_src_file=="":
-                last_src_lines=[]
-            else:
-                with open(last_src_file,"r") as f:
-                    last_src_lines = f.readlines()
-            if new_src_file == "":
-                new_src_lines=[]
+            # blob ids, or file paths in profiles written before the blob store
+            last_src = last_value[1]["source"]
+            new_src = new_value[1]["source"]
+            if last_src == new_src and is_blob_id(new_src):
+                # the same blob is the same text, nothing to read
+                last_src_lines = new_src_lines = []
             else:
-                with open(new_src_file,"r") as f:
-                    new_src_lines = f.readlines()
+                last_src_lines = load_source_lines(last_src, source_store)
+                new_src_lines = load_source_lines(new_src, source_store)
             diff_list=[]
             for line in difflib.unified_diff(last_src_lines, new_src_lines, fromfile='file1', tofile='file2', n=0):
                 for prefix in ('---', '+++', '@@'):
@@ -267,10 +291,8 @@ def add_tree_to_agg_tree(pf_tree, pf_agg_tree,version):
             for key in n.aliases:
                 n_old.aliases[key]=n.aliases[key]
 
-    # connect
-
-    new_all_nodes = all_nodes(pf_agg_tree)
-    for node in new_all_nodes:
+    # connect, names of nodes added by this version are in the index by now
+    for node in touched:
         if hasattr(node,"real_API"):
             for key in node.real_API:
                 dst = node.real_API[key]
@@ -332,11 +354,9 @@ def add_new_node_to_agg_tree(node,pf_agg_tree):
     tmp_node = pf_agg_tree
     ind = None
     for i in access_path_list[1:]:
-        child_name_list = []
-        for child in tmp_node.children:
-            child_name_list.append(child.name)
-        if i in child_name_list:
-            tmp_node = tmp_node.children[child_name_list.index(i)]
+        child = tmp_node.child(i)
+        if child is not None:
+            tmp_node = child
         else:
             ind = access_path_list.index(i)
             break
@@ -346,32 +366,28 @@ def add_new_node_to_agg_tree(node,pf_agg_tree):
         for i in range(len(sliced_path) - 1):
             tmp = tmp.parent
         tmp_node.children.append(tmp)
+        index_nodes(tree_index(pf_agg_tree), all_nodes(tmp))
+        return tmp
+    return None
 
 def add_node_to_agg_tree(node,pf_agg_tree,version):
     API_full = node.full_name
     access_path_list = API_full.split(".")
     tmp_node = pf_agg_tree
     for i in access_path_list[1:]:
-        pas = False
-        for child in tmp_node.children:
-            if child.name == i:
-                tmp_node = child
-                pas = True
-                break
-        if not pas:
+        child = tmp_node.child(i)
+        if child is not None:
+            tmp_node = child
+        else:
             # create the node
             node = merge_branch_in_agg_tree(node,pf_agg_tree,version)
             return node
     if isinstance(node, AggeragatedAPIAliasNode) and isinstance(tmp_node, AggeragatedClassAliasNode) or \
             isinstance(node, AggeragatedAPINode) and isinstance(tmp_node, AggeragatedClassNode):
-        raise_except = True
-        for child in tmp_node.children:
-            if child.name == tmp_node.name:
-                tmp_node=child
-                raise_except = False
-                break
-        if raise_except:
+        constructor = tmp_node.child(tmp_node.name)
+        if constructor is None:
             raise Exception("missing node")
+        tmp_node = constructor
     # else add info
     if version in tmp_node.available_versions:
         return tmp_node
@@ -412,11 +428,9 @@ def merge_branch_in_agg_tree(node,pf_agg_tree,version):
     tmp_node = pf_agg_tree
     ind = None
     for i in access_path_list[1:]:
-        child_name_list = []
-        for child in tmp_node.children:
-            child_name_list.append(child.name)
-        if i in child_name_list:
-            tmp_node = tmp_node.children[child_name_list.index(i)]
+        child = tmp_node.child(i)
+        if child is not None:
+            tmp_node = child
         else:
             ind = access_path_list.index(i)
             break
@@ -427,6 +441,7 @@ def merge_branch_in_agg_tree(node,pf_agg_tree,version):
             tmp = tmp.parent
         tmp_node.children.append(tmp)
         leaf_list = all_nodes(tmp)
+        index_nodes(tree_index(pf_agg_tree), leaf_list)
         for node2 in leaf_list:
             if hasattr(node2,"real_API"):
                 new_node = add_node_to_agg_tree(node2.real_API[version],pf_agg_tree,version)
@@ -486,8 +501,56 @@ def construct_agg_tree_recursive(agg_node,pf_node,version):
 
 
 
-def aggregate_profile(lib_name, output_dir, output_dir_aggregate):
-    if os.path.exists(os.path.join(output_dir_aggregate, "{}.pickle".format(lib_name))):
+def source_blob_ids(agg_tree):
+    # the blob ids of every version's source in an aggregate tree
+    blob_ids = set()
+    for node in all_nodes(agg_tree):
+        if isinstance(node, (AggeragatedAPINode, AggeragatedClassNode)):
+            for value in node.source.values():
+                if is_blob_id(value["source"]):
+                    blob_ids.add(value["source"])
+    return blob_ids
+
+
+def source_archive_path(output_dir_aggregate, pkg):
+    return os.path.join(output_dir_aggregate, "{}.srcpack".format(pkg))
+
+
+def sharded_profile_path(output_dir_aggregate, pkg):
+    return os.path.join(output_dir_aggregate, "{}.shards".format(pkg))
+
+
+def open_sharded_profile(output_dir_aggregate, pkg):
+    """The sharded aggregate of a package, None if it was written as one pickle."""
+    path = sharded_profile_path(output_dir_aggregate, pkg)
+    if not is_sharded_profile(path):
+        return None
+    return ShardedProfile(path)
+
+
+def open_source_archive(output_dir_aggregate, pkg):
+    """The packed sources of an aggregate tree, None for aggregates written without one."""
+    path = source_archive_path(output_dir_aggregate, pkg)
+    if not os.path.exists(path):
+        return None
+    return SourceArchive(path)
+
+
+def get_source(agg_node, version, source_archive=None):
+    """The source text of an aggregated API or class in a version, read from the archive
+    on demand; None if the node has no source in that version."""
+    if version not in agg_node.source:
+        return None
+    return load_source(agg_node.source[version]["source"], source_archive)
+
+
+def aggregate_profile(lib_name, output_dir, output_dir_aggregate, output_dir_store_src=None, sharded=False,
+                      workers=1, columnar=False):
+    # sharded writes <pkg>.shards/, one pickle and source archive per top-level subpackage,
+    # `workers` shards at a time, instead of <pkg>.pickle and <pkg>.srcpack;
+    # columnar also writes the aggregate as <pkg>.cols, read without unpickling
+    if os.path.exists(os.path.join(output_dir_aggregate, "{}.pickle".format(lib_name))) or \
+            is_sharded_profile(sharded_profile_path(output_dir_aggregate, lib_name)):
         print("skip {}", lib_name)
         return
     versions = os.listdir(os.path.join(os.path.join(output_dir, lib_name)))
@@ -499,6 +562,8 @@ def aggregate_profile(lib_name, output_dir, output_dir_aggregate):
     count_none = 0
     count_notnone = 0
     pf_agg_dict = {}
+    # profile_version stores the sources under output_dir_store_src, by default the aggregate directory
+    source_store = BlobStore.open(os.path.join(output_dir_store_src or output_dir_aggregate, "blobs"))
     for version in versions:
         output_v_dir = os.path.join(os.path.join(output_dir, lib_name), version)
         if not os.path.exists(output_v_dir):
@@ -506,16 +571,26 @@ def aggregate_profile(lib_name, output_dir, output_dir_aggregate):
         file_list = glob.glob(os.path.join(output_v_dir, "*.pickle"))
         for file in file_list:
             with open(file, 'rb') as f:
-                pf_tree = pickle.load(f)
+                pf_tree = load_profile(f)
             if pf_tree.name not in pf_agg_dict:
                 pf_agg_dict[pf_tree.name]=create_new_agg_tree(pf_tree,version)
             else:
                 pf_agg_tree= pf_agg_dict[pf_tree.name]
-                add_tree_to_agg_tree(pf_tree, pf_agg_tree,version)
+                add_tree_to_agg_tree(pf_tree, pf_agg_tree,version,source_store)
 
     for pkg in pf_agg_dict:
+        if columnar:
+            # numpy is only needed for this format
+            from core.columnar_profile import write_columnar_profile
+            write_columnar_profile(pf_agg_dict[pkg], os.path.join(output_dir_aggregate, "{}.cols".format(pkg)))
+        if sharded:
+            write_sharded_profile(pf_agg_dict[pkg], sharded_profile_path(output_dir_aggregate, pkg), source_store,
+                                  workers)
+            continue
         with open(os.path.join(output_dir_aggregate, "{}.pickle".format(pkg)), 'wb') as f:
             pickle.dump(pf_agg_dict[pkg], f, pickle.HIGHEST_PROTOCOL)
+        write_source_archive(source_archive_path(output_dir_aggregate, pkg), source_blob_ids(pf_agg_dict[pkg]),
+                             source_store)
 
 
 
@@ -0,0 +1,179 @@
+import os
+import glob
+import json
+import argparse
+from packaging.version import parse as parse_version
+from generate_API_profile import *
+from download_pypi import create_session, HostLimiter, DownloadStats, download_version, \
+    DATA_DIR, CACHE_DIR, METADATA_CACHE_DIR
+from core.index_backend import open_index
+from core.artifact_select import select_artifact
+from core.artifact_cache import ArtifactCache
+from core.module_extractor import EXTRACTOR_VERSION
+
+
+def profile_names(pf_trees):
+    names = set()
+    working_queue = list(pf_trees)
+    while len(working_queue) > 0:
+        tmp_node = working_queue.pop(0)
+        names.add(tmp_node.full_name)
+        if hasattr(tmp_node, "children"):
+            working_queue.extend(tmp_node.children)
+    return names
+
+
+class Prober:
+    """Answer "does this version have the API?", downloading and profiling a version only once.
+
+    The full names of every probed version are kept in <cache_dir>/<lib>.json, so later
+    bisections of other APIs of the same library reuse them. The file, like the profiles
+    on disk, is stamped with the extractor version, names found by another extractor are
+    not reused. A version is
+    recorded as unprofilable only when it has no artifact or its profile is empty, a
+    failed download is tried again next time.
+    """
+    def __init__(self, lib_name, releases, index, output_dir, output_dir_store_src, cache_dir, partial=False):
+        self.lib_name = lib_name
+        self.releases = releases
+        self.index = index
+        self.output_dir = output_dir
+        self.output_dir_store_src = output_dir_store_src
+        self.partial = partial
+        self.cache_file = os.path.join(cache_dir, "{}.json".format(lib_name))
+        self.n_profiled = 0
+        self.n_cached = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache = {}
+        if os.path.exists(self.cache_file):
+            with open(self.cache_file) as f:
+                data = json.load(f)
+            if data.get("extractor_version") == EXTRACTOR_VERSION:
+                self.cache = data["versions"]
+        self.session = create_session(pool_size=4)
+        self.limiter = HostLimiter(4)
+        self.stats = DownloadStats()
+        self.artifact_cache = ArtifactCache(CACHE_DIR)
+
+    def _save(self):
+        with open(self.cache_file, 'w') as f:
+            json.dump({"extractor_version": EXTRACTOR_VERSION, "versions": self.cache}, f)
+
+    def _load_profiles(self, version):
+        # pickles of another extractor, or from before the stamp, are not reused
+        output_v_dir = os.path.join(self.output_dir, self.lib_name, version)
+        if not profile_is_current(output_v_dir):
+            return []
+        pf_trees = []
+        for file in glob.glob(os.path.join(output_v_dir, "*.pickle")):
+            with open(file, 'rb') as f:
+                pf_trees.append(load_profile(f))
+        return pf_trees
+
+    def names(self, version):
+        """The full names of a version, None if it cannot be profiled."""
+        if version in self.cache:
+            self.n_cached += 1
+            return None if self.cache[version] is None else set(self.cache[version])
+        pf_trees = self._load_profiles(version)
+        if not pf_trees:
+            file_info = select_artifact(self.releases[version])
+            v_dir = os.path.join(str(DATA_DIR), self.lib_name, version)
+            if file_info is not None:
+                if not download_version(self.session, self.limiter, self.stats, self.lib_name, version,
+                                        [self.index.resolve(file_info)], partial=self.partial,
+                                        cache=self.artifact_cache):
+                    # possibly a transient error, not remembered
+                    return None
+                pf_trees = profile_version(self.lib_name, version, v_dir, self.output_dir, self.output_dir_store_src)
+            self.n_profiled += 1
+        else:
+            self.n_cached += 1
+        names = profile_names(pf_trees) if pf_trees else None
+        self.cache[version] = None if names is None else sorted(names)
+        self._save()
+        return names
+
+    def has(self, version, API_name):
+        names = self.names(version)
+        return None if names is None else API_name in names
+
+
+def bisect_API(API_name, versions, prober):
+    """Find the two neighbouring versions between which API_name appeared or vanished.
+
+    Returns (last version with the first state, first version with the other state, first state),
+    or None if the API has the same state at both ends. Versions that cannot be profiled are skipped.
+    """
+    versions = list(versions)
+
+    def probe_from(i, step, stop):
+        # the nearest profilable version from i towards stop
+        while i != stop:
+            state = prober.has(versions[i], API_name)
+            if state is not None:
+                return i, state
+            i += step
+        return None, None
+
+    lo, lo_state = probe_from(0, 1, len(versions))
+    if lo is None:
+        return None
+    hi, hi_state = probe_from(len(versions) - 1, -1, lo)
+    if hi is None or hi_state == lo_state:
+        return None
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        i, state = probe_from(mid, 1, hi)
+        if i is None:
+            # nothing profilable in (mid, hi), look at [lo, mid) instead
+            i, state = probe_from(mid - 1, -1, lo)
+            if i is None:
+                break
+        if state == lo_state:
+            lo = i
+        else:
+            hi = i
+    return versions[lo], versions[hi], lo_state
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="find the release where an API appeared or vanished with O(log N) profiled versions")
+    parser.add_argument('API_name', type=str, help='The full API name, e.g. requests.utils.get_encodings_from_content')
+    parser.add_argument('--lib', type=str, default=None, help='The library name, default is the first part of the API name')
+    parser.add_argument('--index', type=str, default=None,
+                        help='pypi (default), a JSON API mirror URL, a local mirror directory or a simple index on disk')
+    parser.add_argument('--pre', action='store_true', help='Also consider pre-releases')
+    parser.add_argument('--partial', action='store_true', help='Only fetch the profiled members of wheels')
+    parser.add_argument('--output_path', type=str, default='./output_profile')
+    parser.add_argument('--output_dir_store_src', type=str, default='./output_agg')
+    parser.add_argument('--cache_dir', type=str, default='./bisect_cache')
+    args = parser.parse_args()
+
+    lib_name = args.lib or args.API_name.split('.')[0]
+    session = create_session(pool_size=4)
+    index = open_index(args.index, session, METADATA_CACHE_DIR)
+    releases = index.releases(lib_name)
+    # releases with a wheel or an sdist can be profiled
+    versions = [v for v in releases if select_artifact(releases[v]) is not None and
+                (args.pre or not parse_version(v).is_prerelease)]
+    versions.sort(key=parse_version)
+    print("{}: {} profilable releases".format(lib_name, len(versions)))
+
+    prober = Prober(lib_name, releases, index, args.output_path, args.output_dir_store_src,
+                    args.cache_dir, partial=args.partial)
+    result = bisect_API(args.API_name, versions, prober)
+    print("profiled {} versions, {} answered from cache".format(prober.n_profiled, prober.n_cached))
+    if result is None:
+        print("{} has the same state in the first and the last release, nothing to bisect".format(args.API_name))
+        return
+    before, after, present_before = result
+    dates = index.release_dates(lib_name)
+    change = "vanished" if present_before else "appeared"
+    print("{} {} between {} ({}) and {} ({})".format(args.API_name, change, before, dates.get(before, "?"),
+                                                    after, dates.get(after, "?")))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import os
+import glob
+import time
+import argparse
+from aggregate_API_profile import *
+from core.columnar_profile import write_columnar_profile, ColumnarProfile
+
+
+def columnar_path(pickle_path):
+    return pickle_path[:-len(".pickle")] + ".cols"
+
+
+def convert_pickle(pickle_path, output_path=None):
+    """Convert a profile or aggregate pickle to the columnar format, next to it by default.
+
+    A per-version profile lives in <output_dir>/<lib>/<version>/, its version is
+    taken from the directory name.
+    """
+    with open(pickle_path, 'rb') as f:
+        pf_tree = load_profile(f)
+    version = os.path.basename(os.path.dirname(os.path.abspath(pickle_path)))
+    output_path = output_path or columnar_path(pickle_path)
+    n = write_columnar_profile(pf_tree, output_path, version)
+    return output_path, n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="convert pickled profiles and aggregates to the columnar format")
+    parser.add_argument('paths', nargs='+', help='pickles, or directories searched for pickles')
+    args = parser.parse_args()
+
+    pickle_paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            pickle_paths.extend(sorted(glob.glob(os.path.join(path, "**", "*.pickle"), recursive=True)))
+        else:
+            pickle_paths.append(path)
+    for pickle_path in pickle_paths:
+        try:
+            output_path, n = convert_pickle(pickle_path)
+        except Exception as e:
+            print("Error: cannot convert {}: {}".format(pickle_path, e))
+            continue
+        start = time.perf_counter()
+        ColumnarProfile(output_path)
+        print("{} -> {}, {} nodes, opens in {:.1f} ms".format(pickle_path, output_path, n,
+                                                               1000 * (time.perf_counter() - start)))
+
+
+if __name__ == '__main__':
+    main()
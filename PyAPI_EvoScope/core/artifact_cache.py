@@ -0,0 +1,127 @@
+import os
+import re
+import shutil
+import hashlib
+import threading
+
+
+class DigestMismatch(Exception):
+    pass
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def content_range_start(response):
+    """First byte of a 206 response, None if the Content-Range header is missing or malformed."""
+    m = re.match(r'bytes\s+(\d+)-', response.headers.get('Content-Range') or '')
+    return int(m.group(1)) if m else None
+
+
+class ArtifactCache:
+    """Content-addressed store of downloaded artifacts, keyed by sha256.
+
+    Downloads go to <digest>.part first, are resumed with Range requests,
+    hashed while streaming and only renamed into place once the digest matches.
+    Version directories get hardlinks to the stored file.
+    """
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._digest_locks = {}
+
+    def path_for(self, sha256):
+        return os.path.join(self.root, 'sha256', sha256[:2], sha256)
+
+    def has(self, sha256):
+        return os.path.exists(self.path_for(sha256))
+
+    def _digest_lock(self, sha256):
+        with self._lock:
+            if sha256 not in self._digest_locks:
+                self._digest_locks[sha256] = threading.Lock()
+            return self._digest_locks[sha256]
+
+    def fetch(self, session, url, sha256, chunk_size=65536):
+        """Make sure the artifact is in the cache, return the number of bytes transferred."""
+        with self._digest_lock(sha256):
+            final_path = self.path_for(sha256)
+            if os.path.exists(final_path):
+                return 0
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            part_path = final_path + '.part'
+
+            # hash what an interrupted run left behind, then ask for the rest
+            hasher = hashlib.sha256()
+            offset = 0
+            if os.path.exists(part_path):
+                with open(part_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        hasher.update(chunk)
+                        offset += len(chunk)
+
+            n_bytes = 0
+            while True:
+                headers = {'Range': 'bytes={}-'.format(offset)} if offset else {}
+                with session.get(url, headers=headers, stream=True, timeout=60) as response:
+                    # 416: the part file is already complete
+                    if offset and response.status_code == 416:
+                        break
+                    response.raise_for_status()
+                    if offset and response.status_code == 206 and content_range_start(response) != offset:
+                        # the range sent back does not continue the part file, ask for the whole file
+                        hasher = hashlib.sha256()
+                        offset = 0
+                        continue
+                    if offset and response.status_code != 206:
+                        # the server ignored the Range header, start over
+                        hasher = hashlib.sha256()
+                        offset = 0
+                    with open(part_path, 'ab' if offset else 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            f.write(chunk)
+                            hasher.update(chunk)
+                            n_bytes += len(chunk)
+                break
+
+            if hasher.hexdigest() != sha256:
+                os.remove(part_path)
+                raise DigestMismatch('{}: expected sha256 {}, got {}'.format(url, sha256, hasher.hexdigest()))
+            os.replace(part_path, final_path)
+            return n_bytes
+
+    def adopt(self, path, sha256):
+        """Move an already downloaded file into the cache if its digest matches."""
+        if file_sha256(path) != sha256:
+            return False
+        with self._digest_lock(sha256):
+            final_path = self.path_for(sha256)
+            if not os.path.exists(final_path):
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                try:
+                    os.link(path, final_path)
+                except OSError:
+                    shutil.copyfile(path, final_path)
+        return True
+
+    def is_linked(self, sha256, dst_path):
+        try:
+            return os.path.samefile(self.path_for(sha256), dst_path)
+        except OSError:
+            return False
+
+    def link_into(self, sha256, dst_path):
+        """Hardlink the cached artifact to dst_path, copy if hardlinks are not possible."""
+        if self.is_linked(sha256, dst_path):
+            return
+        if os.path.exists(dst_path):
+            os.remove(dst_path)
+        try:
+            os.link(self.path_for(sha256), dst_path)
+        except OSError:
+            shutil.copyfile(self.path_for(sha256), dst_path)
@@ -0,0 +1,102 @@
+import os
+import re
+from collections import namedtuple
+
+# PEP 427: {distribution}-{version}(-{build tag})?-{python tag}-{abi tag}-{platform tag}.whl
+WheelTags = namedtuple('WheelTags', ['name', 'version', 'build', 'python_tags', 'abi_tags', 'platform_tags'])
+
+_python_tag_re = re.compile(r'^(py|cp|pp|ip|jy)(\d)(\d*)$')
+
+
+def parse_wheel_filename(filename):
+    """Return the WheelTags of a wheel filename, or None if it is not a valid wheel name."""
+    if not filename.endswith('.whl'):
+        return None
+    parts = filename[:-4].split('-')
+    if len(parts) == 5:
+        name, version, py, abi, plat = parts
+        build = None
+    elif len(parts) == 6:
+        name, version, build, py, abi, plat = parts
+    else:
+        return None
+    # PEP 425 compressed tag sets, e.g. py2.py3
+    return WheelTags(name, version, build, py.split('.'), abi.split('.'), plat.split('.'))
+
+
+def python_tag_version(tag):
+    # py3 -> (3,), cp310 -> (3, 10)
+    m = _python_tag_re.match(tag)
+    if m is None:
+        return ()
+    if m.group(3):
+        return (int(m.group(2)), int(m.group(3)))
+    return (int(m.group(2)),)
+
+
+def platform_rank(platform_tags):
+    # lower is better, None means we cannot profile this wheel on linux
+    ranks = []
+    for plat in platform_tags:
+        if plat == 'any':
+            ranks.append(0)
+        elif plat.startswith('manylinux'):
+            ranks.append(1)
+        elif plat.startswith('musllinux'):
+            ranks.append(2)
+        elif 'linux' in plat:
+            ranks.append(3)
+    return min(ranks) if ranks else None
+
+
+def is_sdist(filename):
+    return filename.endswith(('.tar.gz', '.tgz', '.tar.bz2', '.zip')) and not filename.endswith('.whl')
+
+
+def wheel_sort_key(file_info):
+    """Sort key of a candidate wheel: python 2 only wheels last, otherwise pure python first,
+    then manylinux, newest python tag, smallest size."""
+    tags = parse_wheel_filename(file_info['filename'])
+    py_ver = max((python_tag_version(t) for t in tags.python_tags), default=())
+    py2_only = bool(py_ver) and py_ver[0] < 3
+    size = file_info.get('size') or 0
+    return (py2_only, platform_rank(tags.platform_tags), tuple(-v for v in py_ver) or (1,), size)
+
+
+def rank_wheels(files):
+    """Return the profilable wheels of a release, best first.
+
+    files are dicts as in the PyPI JSON API, at least with 'filename' and optionally 'size'.
+    """
+    candidates = []
+    for file_info in files:
+        tags = parse_wheel_filename(file_info['filename'])
+        if tags is None or platform_rank(tags.platform_tags) is None:
+            continue
+        candidates.append(file_info)
+    candidates.sort(key=wheel_sort_key)
+    return candidates
+
+
+def select_artifact(files, allow_sdist=True):
+    """Pick the single artifact of a release we want to profile, or None."""
+    wheels = rank_wheels(files)
+    if wheels:
+        return wheels[0]
+    if allow_sdist:
+        sdists = [f for f in files if is_sdist(f['filename'])]
+        # prefer .tar.gz, it can be streamed
+        sdists.sort(key=lambda f: (not f['filename'].endswith('.tar.gz'), f.get('size') or 0))
+        if sdists:
+            return sdists[0]
+    return None
+
+
+def local_files(path):
+    """List the files of a local version directory in the PyPI JSON shape."""
+    files = []
+    for fn in os.listdir(path):
+        full_path = os.path.join(path, fn)
+        if os.path.isfile(full_path):
+            files.append({'filename': fn, 'size': os.path.getsize(full_path)})
+    return files
@@ -0,0 +1,95 @@
+import io
+import os
+import re
+import hashlib
+import threading
+
+_blob_id_re = re.compile(r'[0-9a-f]{64}')
+
+
+def is_blob_id(ref):
+    return isinstance(ref, str) and _blob_id_re.fullmatch(ref) is not None
+
+
+class BlobStore:
+    """Content-addressed store of source texts, each unique text is kept once.
+
+    A blob is stored under the sha256 of its utf-8 bytes, in <root>/<2 hex>/<62 hex>,
+    so the same function in every version, library and run maps to one file.
+    Writes go through a temporary file and an atomic rename, several processes can
+    share a store. Ids known to the store cost a set lookup to write again.
+    """
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    def __init__(self, root):
+        self.root = root
+        self._known = set()
+        self._lock = threading.Lock()
+        self.n_written = 0
+        self.n_deduplicated = 0
+
+    @classmethod
+    def open(cls, root):
+        # one store per root and process, so its known ids are shared by every version profiled
+        root = os.path.abspath(root)
+        with cls._stores_lock:
+            if root not in cls._stores:
+                cls._stores[root] = cls(root)
+            return cls._stores[root]
+
+    def __getstate__(self):
+        return {'root': self.root}
+
+    def __setstate__(self, state):
+        self.__init__(state['root'])
+
+    def _path(self, blob_id):
+        return os.path.join(self.root, blob_id[:2], blob_id[2:])
+
+    def put(self, text):
+        """Store text, return its blob id."""
+        data = text.encode('utf-8')
+        blob_id = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if blob_id in self._known:
+                self.n_deduplicated += 1
+                return blob_id
+        path = self._path(blob_id)
+        written = not os.path.exists(path)
+        if written:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._known.add(blob_id)
+            if written:
+                self.n_written += 1
+            else:
+                self.n_deduplicated += 1
+        return blob_id
+
+    def get(self, blob_id):
+        with open(self._path(blob_id), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def report(self):
+        return "{} source blobs written, {} deduplicated".format(self.n_written, self.n_deduplicated)
+
+
+def load_source(ref, source_store=None):
+    """The source text a profile node refers to: a blob id, or the path of a
+    per-API file as written by older profiles, '' for no source."""
+    if not ref:
+        return ""
+    if is_blob_id(ref) and source_store is not None:
+        return source_store.get(ref)
+    with open(ref, "r") as f:
+        return f.read()
+
+
+def load_source_lines(ref, source_store=None):
+    # the lines readlines() gives for the same text, newlines translated
+    return io.StringIO(load_source(ref, source_store), newline=None).readlines()
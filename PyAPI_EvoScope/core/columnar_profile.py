@@ -0,0 +1,246 @@
+import os
+import json
+import shutil
+from collections import deque
+import numpy as np
+
+FORMAT_VERSION = 1
+# node kinds, the same for per-version and aggregated profiles
+KINDS = ('module', 'class', 'class_alias', 'api', 'api_alias')
+_kind_of_class = {'ModuleOrPackageNode': 0, 'ClassNode': 1, 'ClassAliasNode': 2, 'APINode': 3, 'APIAliasNode': 4}
+
+# per node:             parent (-1 for the root), kind, name, full_name
+# per node and version: available (bits), signature, source, no_diff, target (alias -> node, -1 for none)
+# names, signatures and sources are indexes into the string table, -1 for none
+NODE_COLUMNS = ('parent', 'kind', 'name', 'full_name')
+VERSION_COLUMNS = ('available', 'signature', 'source', 'no_diff', 'target')
+
+
+def _kind(node):
+    name = type(node).__name__
+    if name.startswith('Aggeragated'):
+        name = name[len('Aggeragated'):]
+    return _kind_of_class[name]
+
+
+def _bfs(root):
+    # (node, index of the node whose children list holds it), aggregation may leave a
+    # node's parent attribute pointing into the tree of another version
+    nodes = []
+    queue = deque([(root, -1)])
+    while queue:
+        node, parent = queue.popleft()
+        queue.extend((child, len(nodes)) for child in getattr(node, 'children', ()))
+        nodes.append((node, parent))
+    return nodes
+
+
+class _StringTable:
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def __call__(self, s):
+        if s is None:
+            return -1
+        if s not in self.index:
+            self.index[s] = len(self.strings)
+            self.strings.append(s)
+        return self.index[s]
+
+
+def write_columnar_profile(root, path, version=None):
+    """Write a profile or aggregate tree as flat columns, one .npy file each, under path.
+
+    Nodes are numbered in BFS order. version names the version of a per-version
+    profile, an aggregate lists its own.
+    """
+    nodes = _bfs(root)
+    ids = {id(node): i for i, (node, parent) in enumerate(nodes)}
+    aggregated = hasattr(root, 'available_versions')
+    if aggregated:
+        versions = list(root.available_versions)
+        for node, parent in nodes:
+            versions.extend(v for v in node.available_versions if v not in versions)
+    else:
+        versions = [version or '']
+    version_ids = {v: i for i, v in enumerate(versions)}
+    n, n_versions = len(nodes), len(versions)
+    strings = _StringTable()
+
+    columns = {
+        'parent': np.full(n, -1, dtype=np.int32),
+        'kind': np.zeros(n, dtype=np.uint8),
+        'name': np.full(n, -1, dtype=np.int32),
+        'full_name': np.full(n, -1, dtype=np.int32),
+        'available': np.zeros((n, n_versions), dtype=bool),
+        'signature': np.full((n, n_versions), -1, dtype=np.int32),
+        'source': np.full((n, n_versions), -1, dtype=np.int32),
+        'no_diff': np.full((n, n_versions), -1, dtype=np.int32),
+        'target': np.full((n, n_versions), -1, dtype=np.int32),
+    }
+    for i, (node, parent) in enumerate(nodes):
+        columns['parent'][i] = parent
+        columns['kind'][i] = _kind(node)
+        columns['name'][i] = strings(node.name)
+        columns['full_name'][i] = strings(node.full_name)
+        if aggregated:
+            for v in node.available_versions:
+                columns['available'][i, version_ids[v]] = True
+            for v, fingerprint in getattr(node, 'signatures', {}).items():
+                columns['signature'][i, version_ids[v]] = strings(fingerprint)
+            for v, value in getattr(node, 'source', {}).items():
+                columns['source'][i, version_ids[v]] = strings(value['source'] or None)
+                columns['no_diff'][i, version_ids[v]] = value['no_diff']
+            for attr in ('real_API', 'real_class'):
+                for v, dst in getattr(node, attr, {}).items():
+                    columns['target'][i, version_ids[v]] = ids.get(id(dst), -1)
+        else:
+            columns['available'][i, 0] = True
+            columns['signature'][i, 0] = strings(getattr(node, 'signature', None))
+            if columns['kind'][i] in (1, 3):
+                columns['source'][i, 0] = strings(getattr(node, 'source', None) or None)
+            dst = getattr(node, 'real_API', None) or getattr(node, 'real_class', None)
+            if dst is not None:
+                columns['target'][i, 0] = ids.get(id(dst), -1)
+    columns['available'] = np.packbits(columns['available'], axis=1)
+
+    encoded = [s.encode('utf-8') for s in strings.strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    columns['strings_data'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    columns['strings_offsets'] = offsets
+
+    # written aside and renamed, readers never see half a profile
+    tmp_path = "{}.{}.tmp".format(path.rstrip(os.sep), os.getpid())
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, column in columns.items():
+        np.save(os.path.join(tmp_path, name + '.npy'), column)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({'format': FORMAT_VERSION, 'aggregated': aggregated, 'versions': versions,
+                   'n_nodes': n, 'kinds': KINDS}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return n
+
+
+def is_columnar_profile(path):
+    return os.path.isfile(os.path.join(path, 'meta.json'))
+
+
+class ColumnarNode:
+    """A row of a columnar profile seen as a tree node, with the name, full_name,
+    children and available_versions that tree-walking code reads."""
+    __slots__ = ('profile', 'id')
+
+    def __init__(self, profile, node_id):
+        self.profile = profile
+        self.id = node_id
+
+    @property
+    def name(self):
+        return self.profile.name(self.id)
+
+    @property
+    def full_name(self):
+        return self.profile.full_name(self.id)
+
+    @property
+    def kind(self):
+        return self.profile.kind(self.id)
+
+    @property
+    def available_versions(self):
+        return self.profile.available_versions(self.id)
+
+    @property
+    def children(self):
+        return [ColumnarNode(self.profile, child) for child in self.profile.children(self.id)]
+
+
+class ColumnarProfile:
+    """A columnar profile, every column memory-mapped, nothing is read until used.
+
+    No node classes are needed to read it: nodes are row numbers, and the
+    accessors return names, kinds, versions and references as plain values.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['format'] != FORMAT_VERSION:
+            raise ValueError("{} has format {}, expected {}".format(path, meta['format'], FORMAT_VERSION))
+        self.aggregated = meta['aggregated']
+        self.versions = meta['versions']
+        self._version_ids = {v: i for i, v in enumerate(self.versions)}
+        self.columns = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+                        for name in NODE_COLUMNS + VERSION_COLUMNS + ('strings_data', 'strings_offsets')}
+        self._children = None
+        self._by_full_name = None
+
+    def __len__(self):
+        return len(self.columns['parent'])
+
+    def root(self):
+        return ColumnarNode(self, 0)
+
+    def string(self, index):
+        if index < 0:
+            return None
+        offsets = self.columns['strings_offsets']
+        return bytes(self.columns['strings_data'][offsets[index]:offsets[index + 1]]).decode('utf-8')
+
+    def parent(self, node_id):
+        parent = int(self.columns['parent'][node_id])
+        return None if parent < 0 else parent
+
+    def kind(self, node_id):
+        return KINDS[self.columns['kind'][node_id]]
+
+    def name(self, node_id):
+        return self.string(self.columns['name'][node_id])
+
+    def full_name(self, node_id):
+        return self.string(self.columns['full_name'][node_id])
+
+    def available_versions(self, node_id):
+        bits = np.unpackbits(self.columns['available'][node_id], count=len(self.versions))
+        return [v for v, bit in zip(self.versions, bits) if bit]
+
+    def _at(self, column, node_id, version):
+        return int(self.columns[column][node_id, self._version_ids[version]])
+
+    def signature(self, node_id, version):
+        return self.string(self._at('signature', node_id, version))
+
+    def source(self, node_id, version):
+        """The source reference (a blob id) of the node in version, None if it has none."""
+        return self.string(self._at('source', node_id, version))
+
+    def no_diff(self, node_id, version):
+        return self._at('no_diff', node_id, version)
+
+    def target(self, node_id, version):
+        """The node an alias refers to in version, None if it is not an alias there."""
+        dst = self._at('target', node_id, version)
+        return None if dst < 0 else dst
+
+    def children(self, node_id):
+        if self._children is None:
+            # the children of node i are order[starts[i]:starts[i + 1]], in BFS order
+            parent = np.asarray(self.columns['parent'])
+            order = np.argsort(parent, kind='stable')
+            starts = np.searchsorted(parent[order], np.arange(len(parent) + 1))
+            self._children = (order, starts)
+        order, starts = self._children
+        return [int(i) for i in order[starts[node_id]:starts[node_id + 1]]]
+
+    def find(self, full_name):
+        """The ids of the nodes with this full name (a class and its constructor share one)."""
+        if self._by_full_name is None:
+            by_index = {}
+            for node_id, index in enumerate(np.asarray(self.columns['full_name']).tolist()):
+                by_index.setdefault(index, []).append(node_id)
+            self._by_full_name = {self.string(index): ids for index, ids in by_index.items()}
+        return self._by_full_name.get(full_name, [])
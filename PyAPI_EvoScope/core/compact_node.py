@@ -0,0 +1,137 @@
+import sys
+import pickle
+from collections import OrderedDict, deque
+
+# class name -> class of every profile node, to resolve pickles whatever module they were written from
+_node_classes = {}
+
+
+class CompactNode:
+    """Base of the profile and aggregate tree nodes.
+
+    Subclasses list their attributes in __slots__, so a node carries no __dict__.
+    Children are looked up by name in constant time, and names are interned so
+    that every node and version shares one copy of each name. An attribute that
+    was never set stays missing (hasattr is False), like it was on the old
+    dict-based nodes.
+
+    The pickled state is the {attribute: value} dict of the set attributes, the
+    same shape old pickles have, so those load into the slotted classes as is.
+    """
+    # the name -> child map, derived from children and never pickled
+    __slots__ = ('_child_index', '_n_indexed')
+    _interned = ('name', 'full_name')
+    _slot_names = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        slots = []
+        for klass in reversed(cls.__mro__):
+            for slot in klass.__dict__.get('__slots__', ()):
+                if slot not in slots and not slot.startswith('_'):
+                    slots.append(slot)
+        cls._slot_names = tuple(slots)
+        _node_classes[cls.__name__] = cls
+
+    def _index_keys(self, child):
+        return (child.name,)
+
+    def child(self, name):
+        """The first child called name, None if there is none.
+
+        Children are only ever appended to, so the map is extended with the
+        children added since the last lookup, and built on first use after a load.
+        """
+        try:
+            index = self._child_index
+        except AttributeError:
+            index = self._child_index = {}
+            self._n_indexed = 0
+        children = self.children
+        if self._n_indexed < len(children):
+            for child in children[self._n_indexed:]:
+                for key in self._index_keys(child):
+                    index.setdefault(key, child)
+            self._n_indexed = len(children)
+        return index.get(name)
+
+    def __getstate__(self):
+        state = {}
+        for slot in self._slot_names:
+            try:
+                state[slot] = getattr(self, slot)
+            except AttributeError:
+                pass
+        return state
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            # (dict state, slots state) of the default protocol
+            merged = {}
+            for part in state:
+                if part:
+                    merged.update(part)
+            state = merged
+        for key, value in state.items():
+            if key in self._interned and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, key, value)
+
+
+# the kind telling apart nodes sharing a full name, a class and its constructor; modules have none
+_index_kinds = {'ClassNode': 'class', 'ClassAliasNode': 'class_alias', 'APINode': 'api', 'APIAliasNode': 'api_alias'}
+
+
+def full_name_key(node):
+    # the key of a node in a full-name index: (full name, kind), or the full name of a module
+    name = type(node).__name__
+    if name.startswith('Aggeragated'):
+        name = name[len('Aggeragated'):]
+    kind = _index_kinds.get(name)
+    return node.full_name if kind is None else (node.full_name, kind)
+
+
+def index_nodes(index, nodes):
+    for node in nodes:
+        index[full_name_key(node)] = node
+
+
+def tree_index(root):
+    """The full-name index of a tree, kept on its root and updated as nodes are added.
+
+    Profiling builds it with the full names, a tree loaded from a pickle builds it
+    on first use; it is never pickled.
+    """
+    try:
+        return root._full_name_index
+    except AttributeError:
+        pass
+    index = OrderedDict()
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+        index[full_name_key(node)] = node
+        queue.extend(getattr(node, 'children', ()))
+    root._full_name_index = index
+    return index
+
+
+def intern_name(name):
+    return sys.intern(name) if isinstance(name, str) else name
+
+
+class ProfileUnpickler(pickle.Unpickler):
+    """Unpickler for profile and aggregate pickles, old or new.
+
+    Pickles written by a script run as __main__ refer to __main__.ClassNode and
+    the like, those names are mapped back to the node classes.
+    """
+    def find_class(self, module, name):
+        if name in _node_classes and (module == '__main__' or module == _node_classes[name].__module__):
+            return _node_classes[name]
+        return super().find_class(module, name)
+
+
+def load_profile(f):
+    """Load a profile or aggregate tree from an open binary file."""
+    return ProfileUnpickler(f).load()
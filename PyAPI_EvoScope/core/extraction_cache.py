@@ -0,0 +1,73 @@
+import os
+import pickle
+import sqlite3
+import threading
+from .module_extractor import EXTRACTOR_VERSION
+
+
+class ExtractionCache:
+    """Persistent cache of per-file extraction results (cargo, import table, spans).
+
+    Rows are keyed by the sha256 of the file's bytes and the extractor version, so a
+    module seen before, in another version, another library or an earlier run, is
+    not parsed again, and results of an older extractor are never served.
+    One SQLite connection per thread; WAL lets several processes share the file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # connections stay in their process, a pickled cache reopens the same file
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS facts ('
+                         'sha256 TEXT NOT NULL, version INTEGER NOT NULL, data BLOB NOT NULL, '
+                         'PRIMARY KEY (sha256, version))')
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, digests):
+        """{digest: (cargo, imports, spans)} of the digests in the cache."""
+        found = {}
+        conn = self._connection()
+        unique = list(set(digests))
+        for i in range(0, len(unique), 500):
+            chunk = unique[i:i + 500]
+            rows = conn.execute('SELECT sha256, data FROM facts WHERE version = ? AND sha256 IN ({})'.format(
+                ','.join('?' * len(chunk))), [EXTRACTOR_VERSION] + chunk)
+            for digest, data in rows:
+                found[digest] = pickle.loads(data)
+        with self._lock:
+            self.hits += sum(1 for d in digests if d in found)
+            self.misses += sum(1 for d in digests if d not in found)
+        return found
+
+    def put_many(self, items):
+        """items: [(digest, (cargo, imports, spans))], written in one transaction."""
+        if not items:
+            return
+        conn = self._connection()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO facts (sha256, version, data) VALUES (?, ?, ?)',
+                             [(digest, EXTRACTOR_VERSION, pickle.dumps(facts, pickle.HIGHEST_PROTOCOL))
+                              for digest, facts in items])
+
+    def report(self):
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return "{} hits, {} misses ({:.1f}% hit rate)".format(self.hits, self.misses, rate)
@@ -0,0 +1,267 @@
+import io
+import os
+import re
+import json
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urldefrag, urlparse, unquote
+from urllib.request import pathname2url, url2pathname
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from .artifact_select import parse_wheel_filename, is_sdist
+from .artifact_cache import file_sha256
+from .metadata_cache import MetadataCache, release_dates_from
+
+_range_re = re.compile(r'bytes=(\d*)-(\d*)')
+
+
+def normalize_name(name):
+    # PEP 503
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def path_to_url(path):
+    return urljoin('file:', pathname2url(os.path.abspath(path)))
+
+
+def url_to_path(url):
+    return url2pathname(unquote(urlparse(url).path))
+
+
+class LocalFileAdapter(BaseAdapter):
+    """Serve file:// URLs through a requests.Session, including Range requests,
+    so local artifacts go through the same download and caching code as remote ones."""
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        path = url_to_path(request.url)
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        response.headers = CaseInsensitiveDict()
+        if not os.path.isfile(path):
+            response.status_code = 404
+            response.raw = io.BytesIO(b'')
+            return response
+        size = os.path.getsize(path)
+        response.headers['Accept-Ranges'] = 'bytes'
+        m = _range_re.match(request.headers.get('Range', ''))
+        if m is None:
+            response.status_code = 200
+            response.headers['Content-Length'] = str(size)
+            response.raw = open(path, 'rb')
+            return response
+        start, end = m.groups()
+        if start == '':
+            start, end = max(size - int(end), 0), size - 1
+        else:
+            start, end = int(start), min(int(end), size - 1) if end else size - 1
+        if start >= size:
+            response.status_code = 416
+            response.headers['Content-Range'] = 'bytes */{}'.format(size)
+            response.raw = io.BytesIO(b'')
+            return response
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        response.status_code = 206
+        response.headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+        response.headers['Content-Length'] = str(len(data))
+        response.raw = io.BytesIO(data)
+        return response
+
+    def close(self):
+        pass
+
+
+def version_from_filename(filename):
+    tags = parse_wheel_filename(filename)
+    if tags is not None:
+        return tags.version
+    if is_sdist(filename):
+        stem = re.sub(r'\.(tar\.gz|tgz|tar\.bz2|zip)$', '', filename)
+        if '-' in stem:
+            return stem.rsplit('-', 1)[1]
+    return None
+
+
+class PyPIJSONIndex:
+    """The PyPI JSON API, or a mirror that serves the same documents.
+
+    With a MetadataCache, documents are revalidated with If-None-Match so an
+    unchanged package costs a 304 instead of the full JSON.
+    """
+    def __init__(self, session, base_url='https://pypi.org/pypi/', cache=None):
+        self.session = session
+        self.base_url = base_url.rstrip('/') + '/'
+        self.cache = cache
+
+    def releases(self, package_name):
+        """Return {version: [file_info, ...]} with absolute URLs."""
+        url = '{}{}/json'.format(self.base_url, package_name)
+        entry = self.cache.load(package_name) if self.cache is not None else None
+        headers = self.cache.conditional_headers(entry) if self.cache is not None else {}
+        response = self.session.get(url, headers=headers, timeout=30)
+        if response.status_code == 304:
+            if entry is not None:
+                self.cache.count(hit=True)
+                return entry['releases']
+            # nothing cached to fall back on (e.g. a proxy answered a stale validator): ask unconditionally
+            response = self.session.get(url, headers={'Cache-Control': 'no-cache'}, timeout=30)
+        response.raise_for_status()
+        releases = self.releases_from_document(response.json(), response.url)
+        if self.cache is not None:
+            self.cache.count(hit=False)
+            entry = self.cache.store(package_name, response.headers.get('ETag'),
+                                     response.headers.get('Last-Modified'), releases)
+            return entry['releases']
+        return releases
+
+    @staticmethod
+    def releases_from_document(data, doc_url):
+        releases = {}
+        for version, files in data.get('releases', {}).items():
+            # some mirrors return relative links
+            releases[version] = [dict(file_info, url=urljoin(doc_url, file_info['url'])) for file_info in files]
+        return releases
+
+    def resolve(self, file_info):
+        return file_info
+
+    def release_dates(self, package_name):
+        return release_dates_from(self.releases(package_name))
+
+
+class LocalMirrorIndex:
+    """A directory mirror laid out like pypi_libs: <root>/<pkg>/<version>/<files>."""
+    def __init__(self, root):
+        self.root = root
+
+    def _package_dir(self, package_name):
+        for name in (package_name, normalize_name(package_name)):
+            if os.path.isdir(os.path.join(self.root, name)):
+                return os.path.join(self.root, name)
+        raise FileNotFoundError('{} not found in mirror {}'.format(package_name, self.root))
+
+    def releases(self, package_name):
+        package_dir = self._package_dir(package_name)
+        releases = {}
+        for version in os.listdir(package_dir):
+            version_dir = os.path.join(package_dir, version)
+            if not os.path.isdir(version_dir):
+                continue
+            files = []
+            for fn in sorted(os.listdir(version_dir)):
+                full_path = os.path.join(version_dir, fn)
+                if os.path.isfile(full_path) and not fn.endswith('.part'):
+                    files.append({'filename': fn, 'url': path_to_url(full_path),
+                                  'size': os.path.getsize(full_path), 'digests': {}})
+            releases[version] = files
+        return releases
+
+    def resolve(self, file_info):
+        # hashing every file on listing is wasteful, only hash the selected one
+        if not file_info.get('digests', {}).get('sha256'):
+            digest = file_sha256(url_to_path(file_info['url']))
+            file_info = dict(file_info, digests={'sha256': digest})
+        return file_info
+
+    def release_dates(self, package_name):
+        # no upload times in a plain directory, use the file modification times
+        dates = {}
+        for version, files in self.releases(package_name).items():
+            times = [os.path.getmtime(url_to_path(f['url'])) for f in files]
+            if times:
+                dates[version] = datetime.fromtimestamp(min(times), timezone.utc).isoformat()
+        return dates
+
+
+class _AnchorParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.anchors = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            attrs = dict(attrs)
+            if 'href' in attrs:
+                self.anchors.append(attrs)
+
+
+class SimpleIndex:
+    """A PEP 503 (html) or PEP 691 (json) simple index on disk: <root>/<normalized name>/index.{json,html}."""
+    def __init__(self, root):
+        self.root = root
+
+    def _files(self, package_name):
+        package_dir = os.path.join(self.root, normalize_name(package_name))
+        json_page = os.path.join(package_dir, 'index.json')
+        html_page = os.path.join(package_dir, 'index.html')
+        if os.path.exists(json_page):
+            page_url = path_to_url(json_page)
+            with open(json_page, encoding='utf-8') as f:
+                data = json.load(f)
+            for entry in data.get('files', []):
+                yield {'filename': entry['filename'], 'url': urljoin(page_url, entry['url']),
+                       'size': entry.get('size'), 'digests': dict(entry.get('hashes', {})),
+                       'upload_time_iso_8601': entry.get('upload-time')}
+        elif os.path.exists(html_page):
+            page_url = path_to_url(html_page)
+            parser = _AnchorParser()
+            with open(html_page, encoding='utf-8') as f:
+                parser.feed(f.read())
+            for attrs in parser.anchors:
+                url, fragment = urldefrag(urljoin(page_url, attrs['href']))
+                digests = {}
+                if '=' in fragment:
+                    algo, value = fragment.split('=', 1)
+                    digests[algo] = value
+                yield {'filename': unquote(url.rsplit('/', 1)[-1]), 'url': url, 'size': None, 'digests': digests}
+        else:
+            raise FileNotFoundError('{} not found in simple index {}'.format(package_name, self.root))
+
+    def releases(self, package_name):
+        releases = {}
+        for file_info in self._files(package_name):
+            version = version_from_filename(file_info['filename'])
+            if version is None:
+                continue
+            if file_info['size'] is None and file_info['url'].startswith('file:'):
+                path = url_to_path(file_info['url'])
+                if os.path.exists(path):
+                    file_info['size'] = os.path.getsize(path)
+            releases.setdefault(version, []).append(file_info)
+        return releases
+
+    def resolve(self, file_info):
+        return file_info
+
+    def release_dates(self, package_name):
+        return release_dates_from(self.releases(package_name))
+
+
+def is_simple_index(root):
+    # a simple index if any project directory has an index page, whatever order listdir gives
+    for name in os.listdir(root):
+        package_dir = os.path.join(root, name)
+        if os.path.isdir(package_dir) and (os.path.exists(os.path.join(package_dir, 'index.html')) or
+                                           os.path.exists(os.path.join(package_dir, 'index.json'))):
+            return True
+    return False
+
+
+def open_index(spec, session, metadata_cache_dir=None):
+    """Build an index backend from a command line spec.
+
+    None or 'pypi': the online PyPI JSON API; an http(s) URL: a JSON API mirror;
+    a local path or file:// URL: a simple index if it has index pages, a directory mirror otherwise.
+    """
+    session.mount('file://', LocalFileAdapter())
+    cache = MetadataCache(metadata_cache_dir) if metadata_cache_dir else None
+    if spec is None or spec == 'pypi':
+        return PyPIJSONIndex(session, cache=cache)
+    if spec.startswith(('http://', 'https://')):
+        return PyPIJSONIndex(session, base_url=spec, cache=cache)
+    root = url_to_path(spec) if spec.startswith('file:') else spec
+    if is_simple_index(root):
+        return SimpleIndex(root)
+    return LocalMirrorIndex(root)
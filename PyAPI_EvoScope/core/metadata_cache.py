@@ -0,0 +1,80 @@
+import os
+import re
+import json
+import threading
+
+# the only fields of a PyPI file entry the pipeline uses
+FILE_FIELDS = ('filename', 'url', 'size', 'upload_time_iso_8601', 'requires_python', 'yanked', 'packagetype')
+
+
+def compact_file_info(file_info):
+    entry = {k: file_info[k] for k in FILE_FIELDS if k in file_info}
+    sha256 = file_info.get('digests', {}).get('sha256')
+    entry['digests'] = {'sha256': sha256} if sha256 else {}
+    if 'upload_time_iso_8601' not in entry and file_info.get('upload_time'):
+        entry['upload_time_iso_8601'] = file_info['upload_time']
+    return entry
+
+
+def release_dates_from(releases):
+    """The release date of a version is the upload time of its first file."""
+    dates = {}
+    for version, files in releases.items():
+        times = [f['upload_time_iso_8601'] for f in files if f.get('upload_time_iso_8601')]
+        if times:
+            dates[version] = min(times)
+    return dates
+
+
+class MetadataCache:
+    """On-disk cache of per-package release lists with the validators needed for conditional requests."""
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, package_name):
+        return os.path.join(self.root, re.sub(r'[-_.]+', '-', package_name).lower() + '.json')
+
+    def load(self, package_name):
+        path = self.path_for(package_name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError:
+            return None  # a broken entry is just a miss
+
+    def store(self, package_name, etag, last_modified, releases):
+        entry = {'etag': etag, 'last_modified': last_modified,
+                 'releases': {v: [compact_file_info(f) for f in files] for v, files in releases.items()}}
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path_for(package_name)
+        tmp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        return entry
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def release_dates(self, package_name):
+        """Release dates from the cache only, no network needed."""
+        entry = self.load(package_name)
+        return release_dates_from(entry['releases']) if entry else {}
@@ -0,0 +1,120 @@
+import re
+import ast
+from .signature import get_keywords
+
+# bump whenever the output of ModuleExtractor changes, cached results of older versions are ignored
+EXTRACTOR_VERSION = 3
+
+# the line breaks ast counts lines by, same as ast.get_source_segment
+_line_break_re = re.compile(r'\r\n|\r|\n')
+
+
+class ModuleExtractor:
+    """Collect everything profiling needs from a module in a single walk of its AST.
+
+    The results are the ones the separate walks used to give:
+    cargo          as SourceVisitor.result
+    functions      name -> first FunctionDef not inside a function (methods included)
+    classes        name -> last ClassDef not inside a class
+    methods        ClassDef -> name -> first FunctionDef inside it but not inside a
+                   nested function
+    import_froms   the ImportFrom nodes in ast.walk order
+    """
+    def __init__(self):
+        self.cargo = {}
+        self.functions = {}
+        self.classes = {}
+        self.methods = {}
+        self._import_froms = []
+        self._n_visited = 0
+
+    def visit(self, tree):
+        self._visit_children(tree, 0, False, False, (), None)
+
+    @property
+    def import_froms(self):
+        # ast.walk is breadth first: by depth, then in pre-order within a level
+        return [node for depth, i, node in sorted(self._import_froms, key=lambda x: (x[0], x[1]))]
+
+    def _visit_children(self, node, depth, in_function, in_class, class_stack, cargo_class):
+        for child in ast.iter_child_nodes(node):
+            self._visit(child, depth + 1, in_function, in_class, class_stack, cargo_class)
+
+    def _visit(self, node, depth, in_function, in_class, class_stack, cargo_class):
+        self._n_visited += 1
+        if isinstance(node, ast.ImportFrom):
+            self._import_froms.append((depth, self._n_visited, node))
+        if isinstance(node, ast.FunctionDef):
+            if not in_function:
+                self.functions.setdefault(node.name, node)
+                if cargo_class is not None:
+                    cargo_class[node.name] = get_keywords(node)
+                elif not in_class:
+                    self.cargo[node.name] = get_keywords(node)
+            for class_node in class_stack:
+                self.methods[class_node].setdefault(node.name, node)
+            # nothing below a function is a module function, a cargo entry or a method
+            self._visit_children(node, depth, True, in_class, (), None)
+        elif isinstance(node, ast.ClassDef):
+            if not in_class:
+                self.classes[node.name] = node
+                if not in_function:
+                    cargo_class = {}
+                    self.cargo[node.name] = cargo_class
+            self.methods[node] = {}
+            self._visit_children(node, depth, in_function, True, class_stack + (node,), cargo_class)
+        else:
+            self._visit_children(node, depth, in_function, in_class, class_stack, cargo_class)
+
+    def spans(self):
+        """(class name or None, function name or None) -> (lineno, col_offset, end_lineno, end_col_offset)
+        of every function, class and method in cargo."""
+        def span(ast_node):
+            return ast_node.lineno, ast_node.col_offset, ast_node.end_lineno, ast_node.end_col_offset
+        spans = {}
+        for k, v in self.cargo.items():
+            if isinstance(v, tuple) and k in self.functions:
+                spans[(None, k)] = span(self.functions[k])
+            elif isinstance(v, dict) and k in self.classes:
+                class_ast_node = self.classes[k]
+                spans[(k, None)] = span(class_ast_node)
+                for f_name in v:
+                    if f_name in self.methods[class_ast_node]:
+                        spans[(k, f_name)] = span(self.methods[class_ast_node][f_name])
+        return spans
+
+
+def line_starts(source):
+    starts = [0]
+    starts.extend(m.end() for m in _line_break_re.finditer(source))
+    return starts
+
+
+def _char_offset(line, col_offset):
+    # ast column offsets count utf-8 bytes
+    if line.isascii():
+        return col_offset
+    return len(line.encode()[:col_offset].decode())
+
+
+def slice_span(source, starts, span):
+    """The same text as ast.get_source_segment, without splitting the source again."""
+    lineno, col_offset, end_lineno, end_col_offset = span
+    first_line = source[starts[lineno - 1]:starts[lineno] if lineno < len(starts) else len(source)]
+    last_line = source[starts[end_lineno - 1]:starts[end_lineno] if end_lineno < len(starts) else len(source)]
+    start = starts[lineno - 1] + _char_offset(first_line, col_offset)
+    end = starts[end_lineno - 1] + _char_offset(last_line, end_col_offset)
+    return source[start:end]
+
+
+def import_table(import_froms):
+    # module -> names imported from it, in ast.walk order,
+    # relative modules keep their leading dots ('.', '..x', '.x.y')
+    module_item_dict = {}
+    for node in import_froms:
+        module = '.' * node.level + (node.module or '')
+        if module not in module_item_dict:
+            module_item_dict[module] = []
+        for nn in node.names:
+            module_item_dict[module].append(nn.name)
+    return module_item_dict
@@ -45,12 +45,14 @@ def get_all_folder_names(root_dir, flag='.py'):
         folder_names.extend(dirs)
     return folder_names
 
-def get_module_names(filename, std_modules, local_folders):
+def get_module_names(filename, std_modules, local_folders, search_path=None):
+    # local modules are looked up next to filename unless search_path says otherwise
     try:
         module_names = []
         source = get_source(filename)
         tree = ast.parse(source, mode='exec')
-        search_path = ['.']
+        if search_path is None:
+            search_path = [os.path.dirname(filename) or '.']
         for node in ast.walk(tree):
             if isinstance(node, ast.Import):
                 items = [nn.__dict__ for nn in node.names]
@@ -82,14 +84,10 @@ def collect_module_single(repo_dir):
     all_fns = all_fns_py+all_fns_nb 
     module_names = []
     for fn in all_fns:
-        pwd = os.getcwd() # save current path
-        working_dir = os.path.dirname(fn)
-        os.chdir(working_dir)  # go to that  folder
         #module_name_tmp = get_module_names(fn, std_modules, local_folders)
         module_name_tmp = get_module_names(fn, std_modules, [])
         if module_name_tmp is not None:
             module_names.extend(module_name_tmp)
-        os.chdir(pwd)
     module_names = list(set(module_names))
     return module_names 
 
@@ -0,0 +1,279 @@
+import os
+import io
+import json
+import pickle
+import shutil
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from .compact_node import CompactNode, ProfileUnpickler
+from .blob_store import is_blob_id
+from .source_archive import SourceArchive, write_source_archive
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+# the root node and what is not in a subpackage, e.g. the names re-exported by __init__
+ROOT_SHARD = '__root__'
+# the attributes holding the target of an alias, {version: target} in an aggregate
+_REFERENCE_ATTRS = ('real_API', 'real_class')
+
+
+def _kind(node):
+    name = type(node).__name__
+    if name.startswith('Aggeragated'):
+        name = name[len('Aggeragated'):]
+    return name
+
+
+def _is_module(node):
+    return _kind(node) == 'ModuleOrPackageNode'
+
+
+def _shard_nodes(shard_root, is_foreign):
+    # the nodes of a shard in BFS order, reader and writer number them the same way
+    nodes = []
+    queue = deque([shard_root])
+    while queue:
+        node = queue.popleft()
+        nodes.append(node)
+        queue.extend(child for child in getattr(node, 'children', ()) if not is_foreign(child))
+    return nodes
+
+
+def _source_refs(node):
+    source = getattr(node, 'source', None)
+    if isinstance(source, dict):
+        return [value['source'] for value in source.values() if is_blob_id(value['source'])]
+    return [source] if is_blob_id(source) else []
+
+
+def _references(node):
+    # (attribute, target, [versions]) of the alias references of a node
+    for attr in _REFERENCE_ATTRS:
+        value = getattr(node, attr, None)
+        if isinstance(value, dict):
+            targets = OrderedDict()
+            for version, target in value.items():
+                targets.setdefault(id(target), (target, []))[1].append(version)
+            for target, versions in targets.values():
+                yield attr, target, versions
+        elif isinstance(value, CompactNode):
+            yield attr, value, []
+
+
+class _ShardPickler(pickle.Pickler):
+    # nodes of other shards are pickled as (shard, index, full name, kind)
+    def __init__(self, f, shard, location, stand_ins):
+        super().__init__(f, pickle.HIGHEST_PROTOCOL)
+        self.shard = shard
+        self.location = location
+        self.stand_ins = stand_ins
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, CompactNode):
+            return None
+        if id(obj) in self.location:
+            shard, index = self.location[id(obj)]
+            if shard == self.shard:
+                return None
+        else:
+            # a stale parent left by the aggregation, it stands for the tree node of that name,
+            # possibly in this shard, such references are resolved when the shard is loaded
+            obj = self.stand_ins.get((_kind(obj), obj.full_name))
+            if obj is None:
+                return ('none',)
+            shard, index = self.location[id(obj)]
+        return ('node', shard, index, obj.full_name, _kind(obj))
+
+
+def write_sharded_profile(root, path, source_store=None, workers=1):
+    """Write an aggregate tree as one pickle per top-level subpackage plus a root shard,
+    with a manifest, under the directory path.
+
+    References between shards are cut at pickling and listed in the manifest, so a
+    shard loads on its own. With a source_store, each shard also gets the archive of
+    its sources. Shards are pickled and packed by `workers` threads.
+    """
+    shards = OrderedDict((child.name, child) for child in root.children if _is_module(child))
+    shard_roots = set(id(node) for node in shards.values())
+    shards[ROOT_SHARD] = root
+    shards.move_to_end(ROOT_SHARD, last=False)
+
+    location = {}
+    shard_nodes = {}
+    for name, shard_root in shards.items():
+        shard_nodes[name] = _shard_nodes(shard_root, lambda node: id(node) in shard_roots)
+        for index, node in enumerate(shard_nodes[name]):
+            location[id(node)] = (name, index)
+    stand_ins = {}
+    for nodes in shard_nodes.values():
+        for node in nodes:
+            stand_ins.setdefault((_kind(node), node.full_name), node)
+
+    references = []
+    for name, nodes in shard_nodes.items():
+        for node in nodes:
+            for attr, target, versions in _references(node):
+                target_shard = location.get(id(target), (None,))[0]
+                if target_shard is not None and target_shard != name:
+                    references.append({'shard': name, 'full_name': node.full_name, 'kind': _kind(node),
+                                       'versions': versions, 'target_shard': target_shard,
+                                       'target': target.full_name, 'target_kind': _kind(target)})
+
+    # written aside and renamed, readers never see half the shards
+    tmp_path = "{}.{}.tmp".format(path.rstrip(os.sep), os.getpid())
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    def write_shard(name):
+        buffer = io.BytesIO()
+        _ShardPickler(buffer, name, location, stand_ins).dump(shards[name])
+        with open(os.path.join(tmp_path, name + '.pickle'), 'wb') as f:
+            f.write(buffer.getvalue())
+        info = {'file': name + '.pickle', 'full_name': shards[name].full_name, 'n_nodes': len(shard_nodes[name])}
+        if source_store is not None:
+            blob_ids = [ref for node in shard_nodes[name] for ref in _source_refs(node)]
+            write_source_archive(os.path.join(tmp_path, name + '.srcpack'), blob_ids, source_store)
+            info['sources'] = name + '.srcpack'
+        return name, info
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        infos = OrderedDict(executor.map(write_shard, shards))
+    with open(os.path.join(tmp_path, MANIFEST), 'w') as f:
+        json.dump({'format': FORMAT_VERSION, 'package': root.name,
+                   'versions': list(getattr(root, 'available_versions', [])),
+                   'shards': infos, 'references': references}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return len(shards)
+
+
+class ShardReference:
+    """A node of a shard not loaded, its full name and kind are known without loading it."""
+    __slots__ = ('shard', 'index', 'full_name', 'kind')
+
+    def __init__(self, shard, index, full_name, kind):
+        self.shard = shard
+        self.index = index
+        self.full_name = full_name
+        self.kind = kind
+
+    def __repr__(self):
+        return "ShardReference({!r}, {!r})".format(self.shard, self.full_name)
+
+
+class ShardedProfile:
+    """A sharded aggregate, shards are loaded when first touched.
+
+    Nodes of other shards appear as ShardReference until resolve() or tree()
+    loads them. unpickler is the class the shards are loaded with.
+    """
+    def __init__(self, path, unpickler=ProfileUnpickler):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest['format'] != FORMAT_VERSION:
+            raise ValueError("{} has format {}, expected {}".format(path, self.manifest['format'], FORMAT_VERSION))
+        self.package = self.manifest['package']
+        self.versions = self.manifest['versions']
+        self._unpickler = unpickler
+        self._shards = {}
+        self._nodes = {}
+        self._refs = {}
+
+    @property
+    def shard_names(self):
+        return list(self.manifest['shards'])
+
+    def loaded_shards(self):
+        return [name for name in self.shard_names if name in self._shards]
+
+    def shard_of(self, full_name):
+        """The shard of a subpackage holding full_name, the root shard for the rest."""
+        parts = full_name.split('.')
+        if len(parts) > 1 and parts[0] == self.package and parts[1] in self.manifest['shards']:
+            return parts[1]
+        return ROOT_SHARD
+
+    def _reference(self, pid):
+        if pid[0] == 'none':
+            return None
+        _, shard, index, full_name, kind = pid
+        key = (shard, index)
+        if key not in self._refs:
+            self._refs[key] = ShardReference(shard, index, full_name, kind)
+        return self._refs[key]
+
+    def shard(self, name):
+        """The root node of a shard, loaded on first use."""
+        if name not in self._shards:
+            profile = self
+
+            class ShardUnpickler(self._unpickler):
+                def persistent_load(self, pid):
+                    return profile._reference(pid)
+
+            with open(os.path.join(self.path, self.manifest['shards'][name]['file']), 'rb') as f:
+                self._shards[name] = ShardUnpickler(f).load()
+        return self._shards[name]
+
+    def nodes(self, name):
+        if name not in self._nodes:
+            self._nodes[name] = _shard_nodes(self.shard(name), lambda node: isinstance(node, ShardReference))
+            self._resolve_references(self._nodes[name], name)
+        return self._nodes[name]
+
+    def _resolve_references(self, nodes, shard=None):
+        # replace the references in the attributes of nodes, those to shard only if given
+        def resolve(item):
+            if isinstance(item, ShardReference) and (shard is None or item.shard == shard):
+                return self.nodes(item.shard)[item.index]
+            return item
+
+        for node in nodes:
+            for attr in getattr(type(node), '_slot_names', None) or list(vars(node)):
+                value = getattr(node, attr, None)
+                if isinstance(value, ShardReference):
+                    setattr(node, attr, resolve(value))
+                elif isinstance(value, list):
+                    value[:] = [resolve(item) for item in value]
+                elif isinstance(value, dict):
+                    for key, item in value.items():
+                        if isinstance(item, ShardReference):
+                            value[key] = resolve(item)
+                        elif isinstance(item, set):
+                            value[key] = set(resolve(x) for x in item)
+
+    def resolve(self, node):
+        """The node a ShardReference stands for, loading its shard; other nodes as they are."""
+        if isinstance(node, ShardReference):
+            return self.nodes(node.shard)[node.index]
+        return node
+
+    def find(self, full_name):
+        """The nodes called full_name, loading its shard and the root shard only."""
+        names = [self.shard_of(full_name)]
+        if names[0] != ROOT_SHARD:
+            names.append(ROOT_SHARD)
+        return [node for name in names for node in self.nodes(name) if node.full_name == full_name]
+
+    def references_to(self, full_name):
+        """The manifest entries of the aliases in other shards referring to full_name,
+        the versions they do so in included."""
+        return [ref for ref in self.manifest['references'] if ref['target'] == full_name]
+
+    def source_archive(self, name):
+        """The archive of a shard's sources, None if it was written without one."""
+        sources = self.manifest['shards'][name].get('sources')
+        return SourceArchive(os.path.join(self.path, sources)) if sources else None
+
+    def tree(self):
+        """The whole aggregate tree, every shard loaded and every reference resolved."""
+        for name in self.shard_names:
+            self.nodes(name)
+        for nodes in self._nodes.values():
+            self._resolve_references(nodes)
+        return self.shard(ROOT_SHARD)
+
+
+def is_sharded_profile(path):
+    return os.path.isfile(os.path.join(path, MANIFEST))
@@ -0,0 +1,152 @@
+import os
+import json
+import sqlite3
+import threading
+from collections import deque
+from packaging.version import parse as parse_version
+
+_kind_of_class = {'ModuleOrPackageNode': 'module', 'ClassNode': 'class', 'ClassAliasNode': 'class_alias',
+                  'APINode': 'api', 'APIAliasNode': 'api_alias'}
+
+_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS nodes ('
+    'id INTEGER PRIMARY KEY, lib TEXT NOT NULL, version TEXT NOT NULL, package TEXT NOT NULL, '
+    'kind TEXT NOT NULL, name TEXT NOT NULL, full_name TEXT, parent_id INTEGER)',
+    # alias node -> the API or class it refers to, in the same version
+    'CREATE TABLE IF NOT EXISTS aliases (node_id INTEGER PRIMARY KEY, target_id INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS signatures ('
+    'node_id INTEGER PRIMARY KEY, signature TEXT, kws TEXT, default_values TEXT)',
+    # blob ids of the source store
+    'CREATE TABLE IF NOT EXISTS sources (node_id INTEGER PRIMARY KEY, source TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS nodes_full_name ON nodes (full_name)',
+    'CREATE INDEX IF NOT EXISTS nodes_version ON nodes (lib, version)',
+    'CREATE INDEX IF NOT EXISTS aliases_target ON aliases (target_id)',
+]
+
+
+def _version_key(version):
+    try:
+        return 0, parse_version(version)
+    except Exception:
+        return 1, version
+
+
+class ProfileStore:
+    """Profiles of every version in one SQLite file, an alternative to the pickles.
+
+    Each version is inserted in one transaction that first drops the rows it had,
+    so profiling a version again replaces it. Lookups by full name or version use
+    indexes; WAL lets readers query while a profiler writes. One connection per
+    thread, a pickled store reopens the same file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+            self._local.conn = conn
+        return conn
+
+    def add_version(self, lib_name, version, pf_trees):
+        """Replace the rows of lib_name at version with the given profile trees."""
+        conn = self._connection()
+        with conn:
+            self._delete_version(conn, lib_name, version)
+            for pf_tree in pf_trees:
+                self._insert_tree(conn, lib_name, version, pf_tree)
+
+    def _delete_version(self, conn, lib_name, version):
+        ids = 'SELECT id FROM nodes WHERE lib = ? AND version = ?'
+        for table in ('aliases', 'signatures', 'sources'):
+            conn.execute('DELETE FROM {} WHERE node_id IN ({})'.format(table, ids), (lib_name, version))
+        conn.execute('DELETE FROM nodes WHERE lib = ? AND version = ?', (lib_name, version))
+
+    def _insert_tree(self, conn, lib_name, version, pf_tree):
+        row_ids = {}
+        aliases = []
+        queue = deque([(pf_tree, None)])
+        while queue:
+            node, parent_id = queue.popleft()
+            kind = _kind_of_class[type(node).__name__]
+            cursor = conn.execute(
+                'INSERT INTO nodes (lib, version, package, kind, name, full_name, parent_id) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (lib_name, version, pf_tree.name, kind, node.name, node.full_name, parent_id))
+            node_id = cursor.lastrowid
+            row_ids[id(node)] = node_id
+            if kind in ('api', 'class'):
+                conn.execute('INSERT INTO signatures (node_id, signature, kws, default_values) VALUES (?, ?, ?, ?)',
+                             (node_id, getattr(node, 'signature', None), json.dumps(getattr(node, 'kws', None)),
+                              json.dumps(getattr(node, 'default_values', None))))
+                if getattr(node, 'source', None):
+                    conn.execute('INSERT INTO sources (node_id, source) VALUES (?, ?)', (node_id, node.source))
+            target = getattr(node, 'real_API', None) or getattr(node, 'real_class', None)
+            if target is not None:
+                aliases.append((node_id, target))
+            queue.extend((child, node_id) for child in getattr(node, 'children', ()))
+        # targets are anywhere in the tree, their rows exist once the whole tree is in
+        conn.executemany('INSERT INTO aliases (node_id, target_id) VALUES (?, ?)',
+                         [(node_id, row_ids[id(target)]) for node_id, target in aliases if id(target) in row_ids])
+
+    def libraries(self):
+        return [row[0] for row in self._connection().execute('SELECT DISTINCT lib FROM nodes ORDER BY lib')]
+
+    def versions(self, lib_name):
+        rows = self._connection().execute('SELECT DISTINCT version FROM nodes WHERE lib = ?', (lib_name,))
+        return sorted((row[0] for row in rows), key=_version_key)
+
+    def kind_counts(self, lib_name, version):
+        rows = self._connection().execute(
+            'SELECT kind, COUNT(*) FROM nodes WHERE lib = ? AND version = ? GROUP BY kind', (lib_name, version))
+        return dict(rows.fetchall())
+
+    def lookup(self, full_name):
+        """[(lib, version, kind, signature, source, target full name)] of the nodes with this
+        full name, in version order."""
+        rows = self._connection().execute(
+            'SELECT n.lib, n.version, n.kind, s.signature, src.source, t.full_name FROM nodes n '
+            'LEFT JOIN signatures s ON s.node_id = n.id LEFT JOIN sources src ON src.node_id = n.id '
+            'LEFT JOIN aliases a ON a.node_id = n.id LEFT JOIN nodes t ON t.id = a.target_id '
+            'WHERE n.full_name = ?', (full_name,)).fetchall()
+        return sorted(rows, key=lambda row: (row[0], _version_key(row[1])))
+
+    def available_versions(self, lib_name, full_name):
+        rows = self._connection().execute(
+            'SELECT DISTINCT version FROM nodes WHERE full_name = ? AND lib = ?', (full_name, lib_name))
+        return sorted((row[0] for row in rows), key=_version_key)
+
+    def aliases_of(self, full_name):
+        """[(version, alias full name)] of the aliases referring to full_name."""
+        rows = self._connection().execute(
+            'SELECT DISTINCT t.version, n.full_name FROM nodes t JOIN aliases a ON a.target_id = t.id '
+            'JOIN nodes n ON n.id = a.node_id WHERE t.full_name = ?', (full_name,)).fetchall()
+        return sorted(rows, key=lambda row: (_version_key(row[0]), row[1]))
+
+    def changed_signatures(self, lib_name):
+        """{full name: [(version, signature)]} of the APIs whose signature differs between versions."""
+        rows = self._connection().execute(
+            'SELECT n.full_name, n.version, s.signature FROM nodes n JOIN signatures s ON s.node_id = n.id '
+            'WHERE n.lib = ? AND n.kind = ? AND n.full_name IN ('
+            ' SELECT n2.full_name FROM nodes n2 JOIN signatures s2 ON s2.node_id = n2.id '
+            ' WHERE n2.lib = ? AND n2.kind = ? GROUP BY n2.full_name HAVING COUNT(DISTINCT s2.signature) > 1)',
+            (lib_name, 'api', lib_name, 'api')).fetchall()
+        changed = {}
+        for full_name, version, signature in rows:
+            changed.setdefault(full_name, []).append((version, signature))
+        for history in changed.values():
+            history.sort(key=lambda item: _version_key(item[0]))
+        return changed
@@ -0,0 +1,213 @@
+import io
+import re
+import bisect
+from zipfile import ZipFile, ZIP_DEFLATED
+
+_content_range_re = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+
+class RangeNotSupported(Exception):
+    pass
+
+
+def read_top_levels(zip_obj, l_name):
+    # read *.dist-info/top_level.txt without inspecting the whole wheel
+    for name in zip_obj.namelist():
+        parts = name.split('/')
+        if len(parts) == 2 and parts[0].endswith('.dist-info') and parts[1] == 'top_level.txt':
+            content = zip_obj.read(name).decode('utf-8', errors='ignore')
+            top_levels = [l.strip() for l in content.splitlines() if l.strip()]
+            if top_levels:
+                return top_levels
+    return [l_name]
+
+
+def is_dist_info_member(name):
+    parts = name.split('/')
+    return len(parts) == 2 and parts[0].endswith('.dist-info') and parts[1] in ('top_level.txt', 'RECORD')
+
+
+def is_top_level_member(name, top_levels):
+    first = name.split('/')[0]
+    return first in top_levels or (first.endswith('.py') and first[:-3] in top_levels)
+
+
+class HTTPRangeFile(io.RawIOBase):
+    """A read-only, seekable file over HTTP Range requests.
+
+    Fetched byte ranges are kept, merged into disjoint chunks, so ZipFile's many
+    small reads cost no extra requests. Raises RangeNotSupported when the server
+    stops answering with the bytes asked for.
+    """
+    def __init__(self, url, session, tail_response=None, block_size=65536):
+        self.url = url
+        self.session = session
+        self.block_size = block_size
+        self.pos = 0
+        self.bytes_fetched = 0
+        self.n_requests = 0
+        self._starts = []
+        self._chunks = []
+        if tail_response is None:
+            tail_response = self._get('bytes=-{}'.format(block_size))
+        start, self.size = self._parse_range(tail_response)
+        self._store(start, tail_response.content)
+
+    def _get(self, range_header):
+        self.n_requests += 1
+        return self.session.get(self.url, headers={'Range': range_header}, timeout=60)
+
+    def _parse_range(self, response):
+        m = _content_range_re.match(response.headers.get('Content-Range', ''))
+        if response.status_code != 206 or m is None:
+            raise RangeNotSupported(self.url)
+        return int(m.group(1)), int(m.group(3))
+
+    def _store(self, start, data):
+        # the chunks it overlaps or touches are merged with it, each byte is kept once
+        self.bytes_fetched += len(data)
+        end = start + len(data)
+        i = bisect.bisect_left(self._starts, start)
+        if i > 0 and self._starts[i - 1] + len(self._chunks[i - 1]) >= start:
+            i -= 1
+        j = i
+        while j < len(self._starts) and self._starts[j] <= end:
+            j += 1
+        if i < j:
+            first, last = self._starts[i], self._starts[j - 1]
+            head = self._chunks[i][:max(0, start - first)]
+            tail = self._chunks[j - 1][max(0, end - last):] if last + len(self._chunks[j - 1]) > end else b''
+            data = head + data + tail
+            start = min(first, start)
+        self._starts[i:j] = [start]
+        self._chunks[i:j] = [data]
+
+    def _cached_until(self, start):
+        # the end of the cached bytes from start on, start if it is not cached
+        i = bisect.bisect_right(self._starts, start) - 1
+        if i >= 0:
+            return max(start, self._starts[i] + len(self._chunks[i]))
+        return start
+
+    def _cached(self, start, end):
+        if self._cached_until(start) < end:
+            return None
+        i = bisect.bisect_right(self._starts, start) - 1
+        return self._chunks[i][start - self._starts[i]:end - self._starts[i]]
+
+    def fetch(self, start, end):
+        response = self._get('bytes={}-{}'.format(start, end - 1))
+        response.raise_for_status()
+        got_start, _ = self._parse_range(response)
+        self._store(got_start, response.content)
+
+    def prefetch(self, ranges, max_gap=65536):
+        """Fetch [start, end) ranges, merging neighbours so contiguous members cost one request."""
+        merged = []
+        for start, end in sorted(ranges):
+            if self._cached(start, end) is not None:
+                continue
+            if merged and start - merged[-1][1] <= max_gap:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        for start, end in merged:
+            self.fetch(start, end)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.pos = offset
+        elif whence == io.SEEK_CUR:
+            self.pos += offset
+        elif whence == io.SEEK_END:
+            self.pos = self.size + offset
+        return self.pos
+
+    def readinto(self, b):
+        end = min(self.pos + len(b), self.size)
+        if end <= self.pos:
+            return 0
+        data = self._cached(self.pos, end)
+        while data is None:
+            # only the bytes missing after what is cached, up to the next cached chunk
+            gap = self._cached_until(self.pos)
+            fetch_end = min(max(end, gap + self.block_size), self.size)
+            i = bisect.bisect_right(self._starts, gap)
+            if i < len(self._starts):
+                fetch_end = min(fetch_end, self._starts[i])
+            self.fetch(gap, fetch_end)
+            if self._cached_until(self.pos) <= gap:
+                # a short or misplaced 206 response, asking again would not help
+                raise RangeNotSupported('{}: no bytes from offset {} in the Range response'.format(self.url, gap))
+            data = self._cached(self.pos, end)
+        b[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+
+def open_remote_wheel(url, session, block_size=65536):
+    """Open a remote wheel as a ZipFile, reading only what is asked for.
+
+    Falls back to a full download when the server ignores Range requests.
+    Returns (zip_obj, fileobj), fileobj.bytes_fetched tells how much was transferred.
+    """
+    response = session.get(url, headers={'Range': 'bytes=-{}'.format(block_size)}, timeout=60)
+    response.raise_for_status()
+    if response.status_code == 206:
+        try:
+            fileobj = HTTPRangeFile(url, session, tail_response=response, block_size=block_size)
+            return ZipFile(fileobj), fileobj
+        except RangeNotSupported:
+            response = session.get(url, timeout=60)
+            response.raise_for_status()
+    # full download, the 200 response already holds the whole body
+    fileobj = io.BytesIO(response.content)
+    fileobj.bytes_fetched = len(response.content)
+    return ZipFile(fileobj), fileobj
+
+
+def prefetch_members(zip_obj, fileobj, names):
+    # each member spans from its local header to the next header (or the central directory)
+    if not isinstance(fileobj, HTTPRangeFile):
+        return
+    infos = sorted(zip_obj.infolist(), key=lambda i: i.header_offset)
+    offsets = [i.header_offset for i in infos] + [zip_obj.start_dir]
+    wanted = set(names)
+    ranges = [(offsets[k], offsets[k + 1]) for k, info in enumerate(infos) if info.filename in wanted]
+    fileobj.prefetch(ranges)
+
+
+def write_slim_wheel(zip_obj, fileobj, l_name, dst_path):
+    """Copy only the members we profile into a new wheel at dst_path.
+
+    Non .py files under the top-level packages are kept as empty entries so the
+    profile tree is the same as the one built from the full wheel.
+    """
+    names = [n for n in zip_obj.namelist() if is_dist_info_member(n)]
+    prefetch_members(zip_obj, fileobj, names)
+    top_levels = read_top_levels(zip_obj, l_name)
+    py_names = []
+    placeholders = []
+    for name in zip_obj.namelist():
+        if name.endswith('/') or not is_top_level_member(name, top_levels):
+            continue
+        if name.endswith('.py'):
+            py_names.append(name)
+        else:
+            placeholders.append(name)
+    prefetch_members(zip_obj, fileobj, py_names)
+    with ZipFile(dst_path, 'w', ZIP_DEFLATED) as slim:
+        for name in names + py_names:
+            slim.writestr(name, zip_obj.read(name))
+        for name in placeholders:
+            slim.writestr(name, b'')
+    return top_levels
@@ -0,0 +1,162 @@
+import re
+import posixpath
+import configparser
+from zipfile import ZipFile
+from .source_tree import TarSourceTree, ZipSourceTree
+
+try:
+    import tomllib
+except ImportError:  # python < 3.11, pyproject.toml is skipped
+    tomllib = None
+
+# directories next to the packages that are never part of the distribution
+NOT_PACKAGES = {'test', 'tests', 'testing', 'doc', 'docs', 'documentation', 'example', 'examples',
+                'benchmark', 'benchmarks', 'build', 'dist', 'scripts', 'tools', 'ci'}
+NOT_MODULES = {'setup.py', 'conftest.py', 'noxfile.py', 'fabfile.py', 'tasks.py', 'ez_setup.py',
+               'distribute_setup.py', 'bootstrap.py'}
+
+
+def open_sdist(path):
+    if path.endswith('.zip'):
+        return ZipSourceTree(ZipFile(path, 'r'))
+    return TarSourceTree(path)
+
+
+def _normalize(name):
+    return re.sub(r'[-_.]+', '_', name).lower()
+
+
+def _join(*parts):
+    # like posixpath.join, but '' (the archive root) and stray slashes are ignored
+    return '/'.join(p.strip('/') for p in parts if p.strip('/'))
+
+
+def _project_root(source_tree):
+    # sdists unpack into a single <name>-<version>/ directory
+    items = source_tree.listdir('')
+    if len(items) == 1 and source_tree.isdir(items[0]):
+        return items[0]
+    return ''
+
+
+def _read_text(source_tree, path):
+    try:
+        return source_tree.read_bytes(path).decode('utf-8', errors='ignore')
+    except FileNotFoundError:
+        return None
+
+
+def _from_egg_info(source_tree, root):
+    # setuptools ships <name>.egg-info/top_level.txt next to the packages
+    for base in (root, _join(root, 'src')):
+        if not source_tree.isdir(base):
+            continue
+        for item in source_tree.listdir(base):
+            if item.endswith('.egg-info'):
+                content = _read_text(source_tree, _join(base, item, 'top_level.txt'))
+                if content:
+                    top_levels = [l.strip() for l in content.splitlines() if l.strip()]
+                    if top_levels:
+                        return base, top_levels
+    return None
+
+
+def _from_setup_cfg(source_tree, root):
+    content = _read_text(source_tree, _join(root, 'setup.cfg'))
+    if not content:
+        return None
+    parser = configparser.ConfigParser(interpolation=None)
+    try:
+        parser.read_string(content)
+    except configparser.Error:
+        return None
+    if not parser.has_section('options'):
+        return None
+    base = root
+    package_dir = parser.get('options', 'package_dir', fallback='')
+    for line in re.split(r'[\n,]', package_dir):
+        key, _, value = line.partition('=')
+        if value.strip() and not key.strip():
+            base = _join(root, value.strip())
+    names = [n.strip() for n in re.split(r'[\n,]', parser.get('options', 'packages', fallback=''))]
+    names += [n.strip() for n in re.split(r'[\n,]', parser.get('options', 'py_modules', fallback=''))]
+    # "packages = find:" only tells us where to look
+    top_levels = sorted({n.split('.')[0] for n in names if n and not n.startswith(('find:', 'find_namespace:'))})
+    return base, top_levels
+
+
+def _from_pyproject(source_tree, root):
+    content = _read_text(source_tree, _join(root, 'pyproject.toml'))
+    if not content or tomllib is None:
+        return None
+    try:
+        tool = tomllib.loads(content).get('tool', {})
+    except tomllib.TOMLDecodeError:
+        return None
+    # hatch lists package paths, e.g. packages = ["src/attr", "src/attrs"]
+    paths = tool.get('hatch', {}).get('build', {}).get('targets', {}).get('wheel', {}).get('packages', [])
+    if paths:
+        base = posixpath.dirname(paths[0].strip('/'))
+        return _join(root, base), [posixpath.basename(p.strip('/')) for p in paths]
+    setuptools = tool.get('setuptools', {})
+    base = root
+    package_dir = setuptools.get('package-dir', {})
+    if package_dir.get(''):
+        base = _join(root, package_dir[''])
+    packages = setuptools.get('packages', [])
+    if isinstance(packages, dict):
+        where = packages.get('find', {}).get('where', [])
+        if where:
+            base = _join(root, where[0])
+        packages = []
+    names = list(packages) + list(setuptools.get('py-modules', []))
+    return base, sorted({n.split('.')[0] for n in names})
+
+
+def _from_layout(source_tree, base, l_name):
+    packages, modules = [], []
+    for item in source_tree.listdir(base):
+        path = _join(base, item)
+        if source_tree.isdir(path):
+            if item not in NOT_PACKAGES and item.isidentifier() and \
+                    source_tree.isfile(_join(path, '__init__.py')):
+                packages.append(item)
+        elif item.endswith('.py') and item not in NOT_MODULES and item[:-3].isidentifier() \
+                and not item.startswith('test_') and not item.endswith('_test.py'):
+            modules.append(item[:-3])
+    # the package named after the library wins, otherwise keep every package found
+    for name in packages + modules:
+        if _normalize(name) == _normalize(l_name):
+            return [name]
+    return sorted(packages) or sorted(modules)
+
+
+def sdist_entry_points(source_tree, l_name):
+    """Find the top-level packages and modules of an sdist without building it.
+
+    Cheap heuristics, in order: egg-info/top_level.txt, setup.cfg [options],
+    pyproject.toml (setuptools or hatch tables), then the directory layout
+    (src/ or the project root). Returns paths inside source_tree, or None.
+    """
+    root = _project_root(source_tree)
+    found = _from_egg_info(source_tree, root) or _from_setup_cfg(source_tree, root) or \
+        _from_pyproject(source_tree, root)
+    if found is not None:
+        base, top_levels = found
+    else:
+        base, top_levels = root, []
+    if not source_tree.isdir(base):
+        base = root
+    if not top_levels:
+        src = _join(root, 'src')
+        if base == root and source_tree.isdir(src):
+            base = src
+        top_levels = _from_layout(source_tree, base, l_name)
+
+    entry_points = []
+    for t in top_levels:
+        if source_tree.isdir(_join(base, t)):
+            entry_points.append(_join(base, t))
+        elif source_tree.isfile(_join(base, t + '.py')):
+            entry_points.append(_join(base, t + '.py'))
+    return entry_points or None
@@ -0,0 +1,48 @@
+import ast
+import hashlib
+
+
+def default_source(expr):
+    """A default value as normalized source text, the same for any formatting of the expression."""
+    if expr is None:
+        return None
+    return ast.unparse(expr)
+
+
+def signature_parts(arguments):
+    """The parts of an ast.arguments a caller depends on, as plain data."""
+    if arguments is None:
+        return ((), 0, None, (), None, ())
+    positional = tuple(a.arg for a in arguments.posonlyargs) + tuple(a.arg for a in arguments.args)
+    kwonly = tuple((a.arg, default_source(d)) for a, d in zip(arguments.kwonlyargs, arguments.kw_defaults))
+    return (
+        positional,
+        len(arguments.posonlyargs),
+        arguments.vararg.arg if arguments.vararg else None,
+        kwonly,
+        arguments.kwarg.arg if arguments.kwarg else None,
+        tuple(default_source(d) for d in arguments.defaults),
+    )
+
+
+def signature_fingerprint(arguments):
+    """A short stable hash of positional, keyword-only, *args, **kwargs and defaults.
+
+    Two versions of an API have the same fingerprint exactly when callers see
+    the same signature, so a change is one comparison.
+    """
+    return hashlib.sha1(repr(signature_parts(arguments)).encode()).hexdigest()[:16]
+
+
+def get_keywords(node):
+    # (argument names, defaults as source text, signature fingerprint)
+    args = node.args
+    arg_names = []
+    defaults = [default_source(d) for d in args.defaults]
+    for arg in args.args:
+        arg_names += [arg.arg]
+    return (arg_names, defaults, signature_fingerprint(args))
+
+
+# the signature of a class without a constructor of its own
+EMPTY_SIGNATURE = signature_fingerprint(None)
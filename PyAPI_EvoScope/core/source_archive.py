@@ -0,0 +1,101 @@
+import os
+import mmap
+import zlib
+import struct
+from .blob_store import is_blob_id
+
+# layout: MAGIC, the blobs, the index, then the footer (index offset, number of entries, MAGIC)
+MAGIC = b'PYSRCPK1'
+# index entry: raw sha256, offset, stored length, flags; sorted by sha256 for a binary search in place
+_entry = struct.Struct('<32sQII')
+_footer = struct.Struct('<QQ8s')
+COMPRESSED = 1
+
+
+def write_source_archive(path, blob_ids, source_store, compress=True):
+    """Pack the blobs of source_store named by blob_ids into one file at path.
+
+    A blob is zlib-compressed when compress is set and that makes it smaller.
+    The file is written next to path and renamed into place.
+    """
+    entries = []
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        for blob_id in sorted(set(blob_ids)):
+            data = source_store.get(blob_id).encode('utf-8')
+            flags = 0
+            if compress:
+                packed = zlib.compress(data, 6)
+                if len(packed) < len(data):
+                    data, flags = packed, COMPRESSED
+            entries.append((bytes.fromhex(blob_id), f.tell(), len(data), flags))
+            f.write(data)
+        index_offset = f.tell()
+        for entry in entries:
+            f.write(_entry.pack(*entry))
+        f.write(_footer.pack(index_offset, len(entries), MAGIC))
+    os.replace(tmp_path, path)
+    return len(entries)
+
+
+class SourceArchive:
+    """A source archive opened with mmap, blobs are found by a binary search of the
+    index in place and read (and decompressed) only when asked for."""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        index_offset, self._n, magic = _footer.unpack_from(self._map, len(self._map) - _footer.size)
+        if magic != MAGIC or self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError("{} is not a source archive".format(path))
+        self._index_offset = index_offset
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def __len__(self):
+        return self._n
+
+    def _find(self, blob_id):
+        key = bytes.fromhex(blob_id)
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = _entry.unpack_from(self._map, self._index_offset + mid * _entry.size)
+            if entry[0] < key:
+                lo = mid + 1
+            elif entry[0] > key:
+                hi = mid
+            else:
+                return entry
+        return None
+
+    def __contains__(self, blob_id):
+        return is_blob_id(blob_id) and self._find(blob_id) is not None
+
+    def get(self, blob_id):
+        entry = self._find(blob_id) if is_blob_id(blob_id) else None
+        if entry is None:
+            raise KeyError(blob_id)
+        _, offset, length, flags = entry
+        data = self._map[offset:offset + length]
+        if flags & COMPRESSED:
+            data = zlib.decompress(data)
+        return data.decode('utf-8')
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,192 @@
+import os
+import csv
+import tarfile
+import posixpath
+
+
+class LocalSourceTree:
+    """A directory on disk, addressed with '/'-separated paths relative to root."""
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, path):
+        return os.path.join(self.root, *path.split('/')) if path else self.root
+
+    def isdir(self, path):
+        return os.path.isdir(self._path(path))
+
+    def isfile(self, path):
+        return os.path.isfile(self._path(path))
+
+    def listdir(self, path):
+        return os.listdir(self._path(path))
+
+    def read_bytes(self, path):
+        with open(self._path(path), 'rb') as f:
+            return f.read()
+
+    def walk(self, top=''):
+        for root, dirs, files in os.walk(self._path(top)):
+            rel = os.path.relpath(root, self.root)
+            yield ('' if rel == '.' else rel.replace(os.sep, '/')), dirs, files
+
+    def digests(self):
+        return {}
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _member_path(name):
+    return posixpath.normpath(name.lstrip('/')) if name.strip('/') else ''
+
+
+class ArchiveSourceTree:
+    """A read-only file tree over archive members, nothing is extracted.
+
+    The directory index is built from the member names alone, file contents
+    are only read (through read_member) when asked for.
+    """
+    def __init__(self, names, read_member):
+        self._read_member = read_member
+        self._members = {}
+        self._children = {'': []}
+        for name in names:
+            is_dir = name.endswith('/')
+            path = _member_path(name)
+            if path in ('', '.') or path.startswith('..'):
+                continue
+            if not is_dir:
+                self._members[path] = name
+            self._add_dir(posixpath.dirname(path))
+            if is_dir:
+                self._add_dir(path)
+            else:
+                self._add_child(posixpath.dirname(path), posixpath.basename(path))
+
+    def _add_child(self, parent, child):
+        children = self._children[parent]
+        if child not in children:
+            children.append(child)
+
+    def _add_dir(self, path):
+        if path in self._children:
+            return
+        parent = posixpath.dirname(path)
+        self._add_dir(parent)
+        self._children[path] = []
+        self._add_child(parent, posixpath.basename(path))
+
+    def isdir(self, path):
+        return path in self._children
+
+    def isfile(self, path):
+        return path in self._members
+
+    def listdir(self, path):
+        if path not in self._children:
+            raise NotADirectoryError(path)
+        return list(self._children[path])
+
+    def read_bytes(self, path):
+        if path not in self._members:
+            raise FileNotFoundError(path)
+        return self._read_member(self._members[path])
+
+    def walk(self, top=''):
+        # top-down in the same order as os.walk, callers may prune dirs in place
+        dirs, files = [], []
+        for name in self._children[top]:
+            (dirs if self.isdir(posixpath.join(top, name)) else files).append(name)
+        yield top, dirs, files
+        for d in dirs:
+            yield from self.walk(posixpath.join(top, d))
+
+    def digests(self):
+        """{path: digest} of the files whose hash the archive records, empty if it records none."""
+        return {}
+
+    def keep_sources(self, paths):
+        """Make the .py files under paths readable, members are read on demand here."""
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ZipSourceTree(ArchiveSourceTree):
+    """A wheel (or any zip) read in place, members are decompressed on demand."""
+    def __init__(self, zip_obj):
+        super().__init__(zip_obj.namelist(), zip_obj.read)
+        self.zip_obj = zip_obj
+
+    def digests(self):
+        # PEP 376 RECORD lines: path,sha256=<urlsafe base64>,size
+        for name in self.zip_obj.namelist():
+            parts = name.split('/')
+            if len(parts) == 2 and parts[0].endswith('.dist-info') and parts[1] == 'RECORD':
+                content = self.zip_obj.read(name).decode('utf-8', errors='ignore')
+                return {row[0]: row[1] for row in csv.reader(content.splitlines())
+                        if len(row) >= 2 and row[1].startswith('sha256=')}
+        return {}
+
+    def close(self):
+        self.zip_obj.close()
+
+
+def _is_sdist_metadata_member(name):
+    # the small files used to find the packages of an sdist
+    base = posixpath.basename(name)
+    return base in ('setup.cfg', 'pyproject.toml') or \
+        (base == 'top_level.txt' and posixpath.dirname(name).endswith('.egg-info'))
+
+
+class TarSourceTree(ArchiveSourceTree):
+    """An sdist tarball read as a stream, member by member, without unpacking it.
+
+    Every member is listed so the tree keeps its shape, but only the members
+    accepted by keep, the packaging metadata by default, are held in memory.
+    Once the packages are known, keep_sources() streams the archive again for
+    their .py files; the others cannot be read.
+    """
+    def __init__(self, path, keep=_is_sdist_metadata_member):
+        self.path = path
+        self._contents = {}
+        names = []
+        with tarfile.open(path, mode='r|*') as tar:
+            for member in tar:
+                if member.isdir():
+                    names.append(member.name.rstrip('/') + '/')
+                elif member.isfile():
+                    names.append(member.name)
+                    if keep(member.name):
+                        self._contents[member.name] = tar.extractfile(member).read()
+        super().__init__(names, self._read_kept)
+
+    def keep_sources(self, paths):
+        """Stream the archive again, keeping the .py files under paths (files or directories)."""
+        def is_under(path):
+            return any(path == p or path.startswith(p.rstrip('/') + '/') for p in paths)
+
+        with tarfile.open(self.path, mode='r|*') as tar:
+            for member in tar:
+                if member.isfile() and member.name.endswith('.py') and member.name not in self._contents \
+                        and is_under(_member_path(member.name)):
+                    self._contents[member.name] = tar.extractfile(member).read()
+
+    def _read_kept(self, name):
+        if name not in self._contents:
+            raise FileNotFoundError('{} was not kept while streaming the archive'.format(name))
+        return self._contents[name]
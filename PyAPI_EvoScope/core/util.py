@@ -55,7 +55,7 @@ def find_local_modules(import_smts):
             result  += [m_name]
     return result
 
-def get_path_by_extension(root_dir, num_of_required_paths, flag='.ipynb'):
+def get_path_by_extension(root_dir, num_of_required_paths=None, flag='.ipynb'):
     paths = []
     for root, dirs, files in os.walk(root_dir):
         files = [f for f in files if not f[0] == '.'] 
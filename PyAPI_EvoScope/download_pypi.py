@@ -1,85 +1,238 @@
 import os
+import time
+import threading
+import argparse
 import requests
 import json
-from urllib.parse import urljoin
+from urllib.parse import urlparse
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from core.artifact_select import select_artifact
+from core.remote_zip import RangeNotSupported, open_remote_wheel, write_slim_wheel
+from core.artifact_cache import ArtifactCache
+from core.index_backend import open_index
 
 
-def download_package(package_name, max_versions=6):
-    """下载指定Python包"""
+DATA_DIR = Path("data/haowei/pypi_libs")
+CACHE_DIR = Path("data/haowei/artifact_cache")
+METADATA_CACHE_DIR = Path("data/haowei/metadata_cache")
 
-    # 创建目录
-    data_dir = Path("data/haowei/pypi_libs") / package_name
-    data_dir.mkdir(parents=True, exist_ok=True)
 
-    print(f"正在下载 {package_name}...")
+def create_session(pool_size=32, retries=3):
+    """创建共享连接池的 Session"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
-    try:
-        # 获取包信息
-        url = f"https://pypi.org/pypi/{package_name}/json"
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
 
-        data = response.json()
-        releases = data.get("releases", {})
+class HostLimiter:
+    """按主机限制并发连接数"""
 
-        # 获取所有版本并排序
-        versions = list(releases.keys())
-        from packaging.version import parse as parse_version
-        versions.sort(key=parse_version)
+    def __init__(self, per_host=8):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._semaphores = {}
 
-        print(f"找到 {len(versions)} 个版本")
+    def get(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self._semaphores[host]
 
-        # 下载最新几个版本
-        downloaded = 0
-        for version in versions[-max_versions:]:
-            if not releases[version]:
-                continue
 
-            # 创建版本目录
-            version_dir = data_dir / version
-            version_dir.mkdir(exist_ok=True)
+class DownloadStats:
+    """统计下载字节数与耗时"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start = time.monotonic()
+        self.bytes = 0
+        self.files = 0
+
+    def add(self, n_bytes):
+        with self._lock:
+            self.bytes += n_bytes
+            self.files += 1
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        mb = self.bytes / (1024 * 1024)
+        return f"{self.files} 个文件, {mb:.1f} MB, 用时 {elapsed:.1f}s, {mb / elapsed:.2f} MB/s, {self.files / elapsed:.2f} 文件/s"
+
+
+def fetch_release_plan(index, package_name, max_versions=6):
+    """获取包信息，返回每个版本的下载任务"""
+    releases = index.releases(package_name)
+
+    # 获取所有版本并排序
+    versions = list(releases.keys())
+    from packaging.version import parse as parse_version
+    versions.sort(key=parse_version)
+
+    print(f"{package_name}: 找到 {len(versions)} 个版本")
+
+    tasks = []
+    for version in versions[-max_versions:]:
+        # 按文件名标签选择 wheel，没有合适的 wheel 时退回 sdist
+        file_info = select_artifact(releases[version])
+        if file_info is None:
+            continue
+        tasks.append((package_name, version, [index.resolve(file_info)]))
+    return tasks
+
+
+def fetch_partial_wheel(session, file_url, file_path, package_name):
+    """用 Range 请求只获取需要分析的成员，写成精简 wheel，返回传输字节数"""
+    tmp_path = file_path.with_name(file_path.name + ".part")
+    zip_obj, fileobj = open_remote_wheel(file_url, session)
+    with zip_obj:
+        write_slim_wheel(zip_obj, fileobj, package_name, tmp_path)
+    os.replace(tmp_path, file_path)
+    return fileobj.bytes_fetched
+
 
-            # 查找合适的文件
-            for file_info in releases[version]:
-                filename = file_info["filename"]
-                file_url = file_info["url"]
+def download_version(session, limiter, stats, package_name, version, files, partial=False, cache=None):
+    """下载一个版本，成功返回 True"""
+    # 创建版本目录
+    version_dir = DATA_DIR / package_name / version
+    version_dir.mkdir(parents=True, exist_ok=True)
 
-                # 检查是否已存在
-                file_path = version_dir / filename
-                if file_path.exists():
-                    print(f"  ✓ {version}: {filename} (已存在)")
-                    downloaded += 1
-                    break
+    # 查找合适的文件
+    for file_info in files:
+        filename = file_info["filename"]
+        file_url = file_info["url"]
+        sha256 = file_info.get("digests", {}).get("sha256")
+        use_cache = cache is not None and sha256 is not None and not partial
 
+        # 检查是否已存在，有摘要时校验完整性
+        file_path = version_dir / filename
+        if file_path.exists():
+            if not use_cache or cache.is_linked(sha256, file_path) or cache.adopt(file_path, sha256):
+                print(f"  ✓ {package_name} {version}: {filename} (已存在)")
+                return True
+            print(f"  ✗ {package_name} {version}: {filename} 不完整，重新下载")
+
+        try:
+            print(f"  下载 {package_name} {version}: {filename}")
+
+            # 下载文件
+            if partial and filename.endswith(".whl"):
                 try:
-                    print(f"  下载 {version}: {filename}")
+                    with limiter.get(file_url):
+                        n_bytes = fetch_partial_wheel(session, file_url, file_path, package_name)
+                except RangeNotSupported as e:
+                    # 服务器中途不再按 Range 返回，改为完整下载
+                    print(f"    {package_name} {version} Range 请求失败 ({e})，改为完整下载")
+                else:
+                    stats.add(n_bytes)
+                    print(f"    ✓ {package_name} {version} 部分下载完成")
+                    return True
+
+            if use_cache:
+                # 下载到内容寻址缓存，再硬链接到版本目录
+                with limiter.get(file_url):
+                    n_bytes = cache.fetch(session, file_url, sha256)
+                cache.link_into(sha256, file_path)
+            else:
+                n_bytes = 0
+                tmp_path = file_path.with_name(file_path.name + ".part")
+                with limiter.get(file_url):
+                    with session.get(file_url, stream=True, timeout=60) as file_response:
+                        file_response.raise_for_status()
+                        with open(tmp_path, 'wb') as f:
+                            for chunk in file_response.iter_content(chunk_size=65536):
+                                f.write(chunk)
+                                n_bytes += len(chunk)
+                os.replace(tmp_path, file_path)
+
+            stats.add(n_bytes)
+            print(f"    ✓ {package_name} {version} 下载完成")
+            return True  # 每个版本只下载一个文件
 
-                    # 下载文件
-                    file_response = requests.get(file_url, stream=True, timeout=60)
-                    file_response.raise_for_status()
+        except Exception as e:
+            print(f"    ✗ {package_name} {version} 下载失败: {e}")
+            continue
+    return False
 
-                    with open(file_path, 'wb') as f:
-                        for chunk in file_response.iter_content(chunk_size=8192):
-                            f.write(chunk)
 
-                    print(f"    ✓ 下载完成")
-                    downloaded += 1
-                    break  # 每个版本只下载一个文件
+def download_all(packages, max_versions=6, workers=16, per_host=8, partial=False, cache_dir=CACHE_DIR,
+                 index_spec=None, metadata_cache_dir=METADATA_CACHE_DIR):
+    """并发下载所有包的所有版本，返回 (成功列表, 失败列表)"""
+    session = create_session(pool_size=max(workers, per_host))
+    # 在线 PyPI、本地镜像目录或磁盘上的 simple 索引
+    index = open_index(index_spec, session, metadata_cache_dir)
+    cache = ArtifactCache(cache_dir) if cache_dir else None
+    limiter = HostLimiter(per_host)
+    stats = DownloadStats()
+    downloaded = {package: 0 for package in packages}
 
-                except Exception as e:
-                    print(f"    ✗ 下载失败: {e}")
-                    continue
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # 先并发获取元数据
+        plan_futures = {executor.submit(fetch_release_plan, index, package, max_versions): package
+                        for package in packages}
+        version_futures = {}
+        for future in as_completed(plan_futures):
+            package = plan_futures[future]
+            try:
+                tasks = future.result()
+            except Exception as e:
+                print(f"✗ 获取 {package} 信息失败: {e}")
+                continue
+            for task in tasks:
+                version_futures[executor.submit(download_version, session, limiter, stats, *task,
+                                                 partial=partial, cache=cache)] = package
+
+        # 所有 (包, 版本) 同时下载
+        for future in as_completed(version_futures):
+            package = version_futures[future]
+            try:
+                if future.result():
+                    downloaded[package] += 1
+            except Exception as e:
+                print(f"✗ 下载 {package} 失败: {e}")
 
-        print(f"✓ {package_name}: 下载了 {downloaded}/{max_versions} 个版本")
-        return downloaded > 0
+    session.close()
+    for package in packages:
+        print(f"✓ {package}: 下载了 {downloaded[package]}/{max_versions} 个版本")
+    print(f"吞吐量: {stats.report()}")
+    metadata_cache = getattr(index, "cache", None)
+    if metadata_cache is not None:
+        print(f"元数据缓存: {metadata_cache.hits} 个未变化 (304), {metadata_cache.misses} 个重新下载")
 
-    except Exception as e:
-        print(f"✗ 下载 {package_name} 失败: {e}")
-        return False
+    successful = [package for package in packages if downloaded[package] > 0]
+    failed = [package for package in packages if downloaded[package] == 0]
+    return successful, failed
+
+
+def download_package(package_name, max_versions=6):
+    """下载指定Python包"""
+    print(f"正在下载 {package_name}...")
+    successful, _ = download_all([package_name], max_versions=max_versions)
+    return len(successful) > 0
 
 
 def main():
+    parser = argparse.ArgumentParser(description="download the latest versions of PyPI libraries")
+    parser.add_argument('-n', metavar='parallel_number', type=int, default=16,
+                        help='The number of download workers, default is 16')
+    parser.add_argument('--per-host', type=int, default=8,
+                        help='The max number of concurrent connections per host, default is 8')
+    parser.add_argument('--max-versions', type=int, default=6,
+                        help='The number of latest versions to download, default is 6')
+    parser.add_argument('--partial', action='store_true',
+                        help='Only fetch the members of wheels that are profiled, using HTTP Range requests')
+    parser.add_argument('--cache-dir', type=str, default=str(CACHE_DIR),
+                        help='The content-addressed artifact cache, empty to disable')
+    parser.add_argument('--index', type=str, default=None,
+                        help='pypi (default), a JSON API mirror URL, a local mirror directory or a simple index on disk')
+    parser.add_argument('--metadata-cache-dir', type=str, default=str(METADATA_CACHE_DIR),
+                        help='The PyPI metadata cache revalidated with ETags, empty to disable')
+    args = parser.parse_args()
+
     # 读取要下载的包列表
     if os.path.exists("lib_names.txt"):
         with open("lib_names.txt", "r") as f:
@@ -96,14 +249,10 @@ def main():
     print("开始下载包...")
     print("=" * 50)
 
-    successful = []
-    failed = []
-
-    for package in packages:
-        if download_package(package, max_versions=6):
-            successful.append(package)
-        else:
-            failed.append(package)
+    successful, failed = download_all(packages, max_versions=args.max_versions,
+                                      workers=args.n, per_host=args.per_host, partial=args.partial,
+                                      cache_dir=args.cache_dir, index_spec=args.index,
+                                      metadata_cache_dir=args.metadata_cache_dir)
 
     print("\n" + "=" * 50)
     print("下载完成！")
@@ -124,4 +273,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
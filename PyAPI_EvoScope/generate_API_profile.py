@@ -1,47 +1,71 @@
 import ast
 import os
+import posixpath
 import re
 import sys
-import json
-from queue import Queue
-from copy import deepcopy
+import hashlib
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from core import *
 from core.source_visitor import SourceVisitor
-from wheel_inspect import inspect_wheel
-import tarfile
+from core.compact_node import CompactNode, intern_name, load_profile, full_name_key, index_nodes, tree_index
+from core.signature import EMPTY_SIGNATURE
+from core.module_extractor import EXTRACTOR_VERSION, ModuleExtractor, import_table, line_starts, slice_span
+from core.extraction_cache import ExtractionCache
+from core.profile_store import ProfileStore
+from core.blob_store import BlobStore
+from core.artifact_select import rank_wheels, select_artifact, local_files
+from core.remote_zip import read_top_levels
+from core.source_tree import LocalSourceTree, ZipSourceTree
+from core.sdist import open_sdist, sdist_entry_points
+from core.index_backend import open_index
+import requests
 from zipfile import ZipFile
 from packaging.version import parse as parse_version
 import networkx as nx
 import argparse
-import multiprocessing
-from itertools import repeat
-import shutil
+import threading
+from functools import partial
 import pickle
 
 
 cwd = os.getcwd()
 #error_log = r'/home/haowei/s2/error_log_return_type_history.txt'
 error_log = os.path.join(cwd, "error_log_removed_history.txt")
+# lib name -> VersionFileCache of the version profiled last, for the few most recent libraries
+last_version_files = {}
+last_version_files_lock = threading.Lock()
+MAX_REMEMBERED_LIBS = 16
+
+class Tree(CompactNode):
+    __slots__ = ('name', 'full_name', 'children', 'parent', 'cargo', 'api_alias', 'source', 'facts', 'return_type_dict')
 
-class Tree:
     def __init__(self, name):
-        self.name = name
+        self.name = intern_name(name)
         self.full_name = None
         self.children = []
         self.parent = None
         self.cargo = {}
         self.api_alias = {}
         self.source = ''
-        self.ast = None
+        self.facts = None
         self.return_type_dict=None
     def __str__(self):
         return str(self.name)
     def __hash__(self):
         return hash(id(self))
+    def _index_keys(self, child):
+        # modules are also found without their extension, see find_node_by_name
+        if child.name.endswith('.py'):
+            return (child.name, ('module', child.name), ('module', child.name[:-3]))
+        return (child.name, ('module', child.name))
+
+class ModuleOrPackageNode(CompactNode):
+    # a profile root keeps the full-name index of its tree, see tree_index
+    __slots__ = ('name', 'full_name', 'children', 'parent', '_full_name_index')
 
-class ModuleOrPackageNode:
     def __init__(self, name):
-        self.name = name
+        self.name = intern_name(name)
         self.full_name = None
         self.children = []
         self.parent = None
@@ -50,9 +74,12 @@ class ModuleOrPackageNode:
     def __hash__(self):
         return hash(id(self))
 
-class ClassNode:
+class ClassNode(CompactNode):
+    __slots__ = ('name', 'full_name', 'parent', 'children', 'aliases', 'default_values', 'source', 'kws', 'ast',
+                 'signature')
+
     def __init__(self, name):
-        self.name = name
+        self.name = intern_name(name)
         self.full_name = None
         self.parent = None
         self.children = []
@@ -65,9 +92,11 @@ class ClassNode:
         return hash(id(self))
 
 
-class ClassAliasNode:
+class ClassAliasNode(CompactNode):
+    __slots__ = ('name', 'full_name', 'parent', 'children', 'real_class', 'default_values')
+
     def __init__(self, name):
-        self.name = name
+        self.name = intern_name(name)
         self.full_name = None
         self.parent = None
         self.children = []
@@ -78,9 +107,11 @@ class ClassAliasNode:
     def __hash__(self):
         return hash(id(self))
 
-class APINode:
+class APINode(CompactNode):
+    __slots__ = ('name', 'full_name', 'parent', 'source', 'aliases', 'ast', 'kws', 'default_values', 'signature')
+
     def __init__(self, name):
-        self.name = name
+        self.name = intern_name(name)
         self.full_name = None
         self.parent = None
         self.source = None
@@ -88,15 +119,18 @@ class APINode:
         self.ast = None
         self.kws=None
         self.default_values=None
+        self.signature=None
     def __str__(self):
         return str(self.name)
     def __hash__(self):
         return hash(id(self))
 
 
-class APIAliasNode:
+class APIAliasNode(CompactNode):
+    __slots__ = ('name', 'full_name', 'parent', 'source', 'real_API', 'kws', 'default_values')
+
     def __init__(self, name):
-        self.name = name
+        self.name = intern_name(name)
         self.full_name = None
         self.parent = None
         self.source = None
@@ -109,44 +143,6 @@ class APIAliasNode:
         return hash(id(self))
 
 
-class GetFunctionNodeVisitor(ast.NodeVisitor):
-    def __init__(self):
-        self.result = {}
-    def visit_FunctionDef(self, node):
-        if node.name not in self.result:
-            self.result[node.name] = node
-        return node
-
-
-class GetClassNodeVisitor(ast.NodeVisitor):
-    def __init__(self):
-        self.result = {}
-    def visit_ClassDef(self, node):
-        self.result[node.name] = node
-        return node
-
-
-def parse_import(tree):
-    module_item_dict = {}
-    try:
-        for node in ast.walk(tree):
-            if isinstance(node, ast.ImportFrom):
-                if node.module is None and node.level not in module_item_dict:
-                    module_item_dict[node.level] = []
-                elif node.module not in module_item_dict:
-                   module_item_dict[node.module] = []
-                items = [nn.__dict__ for nn in node.names]
-                for d in items:
-                    if node.module is None:
-                        module_item_dict[node.level].append(d['name'])
-                    else:
-                        module_item_dict[node.module].append(d['name'])
-
-        return module_item_dict
-    except(AttributeError):
-        return None
-
-
 def gen_AST(filename):
     try:
         source = open(filename).read()
@@ -182,88 +178,232 @@ def extract_class(filename):
         return {}, None  # return empty
 
 
-def extract_class_from_source(source):
+def extract_file(source):
+    # (cargo, import table, spans) of a module, plain data that can leave a parse worker
     try:
         tree = ast.parse(source, mode='exec')
-        visitor = SourceVisitor()
-        visitor.visit(tree)
-        return visitor.result, tree
+        extractor = ModuleExtractor()
+        extractor.visit(tree)
+        return extractor.cargo, import_table(extractor.import_froms), extractor.spans()
     except Exception as e:  # to avoid non-python code
-        #if filename[-3:] == 'pyx':
-        #    #print(filename)
-        #    parse_pyx(filename)
         print(e)
-        return {}, None# return empty
-
-def build_dir_tree(node):
+        return {}, None, {}
+
+
+class SourceBudget:
+    """The most source text FileFacts may hold at once, for bounded-memory profiling.
+
+    Sources that do not fit are read again from the archive when their segments are
+    cut, and every source is dropped once the profile nodes of its module are written.
+    A pickled budget gives each process its own ceiling of the same size.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_bytes'])
+
+    def reserve(self, n_bytes):
+        with self._lock:
+            if self.used + n_bytes > self.max_bytes:
+                return False
+            self.used += n_bytes
+            return True
+
+    def release(self, n_bytes):
+        with self._lock:
+            self.used -= n_bytes
+
+
+def read_source(source_tree, path):
+    return source_tree.read_bytes(path).decode("utf-8", errors="ignore")
+
+
+class FileFacts:
+    """What profiling needs from one .py file: its source, cargo, import table and the
+    spans of its functions, classes and methods. No AST is kept.
+
+    With a SourceBudget the source is only held while it fits, otherwise loader
+    reads it again, and release() frees it once the module's profile is written.
+    A source read again is held only if it fits by then; if not, each segment is
+    cut from a fresh read that is dropped right away.
+    """
+    def __init__(self, source, extracted, loader=None, budget=None):
+        self.cargo, self.imports, self.spans = extracted
+        self.segments = {}
+        self.loader = loader
+        self.budget = budget
+        self._source = None
+        self._n_reserved = 0
+        self._line_starts = None
+        if budget is None or loader is None:
+            self._source = source
+        elif budget.reserve(len(source)):
+            self._source = source
+            self._n_reserved = len(source)
+
+    @property
+    def source(self):
+        if self._source is not None:
+            return self._source
+        source = self.loader()
+        # held until release() if the budget allows, a module's segments are cut one after another
+        if self.budget.reserve(len(source)):
+            self._source = source
+            self._n_reserved = len(source)
+        return source
+
+    def release(self):
+        if self.budget is None or self.loader is None:
+            return
+        self._source = None
+        self._line_starts = None
+        self.segments = {}
+        if self._n_reserved:
+            self.budget.release(self._n_reserved)
+            self._n_reserved = 0
+
+    def segment(self, class_name=None, func_name=None):
+        # a top-level function (class_name None), a class (func_name None) or a method
+        key = (class_name, func_name)
+        if key not in self.segments:
+            source = self.source
+            if self._source is None:
+                # over the ceiling, neither the text nor the segment is kept
+                return slice_span(source, line_starts(source), self.spans[key])
+            if self._line_starts is None:
+                self._line_starts = line_starts(source)
+            self.segments[key] = slice_span(source, self._line_starts, self.spans[key])
+        return self.segments[key]
+
+
+class VersionFileCache:
+    """The parsed .py files of one version, keyed by their sha256 in the wheel RECORD.
+
+    It is handed to the next version of the same library, whose files with an
+    unchanged hash are then neither decompressed nor parsed again.
+    """
+    def __init__(self, digests, previous=None):
+        self.digests = digests
+        self.previous = previous.files if previous is not None else {}
+        self.files = {}
+        self.n_reused = 0
+        self.n_parsed = 0
+
+    def reuse(self, path):
+        digest = self.digests.get(path)
+        facts = self.previous.get(digest) if digest else None
+        if facts is not None:
+            self.files[digest] = facts
+            self.n_reused += 1
+        return facts
+
+    def add(self, path, facts):
+        digest = self.digests.get(path)
+        if digest:
+            self.files[digest] = facts
+        self.n_parsed += 1
+
+
+def build_dir_tree(node, source_tree, path, file_nodes):
+    # path is the '/'-separated location of node inside source_tree,
+    # .py files are only collected in file_nodes, parse_files fills them in
     if node.name in ['test', 'tests', 'testing']:
         return
-    if os.path.isdir(node.name) is True:
-        os.chdir(node.name)
-        items  = os.listdir('.')
+    if source_tree.isdir(path) is True:
+        items  = source_tree.listdir(path)
 
         for item in items:
             child_node = Tree(item)
             child_node.parent =  node
-            build_dir_tree(child_node)
+            # the dotted names from the root, assigned top-down
+            child_node.full_name = node.full_name + "." + item
+            build_dir_tree(child_node, source_tree, posixpath.join(path, item), file_nodes)
             node.children.append(child_node)
-        os.chdir('..')
     else:
         # this is a file
         if node.name.endswith('.py'):
-            source = open(node.name, 'rb').read()
-            node.source = source.decode("utf-8", errors="ignore")
-            res, tree = extract_class_from_source(node.source)
-            node.cargo = res
-            node.ast = tree
+            file_nodes.append((node, path))
+
+
+def parse_files(file_nodes, source_tree, file_cache=None, parse_pool=None, extraction_cache=None,
+                source_budget=None):
+    # parse what file_cache and extraction_cache cannot answer, in parse_pool if there is one
+    to_read = []
+    for node, path in file_nodes:
+        facts = file_cache.reuse(path) if file_cache is not None else None
+        if facts is None:
+            to_read.append((node, path))
+        else:
+            # the same content, now read from this version's archive
+            facts.loader = partial(read_source, source_tree, path)
+            node.facts = facts
+    # with a budget, only about that much source is read and parsed at a time
+    batch_bytes = source_budget.max_bytes if source_budget is not None else None
+    batch = []
+    n_batch_bytes = 0
+    for i, (node, path) in enumerate(to_read):
+        raw = source_tree.read_bytes(path)
+        batch.append((node, path, raw))
+        n_batch_bytes += len(raw)
+        if i == len(to_read) - 1 or (batch_bytes is not None and n_batch_bytes >= batch_bytes):
+            parse_batch(batch, source_tree, file_cache, parse_pool, extraction_cache, source_budget)
+            batch = []
+            n_batch_bytes = 0
+    for node, path in file_nodes:
+        node.cargo = node.facts.cargo
+
+
+def parse_batch(batch, source_tree, file_cache, parse_pool, extraction_cache, source_budget):
+    sources = [raw.decode("utf-8", errors="ignore") for node, path, raw in batch]
+    extracted = [None] * len(sources)
+    if extraction_cache is not None:
+        digests = [hashlib.sha256(raw).hexdigest() for node, path, raw in batch]
+        cached = extraction_cache.get_many(digests)
+        extracted = [cached.get(digest) for digest in digests]
+    missing = [i for i, e in enumerate(extracted) if e is None]
+    missing_sources = [sources[i] for i in missing]
+    if parse_pool is not None and len(missing_sources) > 1:
+        results = parse_pool.map(extract_file, missing_sources, chunksize=max(1, len(missing_sources) // 64))
+    else:
+        results = map(extract_file, missing_sources)
+    for i, result in zip(missing, results):
+        extracted[i] = result
+    if extraction_cache is not None:
+        extraction_cache.put_many([(digests[i], extracted[i]) for i in missing])
+    for (node, path, raw), source, e in zip(batch, sources, extracted):
+        facts = FileFacts(source, e, partial(read_source, source_tree, path), source_budget)
+        if file_cache is not None:
+            file_cache.add(path, facts)
+        node.facts = facts
 
 def leaf2root(node):
-    tmp_node = node
-    path_to_root = []
-    # not init.py
-    while tmp_node is not None:
-        path_to_root.append(tmp_node.name)
-        tmp_node = tmp_node.parent
+    # the full names of the directory tree are assigned top-down by build_dir_tree
+    path_name = node.parent.full_name if node.parent is not None else ""
     if node.name == '__init__.py':
-        path_to_root = path_to_root[1:]
-        path_name = ".".join(reversed(path_to_root))
         return path_name
     else:
-        path_name = ".".join(reversed(path_to_root[1:]))
-        path_name = "{}.{}".format(path_name, node.name.split('.')[0])
-        return path_name
+        return "{}.{}".format(path_name, node.name.split('.')[0])
 
-def pf_leaf2root(node):
+def pf_leaf2root(node, parent_path=None):
+    # parent_path: the dotted names from the root to the parent of node, None for the root
     if isinstance(node,ClassNode) or isinstance(node,APINode) or isinstance(node,ClassAliasNode) or isinstance(node,APIAliasNode):
         return node.full_name
-    tmp_node = node
-    path_to_root = []
-    # not init.py
-    while tmp_node is not None:
-        path_to_root.append(tmp_node.name)
-        tmp_node = tmp_node.parent
-    if isinstance(node,APINode) and node.name[0].isupper():
-        path_to_root = path_to_root[1:]
-        path_name = ".".join(reversed(path_to_root))
-        return path_name
-    else:
-        path_name = ".".join(reversed(path_to_root[1:]))
-        path_name = "{}.{}".format(path_name, node.name)
-        return path_name
+    return "{}.{}".format(parent_path or "", node.name)
 
 
 def find_child_by_name(node, name):
-    for ch in node.children:
-        if ch.name == name:
-            return ch
-    return None
+    return node.child(name)
 
 
-def find_node_by_name(nodes, name):
-    for node in nodes:
-        if node.name == name or node.name.rstrip('.py') == name:
-            return node
-    return None
+def find_node_by_name(node, name):
+    # the first child named name or name.py
+    return node.child(('module', name))
 
 
 def go_to_that_node(root, cur_node, visit_path):
@@ -271,17 +411,17 @@ def go_to_that_node(root, cur_node, visit_path):
     route_length = len(route_node_names)
     tmp_node = None
     # go to the siblings of the current node
-    tmp_node =  find_node_by_name(cur_node.parent.children, route_node_names[0])
+    tmp_node =  find_node_by_name(cur_node.parent, route_node_names[0])
     if tmp_node is not None:
         for i in range(1,route_length):
-            tmp_node =  find_node_by_name(tmp_node.children, route_node_names[i])
+            tmp_node =  find_node_by_name(tmp_node, route_node_names[i])
             if tmp_node is None:
                 break
     # from the topmost
     elif route_node_names[0] == root.name:
         tmp_node = root
         for i in range(1,route_length):
-            tmp_node =  find_node_by_name(tmp_node.children, route_node_names[i])
+            tmp_node =  find_node_by_name(tmp_node, route_node_names[i])
             if tmp_node is None:
                 break
         return tmp_node
@@ -289,95 +429,157 @@ def go_to_that_node(root, cur_node, visit_path):
     elif route_node_names[0] == cur_node.parent.name:
         tmp_node = cur_node.parent
         for i in range(1,route_length):
-            tmp_node =  find_node_by_name(tmp_node.children, route_node_names[i])
+            tmp_node =  find_node_by_name(tmp_node, route_node_names[i])
             if tmp_node is None:
                 break
 
     # we are still in the directory
     if tmp_node is not None and tmp_node.name.endswith('.py') is not True:
-       tmp_node =  find_node_by_name(tmp_node.children, '__init__.py')
+       tmp_node =  find_node_by_name(tmp_node, '__init__.py')
 
     return tmp_node
 
-def tree_infer_levels(root_node,output_dir_store_src):
+def resolve_import(root_node, node, module):
+    # the module node that `from <module> import ...` in node refers to, None if it is not in the tree
+    if not module.startswith('.'):
+        return go_to_that_node(root_node, node, module)
+    level = len(module) - len(module.lstrip('.'))
+    # level 1 is the package of node
+    tmp_node = node.parent
+    for i in range(level - 1):
+        if tmp_node is None:
+            return None
+        tmp_node = tmp_node.parent
+    if tmp_node is None:
+        return None
+    for name in module[level:].split('.') if module[level:] else []:
+        tmp_node = find_node_by_name(tmp_node, name)
+        if tmp_node is None:
+            return None
+    if not tmp_node.name.endswith('.py'):
+        tmp_node = find_node_by_name(tmp_node, '__init__.py')
+    return tmp_node
+
+
+def module_import_graph(root_node, modules):
+    # an edge from each module to every module it imports names from,
+    # and the (module node, imported names) of its from-imports in order
+    graph = nx.DiGraph()
+    entries = {}
+    for node in modules:
+        graph.add_node(node)
+        entries[node] = []
+        if node.facts is None or node.facts.imports is None:
+            continue
+        for k, v in node.facts.imports.items():
+            if not isinstance(k, str):
+                continue
+            dst_node = resolve_import(root_node, node, k)
+            if dst_node is not None:
+                entries[node].append((dst_node, v))
+                graph.add_edge(node, dst_node)
+    return graph, entries
+
+
+def make_alias_map(node, entries, api_alias_maps):
+    # name -> API prefix of the module defining it, for the names node imports
+    api_alias = {}
+    for dst_node, names in entries:
+        dst_alias = api_alias_maps.get(dst_node, {})
+        if names[0] == '*':
+            for k_ch in dst_node.cargo:
+                api_alias[k_ch] = leaf2root(dst_node)
+            api_alias.update(dst_alias)
+        else:
+            for api in names:
+                if api in dst_node.cargo:
+                    api_alias[api] = leaf2root(dst_node)
+                if api in dst_alias:
+                    api_alias[api] = dst_alias[api]
+    # names that an import cycle brings back to the module defining them
+    API_prefix = leaf2root(node)
+    return {k: v for k, v in api_alias.items() if v != API_prefix}
+
+
+def resolve_api_aliases(root_node, modules):
+    """The alias map of every module, with re-export chains followed to the defining module.
+
+    Modules are resolved in topological order of the import graph, so the modules a
+    module imports from are final before it; the modules of an import cycle (a
+    strongly connected component) are resolved together until their maps settle.
+    """
+    graph, entries = module_import_graph(root_node, modules)
+    order = {node: i for i, node in enumerate(modules)}
+    condensed = nx.condensation(graph)
+    api_alias_maps = {}
+    for scc in reversed(list(nx.topological_sort(condensed))):
+        members = sorted(condensed.nodes[scc]['members'], key=order.get)
+        for node in members:
+            api_alias_maps[node] = make_alias_map(node, entries[node], api_alias_maps)
+        if len(members) == 1 and not graph.has_edge(members[0], members[0]):
+            continue
+        for i in range(len(members)):
+            changed = False
+            for node in members:
+                api_alias = make_alias_map(node, entries[node], api_alias_maps)
+                if api_alias != api_alias_maps[node]:
+                    api_alias_maps[node] = api_alias
+                    changed = True
+            if not changed:
+                break
+    return api_alias_maps
+
+
+def tree_infer_levels(root_node,source_store):
     API_name_lst = []
     api_alias_map = {}
     leaf_stack = []
-    working_queue = []
+    working_queue = deque()
     working_queue.append(root_node)
 
     # bfs to search all I leafs
     while len(working_queue)>0:
-        tmp_node = working_queue.pop(0)
+        tmp_node = working_queue.popleft()
         if tmp_node.name.endswith('.py') == True:
             leaf_stack.append(tmp_node)
         working_queue.extend(tmp_node.children)
-    tmp_dst_node_map={}
+    api_alias_maps = resolve_api_aliases(root_node, leaf_stack)
     # visit all elements from the stack
     for node in leaf_stack[::-1]:
-        # private modules
+        # private modules only pass their aliases on to the modules importing from them
         if node.name!='__init__.py' and node.name[0]=='_':
             continue
-
-        module_item_dict = parse_import(node.ast)
-        if module_item_dict is None:
+        if node.facts.imports is None:
             continue
-
-        for k, v in module_item_dict.items():
-            if k is None or isinstance(k, int):
-                continue
-            dst_node = go_to_that_node(root_node, node, k)
-            if dst_node is not None:
-                if v[0] =='*':
-                    for k_ch, v_ch in dst_node.cargo.items():
-                        #node.cargo[k_ch] = v_ch
-                        if dst_node not in tmp_dst_node_map:
-                            dst_API_prefix = leaf2root(dst_node)
-                            tmp_dst_node_map[dst_node]=dst_API_prefix
-                        node.api_alias[k_ch]=tmp_dst_node_map[dst_node]
-                    for k_ch,v_ch in dst_node.api_alias.items():
-                        node.api_alias[k_ch]=dst_node.api_alias[k_ch]
-                else:
-                    for api in v:
-                        if api in dst_node.cargo:
-                            #node.cargo[api]= dst_node.cargo[api]
-                            if dst_node not in tmp_dst_node_map:
-                                dst_API_prefix = leaf2root(dst_node)
-                                tmp_dst_node_map[dst_node] = dst_API_prefix
-                            node.api_alias[api] = tmp_dst_node_map[dst_node]
-                        if api in dst_node.api_alias:
-                            node.api_alias[api] = dst_node.api_alias[api]
-            else:
-                pass
+        node.api_alias = api_alias_maps[node]
         if node.name=='__init__.py':
             node.parent.cargo=node.cargo
-            node.parent.source = node.source
-            node.parent.ast = node.ast
+            node.parent.facts = node.facts
             node.parent.api_alias=node.api_alias
 
     # construct profile tree
     pf_root_node = ModuleOrPackageNode(root_node.name.split('.')[0])
     pf_root_node.full_name=pf_root_node.name
     child_nodes = root_node.children
-    construct_tree_for_profile(child_nodes,pf_root_node,output_dir_store_src)
+    construct_tree_for_profile(child_nodes,pf_root_node,source_store)
 
     for node in leaf_stack:
         API_prefix = leaf2root(node)
         store_the_alias_info(pf_root_node, node.api_alias, API_prefix)
     pf_leaf_stack = []
-    pf_working_queue = []
-    pf_working_queue.append(pf_root_node)
+    pf_working_queue = deque()
+    pf_working_queue.append((pf_root_node, None))
+    full_name_index = pf_root_node._full_name_index = OrderedDict()
 
-    # bfs to search all I leafs
+    # bfs to search all I leafs, full names are assigned top-down and indexed
     while len(pf_working_queue) > 0:
-        tmp_node = pf_working_queue.pop(0)
+        tmp_node, parent_path = pf_working_queue.popleft()
         pf_leaf_stack.append(tmp_node)
+        tmp_node.full_name = pf_leaf2root(tmp_node, parent_path)
+        full_name_index[full_name_key(tmp_node)] = tmp_node
         if hasattr(tmp_node,"children"):
-            pf_working_queue.extend(tmp_node.children)
-
-    for node in pf_leaf_stack:
-        API_full=pf_leaf2root(node)
-        node.full_name = API_full
+            path = tmp_node.name if parent_path is None else parent_path + "." + tmp_node.name
+            pf_working_queue.extend((child, path) for child in tmp_node.children)
 
 
     return pf_root_node, pf_leaf_stack
@@ -432,20 +634,15 @@ def go_to_api_node_from_root(root_node,acces_path):
     acces_path_list = acces_path.split(".")
     tmp_node = root_node
     for i in acces_path_list[1:]:
-        pas = False
-        for child in tmp_node.children:
-            if child.name == i:
-                tmp_node = child
-                pas=True
-                break
-        if not pas:
+        tmp_node = tmp_node.child(i)
+        if tmp_node is None:
             return None
     return tmp_node
 
 
 
 
-def construct_tree_for_profile(child_nodes,pf_parent_node,output_dir_store_src):
+def construct_tree_for_profile(child_nodes,pf_parent_node,source_store):
     for child_node in child_nodes:
         pf_child_node = ModuleOrPackageNode(child_node.name.split('.')[0])
         API_prefix = leaf2root(child_node)
@@ -463,26 +660,16 @@ def construct_tree_for_profile(child_nodes,pf_parent_node,output_dir_store_src):
                     func_node.full_name = API_prefix+"."+k
                     func_node.kws=v[0]
                     func_node.default_values=v[1]
+                    func_node.signature=v[2]
                     pf_child_node.children.append(func_node)
                     func_node.parent=pf_child_node
-                    get_functin_node_visitor = GetFunctionNodeVisitor()
-                    get_functin_node_visitor.visit(child_node.ast)
-                    ast_node = get_functin_node_visitor.result[k]
-                    func_node.source=ast.get_source_segment(child_node.source, ast_node)
-                    file_path = os.path.join(output_dir_store_src,func_node.full_name)+".py"
-                    with open(file_path,"w",encoding="utf-8") as f:
-                        f.write(func_node.source)
-                    func_node.source=file_path
+                    func_node.source=source_store.put(child_node.facts.segment(func_name=k))
             elif isinstance(v, dict):
                 cls_node = ClassNode(k)
                 cls_node.full_name = API_prefix + "." + k
                 pf_child_node.children.append(cls_node)
                 cls_node.parent=pf_child_node
-                get_class_node_visitor = GetClassNodeVisitor()
-                get_class_node_visitor.visit(child_node.ast)
-                class_ast_node = get_class_node_visitor.result[k]
-                cls_node.ast = class_ast_node
-                cls_node.source = ast.get_source_segment(child_node.source, class_ast_node)
+                cls_node.source = child_node.facts.segment(class_name=k)
                 # there is a constructor
                 if '__init__' in v:
                     args = v['__init__']
@@ -490,31 +677,27 @@ def construct_tree_for_profile(child_nodes,pf_parent_node,output_dir_store_src):
                     func_node.full_name = API_prefix + "." + k
                     func_node.kws = args[0]
                     func_node.default_values = args[1]
+                    func_node.signature = args[2]
                     cls_node.children.append(func_node)
                     func_node.parent=cls_node
                     cls_node.kws = args[0]
                     cls_node.default_values = args[1]
-                    get_functin_node_visitor = GetFunctionNodeVisitor()
-                    get_functin_node_visitor.visit(cls_node.ast)
-                    ast_node = get_functin_node_visitor.result['__init__']
-                    func_node.source = ast.get_source_segment(child_node.source, ast_node)
-                    file_path = os.path.join(output_dir_store_src, func_node.full_name) + ".__init__.py"
-                    print(file_path)
-                    with open(file_path, "w",encoding="utf-8") as f:
-                        f.write(func_node.source)
-                    func_node.source = file_path
+                    cls_node.signature = args[2]
+                    func_node.source = source_store.put(child_node.facts.segment(k, '__init__'))
 
                 # there is no a constructor
                 else:
-                    args = ([], "")
+                    args = ([], "", EMPTY_SIGNATURE)
                     func_node = APINode(k)
                     func_node.full_name = API_prefix + "." + k
                     func_node.kws = args[0]
                     func_node.default_values = args[1]
+                    func_node.signature = args[2]
                     cls_node.children.append(func_node)
                     func_node.parent = cls_node
                     cls_node.kws = args[0]
                     cls_node.default_values = args[1]
+                    cls_node.signature = args[2]
                     func_node.source=""
 
                 for f_name, args in v.items():
@@ -523,23 +706,16 @@ def construct_tree_for_profile(child_nodes,pf_parent_node,output_dir_store_src):
                         func_node.full_name = API_prefix + "." + k+"."+f_name
                         func_node.kws = args[0]
                         func_node.default_values = args[1]
+                        func_node.signature = args[2]
                         cls_node.children.append(func_node)
                         func_node.parent = cls_node
-                        get_functin_node_visitor = GetFunctionNodeVisitor()
-                        get_functin_node_visitor.visit(cls_node.ast)
-                        ast_node = get_functin_node_visitor.result[f_name]
-                        func_node.source = ast.get_source_segment(child_node.source, ast_node)
-                        file_path = os.path.join(output_dir_store_src, func_node.full_name) + ".py"
-                        with open(file_path, "w",encoding="utf-8") as f:
-                            f.write(func_node.source)
-                        func_node.source = file_path
+                        func_node.source = source_store.put(child_node.facts.segment(k, f_name))
                 cls_node.ast = None
-                file_path = os.path.join(output_dir_store_src, cls_node.full_name) + ".py"
-                with open(file_path, "w",encoding="utf-8") as f:
-                    f.write(cls_node.source)
-                cls_node.source = file_path
+                cls_node.source = source_store.put(cls_node.source)
+        if child_node.facts is not None:
+            child_node.facts.release()
         pf_parent_node.children.append(pf_child_node)
-        construct_tree_for_profile(child_node.children,pf_child_node,output_dir_store_src)
+        construct_tree_for_profile(child_node.children,pf_child_node,source_store)
 
 
 def make_API_full_name_alias_map(meta_data, API_prefix):
@@ -586,16 +762,16 @@ def make_API_full_name(meta_data, API_prefix):
                     API_lst.append(API_name)
 
     return API_lst
-def search_targets(root_dir, targets):
+def search_targets(source_tree, targets):
      entry_points = []
-     for root, dirs, files in os.walk(root_dir):
+     for root, dirs, files in source_tree.walk():
          n_found = 0
          for t in targets:
              if t in dirs :
-                entry_points.append(os.path.join(root, t))
+                entry_points.append(posixpath.join(root, t))
                 n_found += 1
              elif t+'.py' in files:
-                 entry_points.append(os.path.join(root, t+'.py'))
+                 entry_points.append(posixpath.join(root, t+'.py'))
                  n_found += 1
          if n_found == len(targets):
              return entry_points
@@ -603,119 +779,191 @@ def search_targets(root_dir, targets):
 # filter wheel
 # notice we will add egginfo soon
 def process_wheel(path, l_name):
-    # there will be multiple wheel files
-    res = []
-    all_file_names = os.listdir(path)
-    whl_final = ''
-    max_py_ver = ''
-    for fn in all_file_names:
-        if fn.endswith('.whl') and (fn.find('linux')>=0 or fn.find('any')>=0):  # this is a wheel
-            whl_path = os.path.join(path, fn)
-            try:
-                output = inspect_wheel(whl_path)
-                if output['pyver'][-1] > max_py_ver:  # -1 means the last one. Use the biggest version number
-                    max_py_ver = output['pyver'][-1]
-                    whl_final = fn
-            except Exception as e:
-                print("failed to handle {}".format(whl_path))
-                print(e)
-                with open(error_log, 'a') as f:
-                    f.write("Failed to handle {} ".format(whl_path) + "\n")
-    if whl_final != '':
-        whl_path = os.path.join(path, whl_final)
-        output = inspect_wheel(whl_path)
-        # print(output.keys())
-        if 'top_level' not in output['dist_info']:
-            top_levels = [l_name]
-        else:
-            top_levels = output['dist_info']['top_level']
-
-        with ZipFile(whl_path, 'r') as zipObj:
-           # Extract all the contents of zip file in current directory
-           source_dir = os.path.join(path, 'tmp')
-           if not os.path.exists(source_dir):
-               zipObj.extractall(source_dir)
-        entry_points = search_targets(source_dir, top_levels)
-        return entry_points
-    return None
-
-def process_single_module(module_path,output_dir_store_src):
-    pf_tree = None
-    pf_leaf_stack={}
-    # process other modules !!!
-    if os.path.isfile(module_path):
-        first_name = os.path.basename(module_path)
-        # process a single file module
-        root_node = Tree(first_name)
-        build_dir_tree(root_node)
-        pf_tree, pf_leaf_stack = tree_infer_levels(root_node,output_dir_store_src)
-    else:
-        first_name = os.path.basename(module_path)
-        working_dir = os.path.dirname(module_path)
-        path = []
-        cwd = os.getcwd() # save current working dir
-        os.chdir(working_dir)
-        root_node = Tree(first_name)
-        build_dir_tree(root_node)
-        pf_tree, pf_leaf_stack = tree_infer_levels(root_node,output_dir_store_src)
-        os.chdir(cwd) # go back cwd
+    # there will be multiple wheel files, pick one by its filename tags
+    # the wheel is read in place, returns (source tree, entry points inside it)
+    wheels = rank_wheels(local_files(path))
+    if wheels:
+        whl_path = os.path.join(path, wheels[0]['filename'])
+        try:
+            zipObj = ZipFile(whl_path, 'r')
+            top_levels = read_top_levels(zipObj, l_name)
+        except Exception as e:
+            print("failed to handle {}".format(whl_path))
+            print(e)
+            with open(error_log, 'a') as f:
+                f.write("Failed to handle {} ".format(whl_path) + "\n")
+            return None, None
+        source_tree = ZipSourceTree(zipObj)
+        entry_points = search_targets(source_tree, top_levels)
+        return source_tree, entry_points
+    return None, None
+
+def process_sdist(path, l_name):
+    # for releases without a usable wheel, the sdist is streamed instead of unpacked
+    file_info = select_artifact(local_files(path))
+    if file_info is None or file_info['filename'].endswith('.whl'):
+        return None, None
+    sdist_path = os.path.join(path, file_info['filename'])
+    try:
+        source_tree = open_sdist(sdist_path)
+        entry_points = sdist_entry_points(source_tree, l_name)
+        if entry_points:
+            source_tree.keep_sources(entry_points)
+    except Exception as e:
+        print("failed to handle {}".format(sdist_path))
+        print(e)
+        with open(error_log, 'a') as f:
+            f.write("Failed to handle {} ".format(sdist_path) + "\n")
+        return None, None
+    return source_tree, entry_points
+
+def process_single_module(module_path,source_store,source_tree=None,file_cache=None,parse_pool=None,
+                          extraction_cache=None,source_budget=None):
+    # module_path is a package directory or a single file module, inside source_tree
+    # if given, otherwise on disk; source_store is a BlobStore or its directory
+    if isinstance(source_store, str):
+        source_store = BlobStore.open(source_store)
+    if source_tree is None:
+        source_tree = LocalSourceTree(os.path.dirname(module_path))
+        module_path = os.path.basename(module_path)
+    root_node = Tree(posixpath.basename(module_path))
+    root_node.full_name = root_node.name
+    file_nodes = []
+    build_dir_tree(root_node, source_tree, module_path, file_nodes)
+    parse_files(file_nodes, source_tree, file_cache, parse_pool, extraction_cache, source_budget)
+    pf_tree, pf_leaf_stack = tree_infer_levels(root_node,source_store)
     return pf_tree, pf_leaf_stack
 
-def map_API(lib_dir, output_dir, output_dir_store_src):
+def list_versions(lib_dir, lib_name, index=None):
+    versions = os.listdir(lib_dir)
+    # only keep the directories the index knows as releases of this library
+    if index is not None:
+        releases = index.releases(lib_name)
+        versions = [v for v in versions if v in releases]
+    versions.sort(key=lambda x: parse_version(x))
+    return versions
+
+def map_API(lib_dir, output_dir, output_dir_store_src, index=None, parse_workers=1, parse_pool=None,
+            extraction_cache=None, source_budget=None, profile_store=None):
     # try:
     lib_name = os.path.basename(lib_dir)
     if os.path.exists(os.path.join(output_dir, "{}.json".format(lib_name))):
         print("skip {}", lib_name)
         return
-    versions = os.listdir(lib_dir)
-    versions.sort(key=lambda x: parse_version(x))
+    versions = list_versions(lib_dir, lib_name, index)
 
     API_data = {"module": [], "API": {}, "version": []}
     API_data['version'] = versions
 
-    for v in versions:
-        v_dir = os.path.join(lib_dir, v)
-        output_v_dir=os.path.join(os.path.join(output_dir, lib_name),v)
-        if output_dir_store_src.startswith("./"):
-            output_dir_store_src=output_dir_store_src[2:]
-        output_store_src_v = os.path.join(os.path.join(cwd,output_dir_store_src),v)
-        if not os.path.exists(output_v_dir):
-            os.makedirs(output_v_dir)
-        if not os.path.exists(output_store_src_v):
-            os.makedirs(output_store_src_v)
-        #if os.path.exists(os.path.join(output_dir, "{}_{}.json".format(lib_name, v))):
-            #print(lib_name+v+" skip")
-            #continue
-
-        print(v_dir)
-        entry_points = process_wheel(v_dir, lib_name)
-        if entry_points is not None:
-            API_data['module'] = entry_points
-            API_list = []
-            API_alias_map = {}
-            API_alias_map_part2 = {}
-            for ep in entry_points:
+    own_pool = parse_pool is None and parse_workers > 1
+    if own_pool:
+        parse_pool = ProcessPoolExecutor(max_workers=parse_workers)
+    try:
+        for v in versions:
+            v_dir = os.path.join(lib_dir, v)
+            profile_version(lib_name, v, v_dir, output_dir, output_dir_store_src, parse_pool, extraction_cache,
+                            source_budget, profile_store)
+    finally:
+        if own_pool:
+            parse_pool.shutdown()
+
+
+def map_libraries(lib_dirs, output_dir, output_dir_store_src, index=None, workers=1, parse_workers=1,
+                  extraction_cache=None, source_budget=None, profile_store=None):
+    """Profile many libraries in one process, `workers` of them at a time on a thread pool.
+
+    Profiling keeps no process-wide state such as the working directory, so the
+    threads are independent; they share one pool of parse processes.
+    """
+    parse_pool = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers > 1 else None
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(map_API, lib_dir, output_dir, output_dir_store_src, index,
+                                       parse_pool=parse_pool, extraction_cache=extraction_cache,
+                                       source_budget=source_budget, profile_store=profile_store): lib_dir
+                       for lib_dir in lib_dirs}
+            for future in as_completed(futures):
                 try:
-                    pf_tree, pf_leaf_stack = process_single_module(ep, output_store_src_v)  # finish one version
-                    if pf_tree:
-                        pkg_name = pf_tree.name
-                        with open(os.path.join(output_v_dir, "{}.pickle".format(pkg_name)), 'wb') as f:
-                            pickle.dump(pf_tree, f, pickle.HIGHEST_PROTOCOL)
-
+                    future.result()
                 except Exception as e:
-                    os.chdir(cwd)
-                    print("Error: "+str(e))
+                    print("Error: profiling {} failed: {}".format(futures[future], e))
                     with open(error_log, 'a') as f:
-                        f.write("Error: {}, {}\n".format("{}_{}.json".format(lib_name, v), str(e)))
+                        f.write("Error: {}, {}\n".format(futures[future], str(e)))
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown()
+    if extraction_cache is not None:
+        print("extraction cache: {}".format(extraction_cache.report()))
+
+
+def remember_version_files(lib_name, file_cache):
+    # only the latest version of a library is kept, the next one is compared against it
+    with last_version_files_lock:
+        last_version_files.pop(lib_name, None)
+        last_version_files[lib_name] = file_cache
+        while len(last_version_files) > MAX_REMEMBERED_LIBS:
+            del last_version_files[next(iter(last_version_files))]
+
 
+# written next to the pickles of a version, the extractor version that produced them
+EXTRACTOR_STAMP = "extractor_version"
 
-        if os.path.exists(os.path.join(v_dir, 'tmp')):
+
+def profile_is_current(output_v_dir):
+    """True when the pickles in output_v_dir were written by the current extractor."""
+    try:
+        with open(os.path.join(output_v_dir, EXTRACTOR_STAMP)) as f:
+            return f.read().strip() == str(EXTRACTOR_VERSION)
+    except OSError:
+        return False
+
+
+def profile_version(lib_name, v, v_dir, output_dir, output_dir_store_src, parse_pool=None, extraction_cache=None,
+                    source_budget=None, profile_store=None):
+    # profile a single version, write one pickle per top-level package, and its rows
+    # to profile_store in one transaction if there is one
+    pf_trees = []
+    output_v_dir=os.path.join(os.path.join(output_dir, lib_name),v)
+    if output_dir_store_src.startswith("./"):
+        output_dir_store_src=output_dir_store_src[2:]
+    # the sources of every version and library share one content-addressed store
+    source_store = BlobStore.open(os.path.join(os.path.join(cwd,output_dir_store_src),"blobs"))
+    os.makedirs(output_v_dir, exist_ok=True)
+
+    print(v_dir)
+    source_tree, entry_points = process_wheel(v_dir, lib_name)
+    if source_tree is None:
+        source_tree, entry_points = process_sdist(v_dir, lib_name)
+    if source_tree is None:
+        return pf_trees
+    with source_tree:
+        file_cache = VersionFileCache(source_tree.digests(), last_version_files.get(lib_name))
+        for ep in entry_points or []:
             try:
-                shutil.rmtree(os.path.join(v_dir, 'tmp'))
-            except OSError as e:
-                print("Error: %s - %s." % (e.filename, e.strerror))
+                pf_tree, pf_leaf_stack = process_single_module(ep, source_store, source_tree, file_cache, parse_pool,
+                                                                 extraction_cache, source_budget)  # finish one version
+                if pf_tree:
+                    pkg_name = pf_tree.name
+                    with open(os.path.join(output_v_dir, "{}.pickle".format(pkg_name)), 'wb') as f:
+                        pickle.dump(pf_tree, f, pickle.HIGHEST_PROTOCOL)
+                    pf_trees.append(pf_tree)
+
+            except Exception as e:
+                print("Error: "+str(e))
                 with open(error_log, 'a') as f:
-                    f.write("Error: %s - %s.\n" % (e.filename, e.strerror))
+                    f.write("Error: {}, {}\n".format("{}_{}.json".format(lib_name, v), str(e)))
+    if file_cache.n_reused:
+        print("reused {} unchanged files, parsed {}".format(file_cache.n_reused, file_cache.n_parsed))
+    if extraction_cache is not None:
+        print("extraction cache: {}".format(extraction_cache.report()))
+    print(source_store.report())
+    if pf_trees:
+        with open(os.path.join(output_v_dir, EXTRACTOR_STAMP), 'w') as f:
+            f.write(str(EXTRACTOR_VERSION))
+    if profile_store is not None and pf_trees:
+        profile_store.add_version(lib_name, v, pf_trees)
+    remember_version_files(lib_name, file_cache)
+    return pf_trees
 
 
 
@@ -729,7 +977,17 @@ def main():
     parser.add_argument('output_dir_store_src', metavar='output_json_directory', type=str,
                         help='The path for json output')
     parser.add_argument('-n', metavar='parallel_number', type=str,
-                        help='The number of parallel works, default is 15', default=1)
+                        help='The number of libraries profiled at the same time on threads, default is 1', default=1)
+    parser.add_argument('--index', type=str, default=None,
+                        help='Enumerate versions from an index: pypi, a JSON API mirror URL, a local mirror directory or a simple index on disk')
+    parser.add_argument('--parse-workers', type=int, default=1,
+                        help='The number of processes parsing the files of a version, default is 1')
+    parser.add_argument('--extraction-cache', type=str, default=None,
+                        help='An SQLite file caching the extraction results of every parsed file across runs')
+    parser.add_argument('--max-source-memory', type=int, default=None, metavar='MB',
+                        help='Bounded-memory mode: hold at most this many MB of source text at once')
+    parser.add_argument('--profile-store', type=str, default=None,
+                        help='An SQLite file the profiles are also written to, queried by query_profile.py')
     with open("./lib_names.txt") as f:
         lib_list = f.read().splitlines()[:200]
     args = parser.parse_args()
@@ -743,16 +1001,15 @@ def main():
     #            os.path.isdir(os.path.join(database_dir, lib_dir))]
     if './data/sda/pypi_libs/udata' in lib_dirs:
         lib_dirs.remove('/data/sda/pypi_libs/udata')
-    #with multiprocessing.Pool(processes=number) as pool:
-        #pool.starmap(map_API, zip(lib_dirs, repeat(output_dir),repeat(output_dir_store_src)))
-    map_API(lib_dirs[0],output_dir,output_dir_store_src)
+    index = open_index(args.index, requests.Session(), "data/haowei/metadata_cache") if args.index else None
+    extraction_cache = ExtractionCache(args.extraction_cache) if args.extraction_cache else None
+    source_budget = SourceBudget(args.max_source_memory << 20) if args.max_source_memory else None
+    profile_store = ProfileStore(args.profile_store) if args.profile_store else None
+    map_libraries(lib_dirs,output_dir,output_dir_store_src,index,number,args.parse_workers,extraction_cache,
+                  source_budget,profile_store)
 
 if __name__ == '__main__':
     #a,b=process_single_module(r"C:\Users\Bill Quan\Downloads\pandas-0.23.0-cp36-cp36m-manylinux1_x86_64\pandas")
-    #with open(os.path.join(".", "pandas_0.23.0rc22.json"), 'w') as f:
-        #f.write(json.dumps({"api_list": a}))
-    #with open(os.path.join(".", "pandas_0.23.0rc2_alias_map.json"), 'w') as f:
-        #json.dump(b,f)
     # a = map_API("./New folder/requests", "./test_results")
     # print(a)
     main()
\ No newline at end of file
@@ -0,0 +1,213 @@
+import os
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from generate_API_profile import profile_version, SourceBudget
+from aggregate_API_profile import aggregate_profile
+from download_pypi import create_session, HostLimiter, DownloadStats, fetch_release_plan, download_version, \
+    DATA_DIR, CACHE_DIR, METADATA_CACHE_DIR
+from core.index_backend import open_index
+from core.artifact_cache import ArtifactCache
+from core.extraction_cache import ExtractionCache
+from core.profile_store import ProfileStore
+
+# threads writing the shards of a sharded aggregate
+SHARD_WRITERS = 4
+
+
+class LibraryProgress:
+    """Count the versions of each library still to be downloaded and profiled."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.remaining = {}
+        self.n_profiled = 0
+
+    def expect(self, lib_name, n_versions):
+        with self._lock:
+            self.remaining[lib_name] = n_versions
+
+    def done(self, lib_name, profiled):
+        # True when this was the last version of the library
+        with self._lock:
+            self.remaining[lib_name] -= 1
+            if profiled:
+                self.n_profiled += 1
+            return self.remaining[lib_name] == 0
+
+
+class VersionOrder:
+    """Pass the versions of each library on in version order, whatever order their downloads finish in."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._libs = {}
+
+    def expect(self, lib_name, put):
+        # put(item) passes a version on, it is called under the library's lock so no later version overtakes it
+        with self._lock:
+            self._libs[lib_name] = {'lock': threading.Lock(), 'pending': {}, 'next': 0, 'put': put}
+
+    def done(self, lib_name, position, item):
+        # position counts from 0 in version order
+        with self._lock:
+            state = self._libs[lib_name]
+        with state['lock']:
+            state['pending'][position] = item
+            while state['next'] in state['pending']:
+                state['put'](state['pending'].pop(state['next']))
+                state['next'] += 1
+
+
+def run_pipeline(packages, max_versions=6, download_workers=16, profile_workers=4, queue_size=8, per_host=8,
+                 index_spec=None, partial=False, output_dir='./output_profile', output_dir_store_src='./output_agg',
+                 output_dir_aggregate='./output_agg', extraction_cache_path=None, max_source_memory=None,
+                 profile_store_path=None, sharded=False, columnar=False):
+    """Download and profile at the same time.
+
+    Download threads put each finished version on a bounded queue, so they stall when
+    profiling falls behind. Each profiling process has its own queue and dispatcher
+    thread, and gets every version of the libraries assigned to it, in version order,
+    so it can reuse the files unchanged since the previous version. A library is
+    aggregated as soon as its last version is done.
+    """
+    start = time.monotonic()
+    session = create_session(pool_size=max(download_workers, per_host))
+    limiter = HostLimiter(per_host)
+    stats = DownloadStats()
+    cache = ArtifactCache(CACHE_DIR)
+    index = open_index(index_spec, session, METADATA_CACHE_DIR)
+    progress = LibraryProgress()
+    order = VersionOrder()
+    # every profiling process opens its own connection to the same file
+    extraction_cache = ExtractionCache(extraction_cache_path) if extraction_cache_path else None
+    # a ceiling per profiling process
+    source_budget = SourceBudget(max_source_memory << 20) if max_source_memory else None
+    # profiling processes write their versions concurrently, each in one transaction
+    profile_store = ProfileStore(profile_store_path) if profile_store_path else None
+    os.makedirs(output_dir_aggregate, exist_ok=True)
+
+    # one single-process pool per queue, the versions of a library always go to the same process
+    profilers = [ProcessPoolExecutor(max_workers=1) for _ in range(profile_workers)]
+    ready = [queue.Queue(maxsize=max(1, queue_size // profile_workers)) for _ in range(profile_workers)]
+    lib_queue = {}
+
+    def aggregate(lib_name, profiler):
+        print("aggregating {}".format(lib_name))
+        try:
+            profiler.submit(aggregate_profile, lib_name, output_dir, output_dir_aggregate,
+                            output_dir_store_src, sharded, SHARD_WRITERS, columnar).result()
+        except Exception as e:
+            print("Error: aggregating {} failed: {}".format(lib_name, e))
+
+    def download(lib_name, position, version, files):
+        try:
+            ok = download_version(session, limiter, stats, lib_name, version, files, partial=partial, cache=cache)
+        except Exception as e:
+            # the version is skipped, the later ones still go on in order
+            print("Error: downloading {} {} failed: {}".format(lib_name, version, e))
+            ok = False
+        v_dir = os.path.join(str(DATA_DIR), lib_name, version) if ok else None
+        # blocks while the profiler of the library is busy
+        order.done(lib_name, position, (lib_name, version, v_dir))
+
+    def dispatch(ready_queue, profiler):
+        while True:
+            item = ready_queue.get()
+            if item is None:
+                return
+            lib_name, version, v_dir = item
+            profiled = False
+            if v_dir is not None:
+                try:
+                    profiler.submit(profile_version, lib_name, version, v_dir, output_dir,
+                                    output_dir_store_src, None, extraction_cache, source_budget,
+                                    profile_store).result()
+                    profiled = True
+                except Exception as e:
+                    print("Error: profiling {} {} failed: {}".format(lib_name, version, e))
+            if progress.done(lib_name, profiled):
+                aggregate(lib_name, profiler)
+
+    dispatchers = [threading.Thread(target=dispatch, args=(ready[i], profilers[i])) for i in range(profile_workers)]
+    for t in dispatchers:
+        t.start()
+    try:
+        with ThreadPoolExecutor(max_workers=download_workers) as downloader:
+            plan_futures = {downloader.submit(fetch_release_plan, index, lib_name, max_versions): lib_name
+                            for lib_name in packages}
+            download_futures = []
+            for future in as_completed(plan_futures):
+                lib_name = plan_futures[future]
+                try:
+                    tasks = future.result()
+                except Exception as e:
+                    print("Error: cannot get the releases of {}: {}".format(lib_name, e))
+                    continue
+                if not tasks:
+                    continue
+                lib_queue[lib_name] = ready[len(lib_queue) % profile_workers]
+                progress.expect(lib_name, len(tasks))
+                order.expect(lib_name, lib_queue[lib_name].put)
+                for position, (_, version, files) in enumerate(tasks):
+                    download_futures.append(downloader.submit(download, lib_name, position, version, files))
+            for future in as_completed(download_futures):
+                future.result()
+    finally:
+        # the dispatchers finish what is queued and stop, also when planning or a download failed
+        for ready_queue in ready:
+            ready_queue.put(None)
+        for t in dispatchers:
+            t.join()
+        for profiler in profilers:
+            profiler.shutdown()
+        session.close()
+
+    elapsed = time.monotonic() - start
+    print("download: {}".format(stats.report()))
+    print("profiled {} versions of {} libraries in {:.1f}s".format(progress.n_profiled, len(progress.remaining), elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="download, profile and aggregate libraries in one overlapped pass")
+    parser.add_argument('-n', metavar='download_workers', type=int, default=16,
+                        help='The number of download workers, default is 16')
+    parser.add_argument('-p', metavar='profile_workers', type=int, default=os.cpu_count() or 1,
+                        help='The number of profiling processes, default is the number of CPUs')
+    parser.add_argument('--queue-size', type=int, default=8,
+                        help='The max number of downloaded versions waiting to be profiled, default is 8')
+    parser.add_argument('--per-host', type=int, default=8,
+                        help='The max number of concurrent connections per host, default is 8')
+    parser.add_argument('--max-versions', type=int, default=6,
+                        help='The number of latest versions of each library, default is 6')
+    parser.add_argument('--index', type=str, default=None,
+                        help='pypi (default), a JSON API mirror URL, a local mirror directory or a simple index on disk')
+    parser.add_argument('--partial', action='store_true',
+                        help='Only fetch the members of wheels that are profiled, using HTTP Range requests')
+    parser.add_argument('--extraction-cache', type=str, default=None,
+                        help='An SQLite file caching the extraction results of every parsed file across runs')
+    parser.add_argument('--max-source-memory', type=int, default=None, metavar='MB',
+                        help='Bounded-memory mode: each profiling process holds at most this many MB of source text')
+    parser.add_argument('--profile-store', type=str, default=None,
+                        help='An SQLite file the profiles are also written to, queried by query_profile.py')
+    parser.add_argument('--columnar', action='store_true',
+                        help='Also write each aggregate in the columnar format, read by visualize_evolution.py')
+    parser.add_argument('--sharded', action='store_true',
+                        help='Write each aggregate as one shard per top-level subpackage and a manifest')
+    parser.add_argument('--output_path', type=str, default='./output_profile')
+    parser.add_argument('--output_dir_store_src', type=str, default='./output_agg')
+    parser.add_argument('--output_dir_aggregate', type=str, default='./output_agg')
+    args = parser.parse_args()
+
+    with open("./lib_names.txt") as f:
+        packages = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    run_pipeline(packages, max_versions=args.max_versions, download_workers=args.n, profile_workers=args.p,
+                 queue_size=args.queue_size, per_host=args.per_host, index_spec=args.index, partial=args.partial,
+                 output_dir=args.output_path, output_dir_store_src=args.output_dir_store_src,
+                 output_dir_aggregate=args.output_dir_aggregate, extraction_cache_path=args.extraction_cache,
+                 max_source_memory=args.max_source_memory, profile_store_path=args.profile_store,
+                 sharded=args.sharded, columnar=args.columnar)
+
+
+if __name__ == '__main__':
+    main()
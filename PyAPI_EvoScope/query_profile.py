@@ -2,7 +2,9 @@ import pickle
 import json
 import os
 import sys
+import argparse
 from collections import Counter
+from core.profile_store import ProfileStore
 
 # 确保可以导入 aggregate_API_profile 中的类
 try:
@@ -73,7 +75,7 @@ def print_basic_stats(pf_tree):
             print(f"所有版本: {', '.join(sorted(versions))}")
 
 
-def print_api_details(pf_tree, max_apis=10):
+def print_api_details(pf_tree, max_apis=10, source_archive=None):
     """打印API详情"""
     print("\n" + "=" * 60)
     print("  API 详情")
@@ -117,6 +119,11 @@ def print_api_details(pf_tree, max_apis=10):
 
                 if hasattr(api_node, 'source') and api_node.source:
                     print(f"   源码文件: {len(api_node.source)} 个版本")
+                    # 源码按需从打包文件中读取
+                    if source_archive is not None:
+                        latest = list(api_node.source.keys())[-1]
+                        source = get_source(api_node, latest, source_archive)
+                        print(f"   {latest} 源码: {len(source.splitlines())} 行")
 
 
 def print_class_details(pf_tree, max_classes=5):
@@ -178,8 +185,12 @@ def find_api_changes(pf_tree):
         if isinstance(node, AggeragatedAPINode) and hasattr(node, 'kws'):
             param_sets = list(node.kws.values())
 
-            # 检查是否有参数变化
-            if len(set(tuple(p) for p in param_sets)) > 1:
+            # 检查是否有参数变化, 有签名指纹时比较指纹即可
+            if getattr(node, 'signatures', None) and any(node.signatures.values()):
+                changed = len(signature_changes(node)) > 0
+            else:
+                changed = len(set(tuple(p) for p in param_sets)) > 1
+            if changed:
                 changed_apis.append({
                     'api': node.full_name,
                     'param_history': node.kws,
@@ -243,6 +254,8 @@ def export_to_json(pf_tree, lib_name):
                 result['parameters'] = node.kws
             if hasattr(node, 'default_values'):
                 result['default_values'] = node.default_values
+            if hasattr(node, 'signatures'):
+                result['signatures'] = node.signatures
 
         elif isinstance(node, AggeragatedAPIAliasNode) and hasattr(node, 'real_API'):
             real_apis = {}
@@ -290,8 +303,91 @@ def export_to_json(pf_tree, lib_name):
         print(f"\n✗ 导出失败: {e}")
 
 
+def query_profile_store(profile_store, api=None):
+    """用 SQLite 剖面库回答查询, 走索引, 不加载整棵树"""
+    print("\n" + "=" * 60)
+    print("  SQLite 剖面库: " + profile_store.path)
+    print("=" * 60)
+
+    if api:
+        rows = profile_store.lookup(api)
+        if not rows:
+            print(f"\n未找到 {api}")
+            return
+        print(f"\n{api}:")
+        for lib_name, version, kind, signature, source, target in rows:
+            line = f"  {lib_name} {version} {kind}"
+            if signature:
+                line += f" 签名: {signature}"
+            if target:
+                line += f" → {target}"
+            if source:
+                line += f" 源码: {source[:12]}"
+            print(line)
+        aliases = profile_store.aliases_of(api)
+        if aliases:
+            print("\n别名:")
+            for version, alias in aliases:
+                print(f"  {version}: {alias}")
+        return
+
+    for lib_name in profile_store.libraries():
+        versions = profile_store.versions(lib_name)
+        print(f"\n库名: {lib_name}, {len(versions)} 个版本: {', '.join(versions)}")
+        counts = profile_store.kind_counts(lib_name, versions[-1])
+        print(f"  {versions[-1]}: " + ", ".join(f"{kind} {n}" for kind, n in sorted(counts.items())))
+        changed = profile_store.changed_signatures(lib_name)
+        print(f"  签名有变化的API: {len(changed)} 个")
+        for full_name, history in list(changed.items())[:5]:
+            print(f"    {full_name}: " + " → ".join(version for version, _ in history))
+
+
+def query_sharded_profile(sharded, api):
+    """在分片聚合剖面中查询, 只加载涉及的分片"""
+    print("\n" + "=" * 60)
+    print("  分片聚合剖面: " + sharded.path)
+    print("=" * 60)
+
+    nodes = sharded.find(api)
+    if not nodes:
+        print(f"\n未找到 {api}")
+        return
+    for node in nodes:
+        print(f"\n{api} ({type(node).__name__})")
+        print(f"   版本: {', '.join(node.available_versions)}")
+        # 别处分片中的节点只有名字, 不必加载
+        for attr in ('real_API', 'real_class'):
+            for version, target in getattr(node, attr, {}).items():
+                print(f"   {version} → {target.full_name}")
+        if getattr(node, 'kws', None):
+            for version, params in node.kws.items():
+                print(f"   {version}: {params}")
+    references = sharded.references_to(api)
+    if references:
+        print("\n其他分片中的别名:")
+        for ref in references:
+            print(f"   {ref['full_name']} {ref['kind']} ({ref['shard']}): {', '.join(ref['versions'])}")
+    print(f"\n加载的分片: {', '.join(sharded.loaded_shards())} / {len(sharded.shard_names)}")
+
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="query aggregated API profiles")
+    parser.add_argument('--profile-store', type=str, default=None,
+                        help='Answer from an SQLite profile store written by generate_API_profile.py')
+    parser.add_argument('--api', type=str, default=None, help='The full name of an API to look up')
+    args = parser.parse_args()
+    if args.profile_store:
+        query_profile_store(ProfileStore(args.profile_store), args.api)
+        return
+    if args.api:
+        sharded = open_sharded_profile('output_agg', args.api.split('.')[0])
+        if sharded is None:
+            print(f"\nerror: output_agg 中没有 {args.api.split('.')[0]} 的分片聚合剖面")
+            return
+        query_sharded_profile(sharded, args.api)
+        return
+
     print("=" * 60)
     print("PyMevol API 查询工具")
     print("=" * 60)
@@ -305,7 +401,8 @@ def main():
         return
 
     # 2. 查找可用的库
-    lib_files = [f for f in os.listdir('output_agg') if f.endswith('.pickle')]
+    lib_files = [f for f in os.listdir('output_agg') if f.endswith('.pickle') or
+                 is_sharded_profile(os.path.join('output_agg', f))]
 
     if not lib_files:
         print("\nerror: 未找到聚合剖面文件")
@@ -315,22 +412,28 @@ def main():
 
     print(f"\n 找到 {len(lib_files)} 个库:")
     for i, file in enumerate(lib_files, 1):
-        lib_name = file.replace('.pickle', '')
+        lib_name = os.path.splitext(file)[0]
         print(f"  {i}. {lib_name}")
 
     # 3. 加载第一个库
-    first_lib = lib_files[0].replace('.pickle', '')
+    first_lib = os.path.splitext(lib_files[0])[0]
     print(f"\n 正在分析: {first_lib}")
 
     try:
-        with open(f'output_agg/{first_lib}.pickle', 'rb') as f:
-            pf_tree = pickle.load(f)
+        sharded = open_sharded_profile('output_agg', first_lib)
+        if sharded is not None:
+            # 统计要看整棵树, 加载全部分片
+            pf_tree = sharded.tree()
+        else:
+            with open(f'output_agg/{first_lib}.pickle', 'rb') as f:
+                pf_tree = load_profile(f)
 
         print("✓ 数据加载成功")
+        source_archive = open_source_archive('output_agg', first_lib)
 
         # 4. 显示各种信息
         print_basic_stats(pf_tree)
-        print_api_details(pf_tree, max_apis=5)
+        print_api_details(pf_tree, max_apis=5, source_archive=source_archive)
         print_class_details(pf_tree, max_classes=3)
         find_api_changes(pf_tree)
 
@@ -0,0 +1,70 @@
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# the scripts import core.* from the project directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    # mode 'range' honours Range, 'ignore' answers 200 with the whole file,
+    # 'capped' sends at most max_bytes per response, 'stuck' always sends the tail block
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.headers.get('Range'))
+        data = server.files.get(self.path)
+        if data is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        size = len(data)
+        m = re.match(r'bytes=(\d*)-(\d*)', self.headers.get('Range') or '')
+        if m is None or server.mode == 'ignore':
+            self.send_response(200)
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        start, end = m.groups()
+        if server.mode == 'stuck':
+            start, end = max(size - 65536, 0), size - 1
+        elif start == '':
+            start, end = max(size - int(end), 0), size - 1
+        else:
+            start, end = int(start), min(int(end), size - 1) if end else size - 1
+        if start >= size:
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */{}'.format(size))
+            self.end_headers()
+            return
+        if server.mode == 'capped':
+            end = min(end, start + server.max_bytes - 1)
+        body = data[start:end + 1]
+        self.send_response(206)
+        self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, size))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def range_server():
+    """A local HTTP server, files maps a path to its bytes, requests lists the Range headers seen."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _RangeHandler)
+    server.files = {}
+    server.requests = []
+    server.mode = 'range'
+    server.max_bytes = 4096
+    server.url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
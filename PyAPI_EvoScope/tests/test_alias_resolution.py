@@ -0,0 +1,55 @@
+from collections import deque
+
+import pytest
+
+from core.blob_store import BlobStore
+from generate_API_profile import process_single_module
+
+# pkg.a and pkg.b import each other, thing is re-exported through the private pkg.sub._impl
+PACKAGE = {
+    'pkg/__init__.py': 'from .a import *\nfrom .sub import thing\n',
+    'pkg/a.py': 'from .b import *\ndef fa(x): pass\n',
+    'pkg/b.py': 'from .a import fa\nfrom .sub.deep import *\ndef fb(): pass\n',
+    'pkg/sub/__init__.py': 'from ._impl import thing\n',
+    'pkg/sub/_impl.py': 'from .deep import thing\n',
+    'pkg/sub/deep.py': 'def thing(y=1): pass\n',
+    'pkg/sub/up.py': 'from ..b import fb\n',
+}
+
+
+@pytest.fixture
+def profile(tmp_path):
+    for path, source in PACKAGE.items():
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(source)
+    pf_tree, _ = process_single_module(str(tmp_path / 'pkg'), BlobStore.open(str(tmp_path / 'src')))
+    nodes = {}
+    queue = deque([pf_tree])
+    while queue:
+        node = queue.popleft()
+        target = getattr(node, 'real_API', None) or getattr(node, 'real_class', None)
+        nodes[node.full_name] = (type(node).__name__, target.full_name if target is not None else None)
+        queue.extend(getattr(node, 'children', ()))
+    return nodes
+
+
+def test_relative_imports_resolve_to_the_defining_module(profile):
+    assert profile['pkg.sub.deep.thing'] == ('APINode', None)
+    assert profile['pkg.sub.thing'] == ('APIAliasNode', 'pkg.sub.deep.thing')
+    assert profile['pkg.sub.up.fb'] == ('APIAliasNode', 'pkg.b.fb')
+
+
+def test_re_exports_through_a_private_module(profile):
+    # _impl gets no alias nodes of its own, but the chain passes through it
+    assert not any(name.startswith('pkg.sub._impl.') for name in profile)
+    assert profile['pkg.thing'] == ('APIAliasNode', 'pkg.sub.deep.thing')
+
+
+def test_import_cycle(profile):
+    assert profile['pkg.a.fa'] == ('APINode', None)
+    assert profile['pkg.b.fb'] == ('APINode', None)
+    assert profile['pkg.b.fa'] == ('APIAliasNode', 'pkg.a.fa')
+    assert profile['pkg.a.fb'] == ('APIAliasNode', 'pkg.b.fb')
+    assert profile['pkg.a.thing'] == ('APIAliasNode', 'pkg.sub.deep.thing')
+    assert profile['pkg.fa'] == ('APIAliasNode', 'pkg.a.fa')
+    assert profile['pkg.fb'] == ('APIAliasNode', 'pkg.b.fb')
@@ -0,0 +1,93 @@
+import os
+import hashlib
+
+import pytest
+import requests
+
+from core.artifact_cache import ArtifactCache, DigestMismatch
+
+DATA = os.urandom(200000)
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+@pytest.fixture
+def artifact(range_server):
+    range_server.files['/pkg-1.0.tar.gz'] = DATA
+    return range_server.url + '/pkg-1.0.tar.gz'
+
+
+def test_fetch_and_link(artifact, range_server, tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    assert cache.fetch(requests.Session(), artifact, SHA256) == len(DATA)
+    assert cache.fetch(requests.Session(), artifact, SHA256) == 0
+    assert len(range_server.requests) == 1
+
+    dst = str(tmp_path / 'pkg-1.0.tar.gz')
+    cache.link_into(SHA256, dst)
+    assert cache.is_linked(SHA256, dst)
+    assert os.stat(dst).st_nlink == 2
+    with open(dst, 'rb') as f:
+        assert f.read() == DATA
+
+
+def test_fetch_resumes_a_part_file(artifact, range_server, tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    os.makedirs(os.path.dirname(cache.path_for(SHA256)))
+    with open(cache.path_for(SHA256) + '.part', 'wb') as f:
+        f.write(DATA[:70000])
+    assert cache.fetch(requests.Session(), artifact, SHA256) == len(DATA) - 70000
+    assert range_server.requests == ['bytes=70000-']
+    with open(cache.path_for(SHA256), 'rb') as f:
+        assert f.read() == DATA
+
+
+def test_fetch_starts_over_when_range_is_ignored(artifact, range_server, tmp_path):
+    range_server.mode = 'ignore'
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    os.makedirs(os.path.dirname(cache.path_for(SHA256)))
+    with open(cache.path_for(SHA256) + '.part', 'wb') as f:
+        f.write(DATA[:70000])
+    assert cache.fetch(requests.Session(), artifact, SHA256) == len(DATA)
+    with open(cache.path_for(SHA256), 'rb') as f:
+        assert f.read() == DATA
+
+
+def test_fetch_starts_over_when_range_does_not_line_up(artifact, range_server, tmp_path):
+    # the server answers 206 with a block that does not start at the resume offset
+    range_server.mode = 'stuck'
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    os.makedirs(os.path.dirname(cache.path_for(SHA256)))
+    with open(cache.path_for(SHA256) + '.part', 'wb') as f:
+        f.write(DATA[:70000])
+    assert cache.fetch(requests.Session(), artifact, SHA256) == len(DATA)
+    assert range_server.requests == ['bytes=70000-', None]
+    with open(cache.path_for(SHA256), 'rb') as f:
+        assert f.read() == DATA
+
+
+def test_complete_part_file(artifact, range_server, tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    os.makedirs(os.path.dirname(cache.path_for(SHA256)))
+    with open(cache.path_for(SHA256) + '.part', 'wb') as f:
+        f.write(DATA)
+    # the server answers 416, nothing is left to transfer
+    assert cache.fetch(requests.Session(), artifact, SHA256) == 0
+    assert cache.has(SHA256)
+
+
+def test_digest_mismatch_drops_the_part_file(artifact, tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    wrong = hashlib.sha256(b'other').hexdigest()
+    with pytest.raises(DigestMismatch):
+        cache.fetch(requests.Session(), artifact, wrong)
+    assert not cache.has(wrong)
+    assert not os.path.exists(cache.path_for(wrong) + '.part')
+
+
+def test_adopt_existing_download(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+    path = tmp_path / 'pkg-1.0.tar.gz'
+    path.write_bytes(DATA)
+    assert not cache.adopt(str(path), hashlib.sha256(b'other').hexdigest())
+    assert cache.adopt(str(path), SHA256)
+    assert cache.is_linked(SHA256, str(path))
@@ -0,0 +1,65 @@
+from core.artifact_select import parse_wheel_filename, python_tag_version, rank_wheels, select_artifact
+
+
+def files(*names):
+    return [{'filename': name, 'size': 1000} for name in names]
+
+
+def test_parse_wheel_filename():
+    tags = parse_wheel_filename('numpy-1.26.4-1-cp312-cp312-manylinux_2_17_x86_64.manylinux2014_x86_64.whl')
+    assert tags.name == 'numpy' and tags.version == '1.26.4' and tags.build == '1'
+    assert tags.platform_tags == ['manylinux_2_17_x86_64', 'manylinux2014_x86_64']
+    assert parse_wheel_filename('six-1.16.0-py2.py3-none-any.whl').python_tags == ['py2', 'py3']
+    assert parse_wheel_filename('six-1.16.0.tar.gz') is None
+    assert parse_wheel_filename('bad-name.whl') is None
+
+
+def test_python_tag_version():
+    assert python_tag_version('py3') == (3,)
+    assert python_tag_version('cp310') == (3, 10)
+    assert python_tag_version('abi3') == ()
+
+
+def test_rank_wheels():
+    ranked = rank_wheels(files(
+        'pkg-1.0-cp311-cp311-win_amd64.whl',
+        'pkg-1.0-cp311-cp311-macosx_11_0_arm64.whl',
+        'pkg-1.0-cp39-cp39-manylinux2014_x86_64.whl',
+        'pkg-1.0-cp311-cp311-musllinux_1_1_x86_64.whl',
+        'pkg-1.0-cp311-cp311-manylinux2014_x86_64.whl',
+        'pkg-1.0-py2-none-any.whl',
+        'pkg-1.0-py3-none-any.whl',
+    ))
+    # windows and macOS wheels cannot be profiled here, python 2 only wheels come last
+    assert [f['filename'] for f in ranked] == [
+        'pkg-1.0-py3-none-any.whl',
+        'pkg-1.0-cp311-cp311-manylinux2014_x86_64.whl',
+        'pkg-1.0-cp39-cp39-manylinux2014_x86_64.whl',
+        'pkg-1.0-cp311-cp311-musllinux_1_1_x86_64.whl',
+        'pkg-1.0-py2-none-any.whl',
+    ]
+
+
+def test_py2_only_wheel_loses_to_a_binary_py3_wheel():
+    ranked = rank_wheels(files('pkg-1.0-py2-none-any.whl', 'pkg-1.0-cp311-cp311-manylinux2014_x86_64.whl'))
+    assert ranked[0]['filename'] == 'pkg-1.0-cp311-cp311-manylinux2014_x86_64.whl'
+    # py2.py3 wheels are not python 2 only
+    ranked = rank_wheels(files('pkg-1.0-cp311-cp311-manylinux2014_x86_64.whl', 'pkg-1.0-py2.py3-none-any.whl'))
+    assert ranked[0]['filename'] == 'pkg-1.0-py2.py3-none-any.whl'
+
+
+def test_rank_wheels_prefers_the_smaller_of_equal_tags():
+    candidates = [{'filename': 'pkg-1.0-py3-none-any.whl', 'size': 500},
+                  {'filename': 'pkg-1.0-1-py3-none-any.whl', 'size': 100}]
+    assert rank_wheels(candidates)[0]['size'] == 100
+
+
+def test_select_artifact():
+    assert select_artifact(files('pkg-1.0.tar.gz', 'pkg-1.0-py3-none-any.whl'))['filename'] == \
+        'pkg-1.0-py3-none-any.whl'
+    # no linux wheel, the .tar.gz sdist is streamed rather than the .zip
+    only_sdists = files('pkg-1.0-cp311-cp311-win_amd64.whl', 'pkg-1.0.zip', 'pkg-1.0.tar.gz')
+    assert select_artifact(only_sdists)['filename'] == 'pkg-1.0.tar.gz'
+    assert select_artifact(only_sdists, allow_sdist=False) is None
+    assert select_artifact(files('pkg-1.0-cp311-cp311-win_amd64.whl')) is None
+    assert select_artifact([]) is None
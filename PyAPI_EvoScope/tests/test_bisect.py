@@ -0,0 +1,109 @@
+import os
+import json
+import pickle
+
+import pytest
+
+import bisect_API
+from bisect_API import Prober, bisect_API as bisect
+from core.module_extractor import EXTRACTOR_VERSION
+from generate_API_profile import EXTRACTOR_STAMP, ModuleOrPackageNode, Tree
+
+VERSIONS = ['1.0', '1.1', '1.2', '2.0', '2.1', '2.2']
+
+
+class FakeProber:
+    def __init__(self, states):
+        self.states = states
+        self.probed = []
+
+    def has(self, version, API_name):
+        self.probed.append(version)
+        return self.states[version]
+
+
+def test_bisect_finds_the_change():
+    prober = FakeProber({'1.0': False, '1.1': False, '1.2': False, '2.0': True, '2.1': True, '2.2': True})
+    assert bisect('pkg.f', VERSIONS, prober) == ('1.2', '2.0', False)
+    assert len(prober.probed) < len(VERSIONS)
+
+
+def test_bisect_skips_unprofilable_versions():
+    prober = FakeProber({'1.0': True, '1.1': None, '1.2': None, '2.0': None, '2.1': False, '2.2': False})
+    assert bisect('pkg.f', VERSIONS, prober) == ('1.0', '2.1', True)
+
+
+def test_bisect_without_a_change():
+    assert bisect('pkg.f', VERSIONS, FakeProber(dict.fromkeys(VERSIONS, True))) is None
+    assert bisect('pkg.f', VERSIONS, FakeProber(dict.fromkeys(VERSIONS, None))) is None
+
+
+def profile(*names):
+    root = ModuleOrPackageNode('pkg')
+    root.full_name = 'pkg'
+    for name in names:
+        child = Tree(name)
+        child.full_name = 'pkg.' + name
+        root.children.append(child)
+    return root
+
+
+class FakeIndex:
+    def resolve(self, file_info):
+        return file_info
+
+
+@pytest.fixture
+def prober(tmp_path, monkeypatch):
+    calls = {'download': [], 'profile': []}
+
+    def download_version(session, limiter, stats, lib_name, version, files, partial=False, cache=None):
+        calls['download'].append(version)
+        return version != '1.1'
+
+    def profile_version(lib_name, version, v_dir, output_dir, output_dir_store_src):
+        calls['profile'].append(version)
+        return [profile('f', 'g')]
+
+    monkeypatch.setattr(bisect_API, 'download_version', download_version)
+    monkeypatch.setattr(bisect_API, 'profile_version', profile_version)
+    releases = {v: [{'filename': 'pkg-{}-py3-none-any.whl'.format(v)}] for v in VERSIONS}
+    prober = Prober('pkg', releases, FakeIndex(), str(tmp_path / 'out'), str(tmp_path / 'src'), str(tmp_path / 'cache'))
+    prober.calls = calls
+    return prober
+
+
+def write_profile(prober, version, stamp):
+    output_v_dir = os.path.join(prober.output_dir, 'pkg', version)
+    os.makedirs(output_v_dir)
+    with open(os.path.join(output_v_dir, 'pkg.pickle'), 'wb') as f:
+        pickle.dump(profile('old'), f, pickle.HIGHEST_PROTOCOL)
+    if stamp is not None:
+        with open(os.path.join(output_v_dir, EXTRACTOR_STAMP), 'w') as f:
+            f.write(str(stamp))
+
+
+def test_current_profiles_on_disk_are_reused(prober):
+    write_profile(prober, '1.0', EXTRACTOR_VERSION)
+    assert prober.names('1.0') == {'pkg', 'pkg.old'}
+    assert prober.calls['profile'] == []
+
+
+@pytest.mark.parametrize('stamp', [None, EXTRACTOR_VERSION - 1])
+def test_profiles_of_another_extractor_are_profiled_again(prober, stamp):
+    write_profile(prober, '1.0', stamp)
+    assert prober.names('1.0') == {'pkg', 'pkg.f', 'pkg.g'}
+    assert prober.calls['profile'] == ['1.0']
+
+
+def test_probe_cache(prober):
+    assert prober.has('1.0', 'pkg.f') is True
+    assert prober.has('1.0', 'pkg.h') is False
+    assert prober.calls['profile'] == ['1.0']
+    # a failed download is not remembered
+    assert prober.has('1.1', 'pkg.f') is None
+    assert prober.has('1.1', 'pkg.f') is None
+    assert prober.calls['download'] == ['1.0', '1.1', '1.1']
+    with open(prober.cache_file) as f:
+        data = json.load(f)
+    assert data == {'extractor_version': EXTRACTOR_VERSION, 'versions': {'1.0': ['pkg', 'pkg.f', 'pkg.g']}}
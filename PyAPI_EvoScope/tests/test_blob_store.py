@@ -0,0 +1,56 @@
+import os
+import threading
+
+from core.blob_store import BlobStore, is_blob_id, load_source
+from core.compact_node import tree_index
+from generate_API_profile import process_single_module
+
+VERSIONS = {
+    '1.0': {'pkg/__init__.py': 'from .a import f\n',
+            'pkg/a.py': 'def f(x):\n    return x\n\ndef g():\n    pass\n'},
+    # f is unchanged, g changed
+    '1.1': {'pkg/__init__.py': 'from .a import f\n',
+            'pkg/a.py': 'def f(x):\n    return x\n\ndef g(y=1):\n    pass\n'},
+}
+
+
+def profile(tmp_path, version, store):
+    for path, source in VERSIONS[version].items():
+        (tmp_path / version / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / version / path).write_text(source)
+    pf_tree, _ = process_single_module(str(tmp_path / version / 'pkg'), store)
+    return tree_index(pf_tree)
+
+
+def test_unchanged_sources_share_one_blob_across_versions(tmp_path):
+    store = BlobStore.open(str(tmp_path / 'blobs'))
+    old, new = profile(tmp_path, '1.0', store), profile(tmp_path, '1.1', store)
+    f_old, f_new = old[('pkg.a.f', 'api')], new[('pkg.a.f', 'api')]
+    g_old, g_new = old[('pkg.a.g', 'api')], new[('pkg.a.g', 'api')]
+    assert is_blob_id(f_old.source) and f_old.source == f_new.source
+    assert g_old.source != g_new.source
+    assert load_source(g_new.source, store) == 'def g(y=1):\n    pass'
+    blob_files = [name for _, _, files in os.walk(store.root) for name in files]
+    sources = {getattr(node, 'source', None) for index in (old, new) for node in index.values()} - {None, ''}
+    assert len(blob_files) == store.n_written == len(sources)
+    assert store.n_deduplicated > 0
+
+
+def test_one_store_per_root(tmp_path):
+    assert BlobStore.open(str(tmp_path / 'blobs')) is BlobStore.open(str(tmp_path / 'blobs') + '/')
+    assert BlobStore.open(str(tmp_path / 'blobs')) is not BlobStore.open(str(tmp_path / 'other'))
+
+
+def test_concurrent_puts_of_one_text(tmp_path):
+    stores = [BlobStore(str(tmp_path / 'blobs')) for _ in range(8)]
+    ids = []
+    threads = [threading.Thread(target=lambda s=s: ids.append(s.put('def shared(): pass\n'))) for s in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(ids)) == 1
+    # one blob, no temporary files left behind
+    files = [name for _, _, names in os.walk(str(tmp_path / 'blobs')) for name in names]
+    assert len(files) == 1 and not files[0].endswith('.tmp')
+    assert stores[0].get(ids[0]) == 'def shared(): pass\n'
@@ -0,0 +1,146 @@
+import os
+import sys
+import pickle
+from collections import deque
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from aggregate_API_profile import aggregate_profile
+from convert_profile import convert_pickle
+from core.blob_store import BlobStore
+from core.columnar_profile import ColumnarProfile, is_columnar_profile, write_columnar_profile
+from core.compact_node import load_profile
+from generate_API_profile import process_single_module
+
+VERSIONS = {
+    '1.0': {
+        'pkg/__init__.py': 'from .api import get, Session\n',
+        'pkg/api.py': 'def get(url): pass\nclass Session:\n    def send(self, r): pass\n',
+    },
+    '1.1': {
+        'pkg/__init__.py': 'from .api import get\n',
+        'pkg/api.py': 'def get(url, timeout=None): pass\nclass Session:\n    def send(self, r): pass\n',
+    },
+}
+KINDS = {'ModuleOrPackageNode': 'module', 'ClassNode': 'class', 'ClassAliasNode': 'class_alias',
+         'APINode': 'api', 'APIAliasNode': 'api_alias'}
+
+
+def walk(root):
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+        yield node
+        queue.extend(getattr(node, 'children', None) or [])
+
+
+def kind(node):
+    return KINDS[type(node).__name__.replace('Aggeragated', '')]
+
+
+@pytest.fixture(scope='module')
+def trees(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('columnar')
+    source_store = BlobStore.open(str(tmp / 'src' / 'blobs'))
+    profiles = {}
+    for version, files in VERSIONS.items():
+        for path, source in files.items():
+            (tmp / version / path).parent.mkdir(parents=True, exist_ok=True)
+            (tmp / version / path).write_text(source)
+        pf_tree, _ = process_single_module(str(tmp / version / 'pkg'), source_store)
+        os.makedirs(str(tmp / 'profile' / 'lib' / version))
+        with open(str(tmp / 'profile' / 'lib' / version / 'pkg.pickle'), 'wb') as f:
+            pickle.dump(pf_tree, f, pickle.HIGHEST_PROTOCOL)
+        profiles[version] = pf_tree
+    os.makedirs(str(tmp / 'agg'))
+    aggregate_profile('lib', str(tmp / 'profile'), str(tmp / 'agg'), str(tmp / 'src'), columnar=True)
+    with open(str(tmp / 'agg' / 'pkg.pickle'), 'rb') as f:
+        aggregate = load_profile(f)
+    return tmp, profiles, aggregate
+
+
+def test_per_version_profile(trees, tmp_path):
+    _, profiles, _ = trees
+    pf_tree = profiles['1.1']
+    path = str(tmp_path / 'pkg.cols')
+    assert write_columnar_profile(pf_tree, path, '1.1') == len(list(walk(pf_tree)))
+    profile = ColumnarProfile(path)
+    nodes = list(walk(pf_tree))
+    assert profile.versions == ['1.1'] and not profile.aggregated
+    # the columnar view walks like the tree it was written from
+    for node, view in zip(nodes, walk(profile.root())):
+        assert (view.name, view.full_name, view.kind) == (node.name, node.full_name, kind(node))
+        assert profile.signature(view.id, '1.1') == getattr(node, 'signature', None)
+        if view.kind in ('class', 'api'):
+            assert profile.source(view.id, '1.1') == (node.source or None)
+        dst = getattr(node, 'real_API', None) or getattr(node, 'real_class', None)
+        target = profile.target(view.id, '1.1')
+        assert (None if target is None else profile.full_name(target)) == (None if dst is None else dst.full_name)
+    assert len(list(walk(profile.root()))) == len(nodes)
+
+
+def test_aggregate(trees):
+    tmp, _, aggregate = trees
+    path = str(tmp / 'agg' / 'pkg.cols')
+    assert is_columnar_profile(path)
+    profile = ColumnarProfile(path)
+    assert profile.aggregated and profile.versions == ['1.0', '1.1']
+    nodes = list(walk(aggregate))
+    views = list(walk(profile.root()))
+    assert len(views) == len(nodes)
+    for node, view in zip(nodes, views):
+        assert (view.full_name, view.kind, view.available_versions) == \
+            (node.full_name, kind(node), list(node.available_versions))
+        for version in view.available_versions:
+            assert profile.signature(view.id, version) == getattr(node, 'signatures', {}).get(version)
+            for attr in ('real_API', 'real_class'):
+                if version in getattr(node, attr, {}):
+                    assert profile.full_name(profile.target(view.id, version)) == \
+                        getattr(node, attr)[version].full_name
+    # the alias of Session is gone in 1.1
+    alias_ids = [i for i in profile.find('pkg.Session') if profile.kind(i) == 'class_alias']
+    assert [profile.available_versions(i) for i in alias_ids] == [['1.0']]
+    get_ids = [i for i in profile.find('pkg.api.get') if profile.kind(i) == 'api']
+    signatures = [profile.signature(get_ids[0], v) for v in profile.versions]
+    assert signatures[0] != signatures[1]
+
+
+class _OldNode:
+    # the dict-based nodes of old profiles, pickled from a script run as __main__
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+def _old_class(name):
+    cls = type(name, (_OldNode,), {'__module__': '__main__'})
+    cls.__qualname__ = name
+    return cls
+
+
+def test_convert_old_pickle(tmp_path, monkeypatch):
+    classes = {name: _old_class(name) for name in ('ModuleOrPackageNode', 'APINode', 'APIAliasNode')}
+    for name, cls in classes.items():
+        monkeypatch.setattr(sys.modules['__main__'], name, cls, raising=False)
+    api = classes['APINode'](name='get', full_name='pkg.api.get', signature='s1', source='',
+                             kws=['url'], default_values=[])
+    module = classes['ModuleOrPackageNode'](name='api', full_name='pkg.api', children=[api])
+    alias = classes['APIAliasNode'](name='get', full_name='pkg.get', real_API=api)
+    root = classes['ModuleOrPackageNode'](name='pkg', full_name='pkg', children=[module, alias])
+    api.parent, module.parent, alias.parent = module, root, root
+    v_dir = tmp_path / 'lib' / '2.0'
+    v_dir.mkdir(parents=True)
+    with open(str(v_dir / 'pkg.pickle'), 'wb') as f:
+        pickle.dump(root, f)
+
+    output_path, n = convert_pickle(str(v_dir / 'pkg.pickle'))
+    assert output_path == str(v_dir / 'pkg.cols') and n == 4
+    profile = ColumnarProfile(output_path)
+    assert profile.versions == ['2.0']
+    assert [(node.full_name, node.kind) for node in walk(profile.root())] == \
+        [('pkg', 'module'), ('pkg.api', 'module'), ('pkg.get', 'api_alias'), ('pkg.api.get', 'api')]
+    (alias_id,) = profile.find('pkg.get')
+    assert profile.full_name(profile.target(alias_id, '2.0')) == 'pkg.api.get'
+    (api_id,) = profile.find('pkg.api.get')
+    assert profile.signature(api_id, '2.0') == 's1' and profile.source(api_id, '2.0') is None
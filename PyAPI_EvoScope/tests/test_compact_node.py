@@ -0,0 +1,107 @@
+import io
+import pickle
+import sys
+
+import pytest
+
+import aggregate_API_profile
+import generate_API_profile
+from core.compact_node import ProfileUnpickler, load_profile
+from generate_API_profile import APIAliasNode, APINode, ClassNode, ModuleOrPackageNode
+
+
+def small_tree():
+    root, module = ModuleOrPackageNode('pkg'), ModuleOrPackageNode('api')
+    cls, api, alias = ClassNode('Session'), APINode('get'), APIAliasNode('get')
+    root.full_name, module.full_name = 'pkg', 'pkg.api'
+    cls.full_name, api.full_name, alias.full_name = 'pkg.api.Session', 'pkg.api.get', 'pkg.get'
+    api.kws, api.default_values = ['url', 'timeout'], ['None']
+    alias.real_API = api
+    module.children.extend([cls, api])
+    root.children.extend([module, alias])
+    module.parent = alias.parent = root
+    cls.parent = api.parent = module
+    return root
+
+
+def reload(obj):
+    return load_profile(io.BytesIO(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)))
+
+
+def dynamic(name):
+    # a string equal to name that is not the interned object
+    return ''.join(list(name))
+
+
+def test_nodes_carry_no_dict():
+    for node in (ModuleOrPackageNode('m'), ClassNode('C'), APINode('f'), APIAliasNode('f'),
+                 aggregate_API_profile.AggeragatedAPINode('f')):
+        assert not hasattr(node, '__dict__')
+    with pytest.raises(AttributeError):
+        APINode('f').not_a_slot = 1
+
+
+def test_round_trip_keeps_attributes_and_references():
+    loaded = reload(small_tree())
+    module, alias = loaded.children
+    cls, api = module.children
+    assert (cls.full_name, api.full_name, alias.full_name) == ('pkg.api.Session', 'pkg.api.get', 'pkg.get')
+    assert api.kws == ['url', 'timeout'] and api.default_values == ['None']
+    assert alias.real_API is api and api.parent is module and module.parent is loaded
+    # never set before pickling, still missing after
+    assert not hasattr(cls, 'signature') and not hasattr(cls, 'kws')
+    # the child index is rebuilt on use
+    assert not hasattr(module, '_child_index')
+    assert module.child('get') is api
+
+
+def test_names_are_interned_across_loads():
+    first, second = APINode(dynamic('get_all')), APINode(dynamic('get_all'))
+    first.full_name, second.full_name = dynamic('pkg.get_all'), dynamic('pkg.get_all')
+    a, b = reload(first), reload(second)
+    assert a.name is b.name is sys.intern('get_all')
+    assert a.full_name is b.full_name
+
+
+class _OldNode:
+    # the dict-based nodes of old profiles, pickled from a script run as __main__
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+def _old_class(name):
+    cls = type(name, (_OldNode,), {'__module__': '__main__'})
+    cls.__qualname__ = name
+    return cls
+
+
+def test_old_dict_based_pickle_loads_into_slotted_nodes(monkeypatch):
+    names = ('ModuleOrPackageNode', 'APINode', 'AggeragatedAPINode')
+    classes = {name: _old_class(name) for name in names}
+    for name, cls in classes.items():
+        monkeypatch.setattr(sys.modules['__main__'], name, cls, raising=False)
+    api = classes['APINode'](name=dynamic('get'), full_name='pkg.get', kws=['url'], default_values=[])
+    agg = classes['AggeragatedAPINode'](name='get', full_name='pkg.get', available_versions=['1.0'])
+    root = classes['ModuleOrPackageNode'](name='pkg', full_name='pkg', children=[api])
+    api.parent = root
+    data = pickle.dumps((root, agg))
+
+    loaded_root, loaded_agg = ProfileUnpickler(io.BytesIO(data)).load()
+    assert type(loaded_root) is generate_API_profile.ModuleOrPackageNode
+    assert type(loaded_agg) is aggregate_API_profile.AggeragatedAPINode
+    (loaded_api,) = loaded_root.children
+    assert type(loaded_api) is generate_API_profile.APINode
+    assert loaded_api.parent is loaded_root and loaded_api.kws == ['url']
+    assert loaded_api.name is sys.intern('get')
+    assert loaded_agg.available_versions == ['1.0']
+    # attributes the old node never had stay missing
+    assert not hasattr(loaded_api, 'signature')
+    # and a load without the mapping still gets the __main__ classes
+    assert type(pickle.loads(data)[0]) is classes['ModuleOrPackageNode']
+
+
+def test_slots_and_dict_state_are_merged():
+    node = APINode.__new__(APINode)
+    node.__setstate__(({'name': dynamic('f')}, {'full_name': 'm.f', 'kws': []}))
+    assert (node.name, node.full_name, node.kws) == ('f', 'm.f', [])
+    assert node.name is sys.intern('f')
@@ -0,0 +1,90 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import download_pypi
+from download_pypi import DownloadStats, HostLimiter, download_all, download_version
+
+
+class SlowResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield self.body
+
+
+class CountingSession:
+    """Holds every request for a moment and records the most requests in flight per host."""
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self.in_flight = {}
+        self.peak = {}
+
+    def get(self, url, stream=False, timeout=None):
+        host = url.split('/')[2]
+        with self._lock:
+            self.in_flight[host] = self.in_flight.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), self.in_flight[host])
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight[host] -= 1
+        return SlowResponse(url.encode())
+
+
+def test_host_limiter_shares_one_semaphore_per_host():
+    limiter = HostLimiter(per_host=2)
+    assert limiter.get('https://files.example/a.whl') is limiter.get('https://files.example/b.whl')
+    assert limiter.get('https://files.example/a.whl') is not limiter.get('https://mirror.example/a.whl')
+
+
+def test_download_version_respects_the_per_host_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(download_pypi, 'DATA_DIR', tmp_path)
+    session, limiter, stats = CountingSession(), HostLimiter(per_host=2), DownloadStats()
+    # six versions on each of two hosts, all submitted at once
+    tasks = [('pkg', '{}-{}'.format(host, i),
+              [{'filename': 'pkg.tar.gz', 'url': 'https://{}/{}.tar.gz'.format(host, i)}])
+             for i in range(6) for host in ('files.example', 'mirror.example')]
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        results = list(executor.map(lambda task: download_version(session, limiter, stats, *task), tasks))
+    assert all(results)
+    assert session.peak == {'files.example': 2, 'mirror.example': 2}
+    assert stats.files == 12
+    assert stats.bytes == sum(len(files[0]['url']) for _, _, files in tasks)
+
+
+def test_download_stats_from_many_threads():
+    stats = DownloadStats()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(stats.add, [10] * 1000))
+    assert (stats.files, stats.bytes) == (1000, 10000)
+    assert stats.report().startswith('1000 ')
+
+
+def test_download_all_from_a_local_mirror(tmp_path, monkeypatch):
+    mirror = tmp_path / 'mirror'
+    for package in ('alpha', 'beta'):
+        for version in ('1.0', '1.1', '2.0'):
+            (mirror / package / version).mkdir(parents=True)
+            (mirror / package / version / '{}-{}.tar.gz'.format(package, version)).write_bytes(
+                (package + version).encode())
+    monkeypatch.setattr(download_pypi, 'DATA_DIR', tmp_path / 'libs')
+    successful, failed = download_all(['alpha', 'beta', 'missing'], max_versions=2, workers=4, per_host=2,
+                                      cache_dir=tmp_path / 'cache', index_spec=str(mirror),
+                                      metadata_cache_dir=None)
+    assert successful == ['alpha', 'beta']
+    assert failed == ['missing']
+    for package in ('alpha', 'beta'):
+        assert sorted(p.name for p in (tmp_path / 'libs' / package).iterdir()) == ['1.1', '2.0']
+        path = tmp_path / 'libs' / package / '2.0' / '{}-2.0.tar.gz'.format(package)
+        assert path.read_bytes() == (package + '2.0').encode()
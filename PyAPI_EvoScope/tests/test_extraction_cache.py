@@ -0,0 +1,74 @@
+import pickle
+import threading
+
+import core.extraction_cache
+import generate_API_profile
+from core.extraction_cache import ExtractionCache
+from core.source_tree import ArchiveSourceTree
+from generate_API_profile import Tree, extract_file, parse_files
+
+SOURCES = {
+    'pkg/__init__.py': 'from .a import f\n',
+    'pkg/a.py': 'def f(x, y=1):\n    return x\n',
+    'pkg/b.py': 'class B:\n    def m(self): pass\n',
+    # the same bytes as a.py, one row serves both
+    'pkg/copy_of_a.py': 'def f(x, y=1):\n    return x\n',
+}
+
+
+def parsed(cache):
+    tree = ArchiveSourceTree(list(SOURCES), lambda name: SOURCES[name].encode())
+    file_nodes = [(Tree(path.split('/')[-1]), path) for path in SOURCES]
+    parse_files(file_nodes, tree, extraction_cache=cache)
+    return {path: (node.cargo, node.facts.imports, node.facts.spans) for node, path in file_nodes}
+
+
+def test_round_trip_and_counts(tmp_path):
+    cache = ExtractionCache(str(tmp_path / 'cache' / 'facts.sqlite'))
+    facts = extract_file('def f(a, b=2): pass\n')
+    cache.put_many([('d1', facts)])
+    assert cache.get_many(['d1', 'd2', 'd1']) == {'d1': facts}
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert cache.report() == '2 hits, 1 misses (66.7% hit rate)'
+
+
+def test_more_digests_than_one_query(tmp_path):
+    cache = ExtractionCache(str(tmp_path / 'facts.sqlite'))
+    cache.put_many([('d{}'.format(i), ({}, None, {i: i})) for i in range(1200)])
+    found = cache.get_many(['d{}'.format(i) for i in range(1300)])
+    assert len(found) == 1200
+    assert found['d1199'] == ({}, None, {1199: 1199})
+
+
+def test_new_extractor_version_is_a_miss(tmp_path, monkeypatch):
+    cache = ExtractionCache(str(tmp_path / 'facts.sqlite'))
+    cache.put_many([('d1', ({}, None, {}))])
+    monkeypatch.setattr(core.extraction_cache, 'EXTRACTOR_VERSION', core.extraction_cache.EXTRACTOR_VERSION + 1)
+    assert cache.get_many(['d1']) == {}
+    # rows of the new version live next to the old ones
+    cache.put_many([('d1', ({'new': 1}, None, {}))])
+    assert cache.get_many(['d1']) == {'d1': ({'new': 1}, None, {})}
+
+
+def test_second_run_parses_nothing(tmp_path, monkeypatch):
+    path = str(tmp_path / 'facts.sqlite')
+    first = parsed(ExtractionCache(path))
+
+    def no_parse(source):
+        raise AssertionError('parsed a cached file')
+    monkeypatch.setattr(generate_API_profile, 'extract_file', no_parse)
+    cache = ExtractionCache(path)
+    assert parsed(cache) == first
+    assert (cache.hits, cache.misses) == (len(SOURCES), 0)
+
+
+def test_pickled_cache_reopens_the_file(tmp_path):
+    cache = ExtractionCache(str(tmp_path / 'facts.sqlite'))
+    cache.put_many([('d1', ({}, None, {}))])
+    copy = pickle.loads(pickle.dumps(cache))
+    results = []
+    # a connection per thread
+    thread = threading.Thread(target=lambda: results.append(copy.get_many(['d1'])))
+    thread.start()
+    thread.join()
+    assert results == [{'d1': ({}, None, {})}]
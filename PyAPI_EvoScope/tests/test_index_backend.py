@@ -0,0 +1,84 @@
+from core.index_backend import PyPIJSONIndex, is_simple_index
+from core.metadata_cache import MetadataCache
+
+
+def test_simple_index_found_past_other_directories(tmp_path):
+    # directories without an index page must not hide the project that has one
+    for name in ('.cache', 'aaa', 'zzz'):
+        (tmp_path / name).mkdir()
+    (tmp_path / 'requests').mkdir()
+    (tmp_path / 'requests' / 'index.json').write_text('{}')
+    assert is_simple_index(str(tmp_path))
+
+
+def test_directory_mirror_is_not_a_simple_index(tmp_path):
+    (tmp_path / 'requests' / '2.32.0').mkdir(parents=True)
+    (tmp_path / 'requests-2.32.0-py3-none-any.whl').write_bytes(b'')
+    assert not is_simple_index(str(tmp_path))
+
+
+class FakeResponse:
+    def __init__(self, status_code, document=None, headers=None, url=''):
+        self.status_code = status_code
+        self.document = document
+        self.headers = headers or {}
+        self.url = url
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+    def json(self):
+        if self.document is None:
+            raise ValueError('empty body')
+        return self.document
+
+
+class FakeSession:
+    """Answers from a scripted list of responses and records the request headers."""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.sent_headers = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.sent_headers.append(dict(headers or {}))
+        response = self.responses.pop(0)
+        response.url = url
+        return response
+
+
+DOCUMENT = {'releases': {'1.0': [{'filename': 'demo-1.0.tar.gz', 'url': 'https://files.example/demo-1.0.tar.gz',
+                                  'upload_time_iso_8601': '2020-01-01T00:00:00Z', 'packagetype': 'sdist'}]}}
+
+
+def test_etag_is_sent_and_304_served_from_cache(tmp_path):
+    cache = MetadataCache(str(tmp_path))
+    session = FakeSession([FakeResponse(200, DOCUMENT, {'ETag': '"v1"'}), FakeResponse(304)])
+    index = PyPIJSONIndex(session, 'https://pypi.example/pypi/', cache=cache)
+    first = index.releases('demo')
+    second = index.releases('demo')
+    assert second == first
+    assert list(first) == ['1.0']
+    assert 'If-None-Match' not in session.sent_headers[0]
+    assert session.sent_headers[1]['If-None-Match'] == '"v1"'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_304_without_cached_entry_refetches(tmp_path):
+    cache = MetadataCache(str(tmp_path))
+    session = FakeSession([FakeResponse(304), FakeResponse(200, DOCUMENT, {'ETag': '"v2"'})])
+    index = PyPIJSONIndex(session, 'https://pypi.example/pypi/', cache=cache)
+    assert list(index.releases('demo')) == ['1.0']
+    assert len(session.sent_headers) == 2
+    assert 'If-None-Match' not in session.sent_headers[1]
+    assert cache.load('demo')['etag'] == '"v2"'
+
+
+def test_broken_cache_entry_is_a_miss(tmp_path):
+    cache = MetadataCache(str(tmp_path))
+    with open(cache.path_for('demo'), 'w') as f:
+        f.write('{not json')
+    session = FakeSession([FakeResponse(200, DOCUMENT, {'ETag': '"v3"'})])
+    index = PyPIJSONIndex(session, 'https://pypi.example/pypi/', cache=cache)
+    assert list(index.releases('demo')) == ['1.0']
+    assert session.sent_headers[0] == {}
@@ -0,0 +1,77 @@
+import os
+import threading
+from zipfile import ZipFile
+
+import pytest
+
+import generate_API_profile
+from core.compact_node import load_profile, tree_index
+from generate_API_profile import map_libraries
+
+# two libraries of two versions each, both with a module called core
+LIBRARIES = {
+    'alpha': {'1.0': {'alpha/__init__.py': 'from .core import run\n', 'alpha/core.py': 'def run(x): pass\n'},
+              '2.0': {'alpha/__init__.py': 'from .core import *\n',
+                      'alpha/core.py': 'def run(x, y=1): pass\ndef stop(): pass\n'}},
+    'beta': {'0.1': {'beta/__init__.py': '', 'beta/core.py': 'class Core:\n    def go(self): pass\n'},
+             '0.2': {'beta/__init__.py': 'from .core import Core\n',
+                     'beta/core.py': 'class Core:\n    def go(self, fast=False): pass\n'}},
+}
+
+
+def write_wheel(v_dir, name, version, members):
+    v_dir.mkdir(parents=True)
+    with ZipFile(str(v_dir / '{}-{}-py3-none-any.whl'.format(name, version)), 'w') as zf:
+        for member, source in members.items():
+            zf.writestr(member, source)
+        zf.writestr('{}-{}.dist-info/top_level.txt'.format(name, version), name + '\n')
+
+
+@pytest.fixture
+def lib_dirs(tmp_path):
+    for name, versions in LIBRARIES.items():
+        for version, members in versions.items():
+            write_wheel(tmp_path / 'libs' / name / version, name, version, members)
+    return [str(tmp_path / 'libs' / name) for name in LIBRARIES]
+
+
+def profiled(output_dir):
+    result = {}
+    for name, versions in LIBRARIES.items():
+        for version in versions:
+            with open(os.path.join(output_dir, name, version, name + '.pickle'), 'rb') as f:
+                result[name, version] = sorted(map(str, tree_index(load_profile(f))))
+    return result
+
+
+def test_libraries_profiled_on_threads_match_one_at_a_time(lib_dirs, tmp_path, monkeypatch):
+    start_dir = os.getcwd()
+
+    def no_chdir(path):
+        raise AssertionError('profiling changed the working directory')
+    monkeypatch.setattr(os, 'chdir', no_chdir)
+    monkeypatch.setattr(generate_API_profile, 'last_version_files', {})
+
+    # both libraries must be in flight at the same time
+    both_started = threading.Barrier(2, timeout=10)
+    real_profile_version = generate_API_profile.profile_version
+
+    def profile_version(lib_name, v, *args, **kwargs):
+        if v in ('1.0', '0.1'):
+            both_started.wait()
+        return real_profile_version(lib_name, v, *args, **kwargs)
+    monkeypatch.setattr(generate_API_profile, 'profile_version', profile_version)
+
+    threaded = str(tmp_path / 'threaded')
+    map_libraries(lib_dirs, threaded, str(tmp_path / 'src'), workers=2)
+    monkeypatch.setattr(generate_API_profile, 'profile_version', real_profile_version)
+    serial = str(tmp_path / 'serial')
+    map_libraries(lib_dirs, serial, str(tmp_path / 'src'), workers=1)
+
+    assert os.getcwd() == start_dir
+    assert not both_started.broken
+    assert profiled(threaded) == profiled(serial)
+    threaded_profiles = profiled(threaded)
+    assert not any('beta' in key for key in threaded_profiles['alpha', '2.0'])
+    assert "('alpha.core.stop', 'api')" in threaded_profiles['alpha', '2.0']
+    assert "('beta.core.Core.go', 'api')" in threaded_profiles['beta', '0.2']
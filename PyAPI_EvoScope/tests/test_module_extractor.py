@@ -0,0 +1,182 @@
+import ast
+
+import pytest
+
+from core.module_extractor import ModuleExtractor, import_table, line_starts, slice_span
+from core.source_visitor import SourceVisitor
+
+SOURCES = {
+    'plain': '''
+from . import a, b
+from .x.y import z
+import os
+
+def f(a, b=1, *args, c=None, **kw):
+    def inner(q):
+        pass
+    return a
+
+class A:
+    def m(self, x=(1, 2)):
+        pass
+
+    def m(self):
+        pass
+''',
+    'decorated': '''
+import functools
+
+def deco(fn):
+    return fn
+
+@deco
+@functools.lru_cache(maxsize=None)
+def cached(n,
+           base=10,
+           *,
+           strict=False):
+    return n
+
+class B:
+    @property
+    def value(self):
+        return 1
+
+    @staticmethod
+    def make(
+        x,
+        y="a, b",
+    ):
+        from ..pkg import thing
+        return x
+''',
+    'nested': '''
+class Outer:
+    x = 1
+
+    class Inner:
+        def deep(self, d=None):
+            pass
+
+        class Innermost:
+            def deepest(self):
+                pass
+
+    def method(self):
+        class Local:
+            def hidden(self):
+                pass
+        return Local
+
+def factory():
+    class Made:
+        def made(self):
+            pass
+    return Made
+
+class Outer:
+    def second(self):
+        pass
+''',
+    'non_ascii': '''
+def grüße(name="wörld", sep="—"):
+    """Grüße an ☃."""
+    return "héllo " + name
+
+class Ünïcode:
+    def método(self, ñ=1): return ñ
+''',
+}
+SOURCES['crlf'] = SOURCES['decorated'].replace('\n', '\r\n')
+SOURCES['non_ascii_crlf'] = SOURCES['non_ascii'].replace('\n', '\r\n')
+
+
+# the visitors the extractor replaced, each walked the module or class again
+class GetFunctionNodeVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.result = {}
+
+    def visit_FunctionDef(self, node):
+        if node.name not in self.result:
+            self.result[node.name] = node
+        return node
+
+
+class GetClassNodeVisitor(ast.NodeVisitor):
+    def __init__(self):
+        self.result = {}
+
+    def visit_ClassDef(self, node):
+        self.result[node.name] = node
+        return node
+
+
+def extract(source):
+    tree = ast.parse(source)
+    extractor = ModuleExtractor()
+    extractor.visit(tree)
+    return tree, extractor
+
+
+@pytest.mark.parametrize('name', sorted(SOURCES))
+def test_same_as_the_separate_visitors(name):
+    source = SOURCES[name]
+    tree, extractor = extract(source)
+    visitor = SourceVisitor()
+    visitor.visit(tree)
+    assert extractor.cargo == visitor.result
+
+    functions = GetFunctionNodeVisitor()
+    functions.visit(tree)
+    assert extractor.functions == functions.result
+    classes = GetClassNodeVisitor()
+    classes.visit(tree)
+    assert extractor.classes == classes.result
+    for class_node in classes.result.values():
+        methods = GetFunctionNodeVisitor()
+        methods.visit(class_node)
+        assert extractor.methods[class_node] == methods.result
+
+    assert extractor.import_froms == [node for node in ast.walk(tree) if isinstance(node, ast.ImportFrom)]
+
+
+@pytest.mark.parametrize('name', sorted(SOURCES))
+def test_slices_match_get_source_segment(name):
+    source = SOURCES[name]
+    tree, extractor = extract(source)
+    spans = extractor.spans()
+    assert spans
+    starts = line_starts(source)
+    for (class_name, func_name), span in spans.items():
+        if class_name is None:
+            node = extractor.functions[func_name]
+        elif func_name is None:
+            node = extractor.classes[class_name]
+        else:
+            node = extractor.methods[extractor.classes[class_name]][func_name]
+        assert slice_span(source, starts, span) == ast.get_source_segment(source, node)
+
+
+def test_cargo_keywords_and_defaults():
+    _, extractor = extract(SOURCES['decorated'])
+    arg_names, defaults, fingerprint = extractor.cargo['cached']
+    assert arg_names == ['n', 'base'] and defaults == ['10']
+    assert extractor.cargo['B']['make'][:2] == (['x', 'y'], ["'a, b'"])
+    # the keyword-only default is part of the fingerprint
+    _, other = extract(SOURCES['decorated'].replace('strict=False', 'strict=True'))
+    assert other.cargo['cached'][2] != fingerprint
+    _, extractor = extract(SOURCES['non_ascii'])
+    assert extractor.cargo['grüße'][:2] == (['name', 'sep'], ["'wörld'", "'—'"])
+
+
+def test_nested_classes():
+    _, extractor = extract(SOURCES['nested'])
+    # the last top-level Outer wins, nested classes are not top-level names
+    assert set(extractor.classes) == {'Outer', 'Made'}
+    assert list(extractor.cargo['Outer']) == ['second']
+    assert set(extractor.cargo) == {'Outer', 'factory'}
+
+
+def test_import_table():
+    tree, extractor = extract(SOURCES['plain'] + SOURCES['decorated'])
+    assert import_table(extractor.import_froms) == {'.': ['a', 'b'], '.x.y': ['z'], '..pkg': ['thing']}
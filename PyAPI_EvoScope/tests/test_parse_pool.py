@@ -0,0 +1,71 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from core.blob_store import BlobStore
+from core.compact_node import tree_index
+from core.source_tree import ArchiveSourceTree
+from generate_API_profile import SourceBudget, Tree, parse_files, process_single_module
+
+SOURCES = {
+    'pkg/__init__.py': 'from .a import f\nfrom .b import *\n',
+    'pkg/a.py': 'import os\n\n@decorator\ndef f(x, *args, y=os.sep, **kw):\n    return x\n',
+    'pkg/b.py': 'class B(object):\n    def __init__(self, z=[1, 2]):\n        pass\n\n    def m(self):\n'
+                '        pass\n\ndef g():\n    pass\n',
+    'pkg/c.py': 'from .a import f as alias\nCONST = 1\n',
+    'pkg/broken.py': 'def (:\n',
+}
+
+
+class CountingPool:
+    """Runs map in a real process pool and counts the calls."""
+    def __init__(self, pool):
+        self.pool = pool
+        self.n_maps = 0
+
+    def map(self, fn, *iterables, **kwargs):
+        self.n_maps += 1
+        return self.pool.map(fn, *iterables, **kwargs)
+
+
+@pytest.fixture(scope='module')
+def pool():
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        yield executor
+
+
+def source_tree():
+    return ArchiveSourceTree(list(SOURCES), lambda name: SOURCES[name].encode())
+
+
+def parsed(parse_pool=None, source_budget=None):
+    tree = source_tree()
+    file_nodes = [(Tree(path.split('/')[-1]), path) for path in SOURCES]
+    parse_files(file_nodes, tree, parse_pool=parse_pool, source_budget=source_budget)
+    return {path: (node.cargo, node.facts.imports, node.facts.spans) for node, path in file_nodes}
+
+
+def test_pool_gives_the_same_facts(pool):
+    counting = CountingPool(pool)
+    assert parsed(counting) == parsed()
+    assert counting.n_maps == 1
+    assert parsed()['pkg/broken.py'] == ({}, None, {})
+
+
+def test_pool_per_batch_under_a_budget(pool):
+    counting = CountingPool(pool)
+    # batches of about 100 bytes of source, each parsed in the pool
+    assert parsed(counting, SourceBudget(100)) == parsed()
+    assert counting.n_maps >= 2
+
+
+def test_profile_with_a_pool(pool, tmp_path):
+    for path, source in SOURCES.items():
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(source)
+    serial, _ = process_single_module(str(tmp_path / 'pkg'), BlobStore.open(str(tmp_path / 'serial')))
+    pooled, _ = process_single_module(str(tmp_path / 'pkg'), BlobStore.open(str(tmp_path / 'pooled')), parse_pool=pool)
+    assert list(tree_index(pooled)) == list(tree_index(serial))
+    keys = [key for key in tree_index(serial) if isinstance(key, tuple)]
+    for key in keys:
+        assert getattr(tree_index(pooled)[key], 'kws', None) == getattr(tree_index(serial)[key], 'kws', None)
@@ -0,0 +1,49 @@
+import time
+import threading
+
+from pipeline import LibraryProgress, VersionOrder
+
+
+def test_versions_are_passed_on_in_order():
+    passed = []
+
+    def put(item):
+        # a slow put, a later version finishing meanwhile must wait for it
+        if item == 0:
+            time.sleep(0.1)
+        passed.append(item)
+
+    order = VersionOrder()
+    order.expect('lib', put)
+    order.done('lib', 1, 1)
+    assert passed == []
+    first = threading.Thread(target=order.done, args=('lib', 0, 0))
+    first.start()
+    time.sleep(0.02)
+    second = threading.Thread(target=order.done, args=('lib', 2, 2))
+    second.start()
+    first.join()
+    second.join()
+    assert passed == [0, 1, 2]
+
+
+def test_many_threads_finishing_out_of_order():
+    passed = {'a': [], 'b': []}
+    order = VersionOrder()
+    for lib_name in passed:
+        order.expect(lib_name, passed[lib_name].append)
+    threads = [threading.Thread(target=order.done, args=(lib_name, position, position))
+               for position in reversed(range(50)) for lib_name in passed]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert passed == {'a': list(range(50)), 'b': list(range(50))}
+
+
+def test_library_progress():
+    progress = LibraryProgress()
+    progress.expect('lib', 2)
+    assert not progress.done('lib', True)
+    assert progress.done('lib', False)
+    assert progress.n_profiled == 1
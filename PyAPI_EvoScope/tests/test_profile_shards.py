@@ -0,0 +1,115 @@
+import os
+import pickle
+from collections import deque
+
+import pytest
+
+from aggregate_API_profile import aggregate_profile, open_sharded_profile
+from core.blob_store import BlobStore, is_blob_id
+from core.compact_node import load_profile
+from core.profile_shards import ROOT_SHARD
+from generate_API_profile import process_single_module
+
+VERSIONS = {
+    '1.0': {
+        'pkg/__init__.py': 'from .core.api import get\nfrom .util import helper\n',
+        'pkg/core/__init__.py': '',
+        'pkg/core/api.py': 'def get(url, timeout=None): pass\n'
+                           'class Session:\n    def __init__(self, a): pass\n    def send(self, r): pass\n',
+        'pkg/util/__init__.py': 'from .text import helper\n',
+        'pkg/util/text.py': 'def helper(s): pass\n',
+        'pkg/util/compat.py': 'from ..core.api import Session\n',
+    },
+    '2.0': {
+        'pkg/__init__.py': 'from .core.api import get, post\nfrom .util import helper\n',
+        'pkg/core/__init__.py': '',
+        'pkg/core/api.py': 'def get(url, timeout=10, verify=True): pass\ndef post(url): pass\n'
+                           'class Session:\n    def __init__(self, a): pass\n    def send(self, r): pass\n',
+        'pkg/util/__init__.py': 'from .text import helper\n',
+        'pkg/util/text.py': 'def helper(s, sep=" "): pass\n',
+        'pkg/util/compat.py': 'from ..core.api import Session\n',
+    },
+}
+
+
+def fingerprint(root):
+    lines = []
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+        refs = [(attr, sorted((v, t.full_name, type(t).__name__) for v, t in getattr(node, attr).items()))
+                for attr in ('real_API', 'real_class') if getattr(node, attr, None)]
+        parent = node.parent.full_name if getattr(node, 'parent', None) is not None else None
+        lines.append((type(node).__name__, node.full_name, parent, node.available_versions,
+                      getattr(node, 'kws', None), getattr(node, 'source', None), refs))
+        queue.extend(getattr(node, 'children', None) or [])
+    return lines
+
+
+@pytest.fixture(scope='module')
+def aggregates(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('shards')
+    source_store = BlobStore.open(str(tmp / 'src' / 'blobs'))
+    for version, files in VERSIONS.items():
+        for path, source in files.items():
+            (tmp / version / path).parent.mkdir(parents=True, exist_ok=True)
+            (tmp / version / path).write_text(source)
+        pf_tree, _ = process_single_module(str(tmp / version / 'pkg'), source_store)
+        os.makedirs(str(tmp / 'profile' / 'lib' / version))
+        with open(str(tmp / 'profile' / 'lib' / version / 'pkg.pickle'), 'wb') as f:
+            pickle.dump(pf_tree, f, pickle.HIGHEST_PROTOCOL)
+    for name, sharded in (('mono', False), ('sharded', True)):
+        os.makedirs(str(tmp / name))
+        aggregate_profile('lib', str(tmp / 'profile'), str(tmp / name), str(tmp / 'src'), sharded=sharded, workers=2)
+    with open(str(tmp / 'mono' / 'pkg.pickle'), 'rb') as f:
+        mono = load_profile(f)
+    return mono, str(tmp / 'sharded')
+
+
+def test_round_trip(aggregates):
+    mono, sharded_dir = aggregates
+    profile = open_sharded_profile(sharded_dir, 'pkg')
+    # the root shard first, then one per module or subpackage of the top level
+    assert profile.shard_names[0] == ROOT_SHARD
+    assert sorted(profile.shard_names[1:]) == ['__init__', 'core', 'util']
+    assert profile.versions == ['1.0', '2.0']
+    assert fingerprint(profile.tree()) == fingerprint(mono)
+
+
+def test_find_loads_one_shard(aggregates):
+    _, sharded_dir = aggregates
+    profile = open_sharded_profile(sharded_dir, 'pkg')
+    nodes = profile.find('pkg.core.api.post')
+    assert [node.available_versions for node in nodes] == [['2.0']]
+    assert sorted(profile.loaded_shards()) == sorted([ROOT_SHARD, 'core'])
+
+
+def test_cross_shard_references(aggregates):
+    _, sharded_dir = aggregates
+    profile = open_sharded_profile(sharded_dir, 'pkg')
+    refs = profile.references_to('pkg.core.api.Session')
+    # the class alias and the alias of its constructor
+    assert sorted((ref['shard'], ref['full_name'], ref['kind'], ref['versions']) for ref in refs) == \
+        [('util', 'pkg.util.compat.Session', 'APIAliasNode', ['1.0', '2.0']),
+         ('util', 'pkg.util.compat.Session', 'ClassAliasNode', ['1.0', '2.0'])]
+    # loading the util shard alone leaves the alias target unresolved until asked for
+    alias = [node for node in profile.nodes('util') if node.full_name == 'pkg.util.compat.Session' and
+             getattr(node, 'real_class', None)][0]
+    assert 'core' not in profile.loaded_shards()
+    target = profile.resolve(alias.real_class['1.0'])
+    assert target.full_name == 'pkg.core.api.Session'
+    assert 'core' in profile.loaded_shards()
+
+
+def test_shard_source_archives(aggregates):
+    _, sharded_dir = aggregates
+    profile = open_sharded_profile(sharded_dir, 'pkg')
+    n_sources = 0
+    for name in profile.shard_names:
+        archive = profile.source_archive(name)
+        for node in profile.nodes(name):
+            for value in (getattr(node, 'source', None) or {}).values():
+                if is_blob_id(value['source']):
+                    assert value['source'] in archive
+                    n_sources += 1
+    assert n_sources > 0
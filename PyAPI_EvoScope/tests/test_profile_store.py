@@ -0,0 +1,74 @@
+import pickle
+import threading
+
+import pytest
+
+from core.blob_store import BlobStore
+from core.profile_store import ProfileStore
+from generate_API_profile import process_single_module
+
+VERSIONS = {
+    '1.9': {
+        'pkg/__init__.py': 'from .api import get, Session\n',
+        'pkg/api.py': 'def get(url): pass\nclass Session:\n    def __init__(self): pass\n',
+    },
+    '1.10': {
+        'pkg/__init__.py': 'from .api import get, Session\nfrom .api import post\n',
+        'pkg/api.py': 'def get(url, timeout=None): pass\ndef post(url): pass\n'
+                      'class Session:\n    def __init__(self): pass\n',
+    },
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+    source_store = BlobStore.open(str(tmp_path / 'src'))
+    store = ProfileStore(str(tmp_path / 'db' / 'profiles.sqlite'))
+    for version, files in VERSIONS.items():
+        for path, source in files.items():
+            (tmp_path / version / path).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / version / path).write_text(source)
+        pf_tree, _ = process_single_module(str(tmp_path / version / 'pkg'), source_store)
+        store.add_version('lib', version, [pf_tree])
+    return store
+
+
+def test_versions_in_version_order(store):
+    assert store.libraries() == ['lib']
+    assert store.versions('lib') == ['1.9', '1.10']
+    assert store.available_versions('lib', 'pkg.api.post') == ['1.10']
+    assert store.available_versions('lib', 'pkg.api.get') == ['1.9', '1.10']
+
+
+def test_lookup(store):
+    rows = store.lookup('pkg.get')
+    assert [(lib, version, kind, target) for lib, version, kind, _, _, target in rows] == \
+        [('lib', '1.9', 'api_alias', 'pkg.api.get'), ('lib', '1.10', 'api_alias', 'pkg.api.get')]
+    (_, _, kind, signature, source, _), = store.lookup('pkg.api.post')
+    assert kind == 'api' and signature and source
+
+
+def test_aliases_and_signatures(store):
+    assert store.aliases_of('pkg.api.post') == [('1.10', 'pkg.post')]
+    assert store.aliases_of('pkg.api.Session') == [('1.9', 'pkg.Session'), ('1.10', 'pkg.Session')]
+    changed = store.changed_signatures('lib')
+    assert list(changed) == ['pkg.api.get']
+    assert [version for version, _ in changed['pkg.api.get']] == ['1.9', '1.10']
+
+
+def test_add_version_replaces_it(store, tmp_path):
+    counts = store.kind_counts('lib', '1.10')
+    pf_tree, _ = process_single_module(str(tmp_path / '1.10' / 'pkg'), BlobStore.open(str(tmp_path / 'src')))
+    store.add_version('lib', '1.10', [pf_tree])
+    assert store.kind_counts('lib', '1.10') == counts
+    assert counts['api'] >= 3
+
+
+def test_pickled_store_and_threads(store):
+    # a worker gets the store pickled and opens its own connection to the same file
+    copy = pickle.loads(pickle.dumps(store))
+    results = []
+    thread = threading.Thread(target=lambda: results.append(copy.versions('lib')))
+    thread.start()
+    thread.join()
+    assert results == [['1.9', '1.10']]
@@ -0,0 +1,111 @@
+import io
+import os
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+import pytest
+import requests
+
+import download_pypi
+from core.remote_zip import HTTPRangeFile, RangeNotSupported, open_remote_wheel, write_slim_wheel
+
+SOURCES = {
+    'pkg/__init__.py': b'from .mod import f\n',
+    'pkg/mod.py': b'def f(a, b=1):\n    return a + b\n' * 200,
+    'pkg/sub/__init__.py': b'',
+}
+
+
+def make_wheel():
+    buffer = io.BytesIO()
+    with ZipFile(buffer, 'w') as zf:
+        # a large binary outside the top-level package, it must not be fetched
+        zf.writestr('pkg.libs/big.so', os.urandom(1 << 20), ZIP_STORED)
+        for name, data in SOURCES.items():
+            zf.writestr(name, data, ZIP_DEFLATED)
+        zf.writestr('pkg/data.bin', os.urandom(1 << 18), ZIP_STORED)
+        zf.writestr('pkg-1.0.dist-info/top_level.txt', b'pkg\n')
+        zf.writestr('pkg-1.0.dist-info/RECORD', b'pkg/__init__.py,sha256=x,19\n')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def wheel(range_server):
+    data = make_wheel()
+    range_server.files['/pkg-1.0-py3-none-any.whl'] = data
+    return range_server.url + '/pkg-1.0-py3-none-any.whl', data
+
+
+def test_slim_wheel_from_range_requests(wheel, tmp_path):
+    url, data = wheel
+    zip_obj, fileobj = open_remote_wheel(url, requests.Session())
+    assert isinstance(fileobj, HTTPRangeFile)
+    with zip_obj:
+        top_levels = write_slim_wheel(zip_obj, fileobj, 'pkg', str(tmp_path / 'slim.whl'))
+    assert top_levels == ['pkg']
+    with ZipFile(str(tmp_path / 'slim.whl')) as slim:
+        for name, content in SOURCES.items():
+            assert slim.read(name) == content
+        # non .py members are kept as empty placeholders
+        assert slim.read('pkg/data.bin') == b''
+        assert 'pkg.libs/big.so' not in slim.namelist()
+    assert fileobj.bytes_fetched < len(data) // 4
+
+
+def test_full_download_when_range_is_ignored(wheel, range_server, tmp_path):
+    url, data = wheel
+    range_server.mode = 'ignore'
+    zip_obj, fileobj = open_remote_wheel(url, requests.Session())
+    assert not isinstance(fileobj, HTTPRangeFile)
+    assert fileobj.bytes_fetched == len(data)
+    with zip_obj:
+        write_slim_wheel(zip_obj, fileobj, 'pkg', str(tmp_path / 'slim.whl'))
+    with ZipFile(str(tmp_path / 'slim.whl')) as slim:
+        assert slim.read('pkg/mod.py') == SOURCES['pkg/mod.py']
+
+
+def test_capped_responses_are_completed(wheel, range_server):
+    url, data = wheel
+    range_server.mode = 'capped'
+    fileobj = HTTPRangeFile(url, requests.Session(), block_size=4096)
+    fileobj.seek(1000)
+    assert fileobj.read(20000) == data[1000:21000]
+
+
+def test_stuck_server_raises_range_not_supported(wheel, range_server):
+    url, data = wheel
+    fileobj = HTTPRangeFile(url, requests.Session())
+    range_server.mode = 'stuck'
+    fileobj.seek(0)
+    with pytest.raises(RangeNotSupported):
+        fileobj.read(100)
+
+
+def test_chunks_are_merged_and_reused(wheel, range_server):
+    url, data = wheel
+    fileobj = HTTPRangeFile(url, requests.Session(), block_size=1024)
+    fileobj.prefetch([(0, 1000)], max_gap=0)
+    fileobj.prefetch([(1000, 3000)], max_gap=0)
+    fileobj.prefetch([(500, 2000), (5000, 6000)], max_gap=0)
+    assert fileobj._starts == [0, 5000, len(data) - 1024]
+    assert [len(chunk) for chunk in fileobj._chunks] == [3000, 1000, 1024]
+    # a read across two prefetched neighbours is served from the cache
+    n_requests = fileobj.n_requests
+    fileobj.seek(900)
+    assert fileobj.read(1200) == data[900:2100]
+    assert fileobj.n_requests == n_requests
+    # only the gap between two chunks is fetched
+    fileobj.seek(2500)
+    assert fileobj.read(3000) == data[2500:5500]
+    assert range_server.requests[-1] == 'bytes=3000-4999'
+    assert fileobj._starts == [0, len(data) - 1024]
+
+
+def test_download_version_falls_back_to_full_download(wheel, range_server, tmp_path, monkeypatch):
+    url, data = wheel
+    range_server.mode = 'stuck'
+    monkeypatch.setattr(download_pypi, 'DATA_DIR', tmp_path)
+    files = [{'filename': 'pkg-1.0-py3-none-any.whl', 'url': url}]
+    ok = download_pypi.download_version(requests.Session(), download_pypi.HostLimiter(),
+                                        download_pypi.DownloadStats(), 'pkg', '1.0', files, partial=True)
+    assert ok
+    assert (tmp_path / 'pkg' / '1.0' / 'pkg-1.0-py3-none-any.whl').read_bytes() == data
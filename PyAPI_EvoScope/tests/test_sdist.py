@@ -0,0 +1,133 @@
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+from core.sdist import open_sdist, sdist_entry_points
+
+
+def write_sdist(path, files):
+    if str(path).endswith('.zip'):
+        with zipfile.ZipFile(str(path), 'w') as zf:
+            for name, content in files.items():
+                zf.writestr(name, content)
+        return str(path)
+    with tarfile.open(str(path), 'w:gz') as tar:
+        for name, content in files.items():
+            data = content.encode()
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+def entry_points(tmp_path, l_name, files, archive='lib-1.0.tar.gz'):
+    files = {'lib-1.0/' + name: content for name, content in files.items()}
+    with open_sdist(write_sdist(tmp_path / archive, files)) as source_tree:
+        return sdist_entry_points(source_tree, l_name)
+
+
+def test_egg_info_top_level(tmp_path):
+    assert entry_points(tmp_path, 'lib', {
+        'setup.py': '',
+        'src/lib.egg-info/top_level.txt': 'alpha\nbeta\n',
+        'src/alpha/__init__.py': '',
+        'src/beta.py': '',
+    }) == ['lib-1.0/src/alpha', 'lib-1.0/src/beta.py']
+
+
+def test_setup_cfg_with_package_dir(tmp_path):
+    assert entry_points(tmp_path, 'lib', {
+        'setup.cfg': '[options]\npackage_dir =\n    =src\npackages = mypkg, mypkg.sub\npy_modules = single\n',
+        'src/mypkg/__init__.py': '',
+        'src/mypkg/sub/__init__.py': '',
+        'src/single.py': '',
+    }) == ['lib-1.0/src/mypkg', 'lib-1.0/src/single.py']
+
+
+def test_setup_cfg_find_falls_back_to_the_layout(tmp_path):
+    assert entry_points(tmp_path, 'lib', {
+        'setup.cfg': '[options]\npackages = find:\n',
+        'lib/__init__.py': '',
+        'tests/__init__.py': '',
+    }) == ['lib-1.0/lib']
+
+
+def test_pyproject_hatch(tmp_path):
+    assert entry_points(tmp_path, 'attrs', {
+        'pyproject.toml': '[tool.hatch.build.targets.wheel]\npackages = ["src/attr", "src/attrs"]\n',
+        'src/attr/__init__.py': '',
+        'src/attrs/__init__.py': '',
+    }) == ['lib-1.0/src/attr', 'lib-1.0/src/attrs']
+
+
+def test_pyproject_setuptools_find(tmp_path):
+    assert entry_points(tmp_path, 'lib', {
+        'pyproject.toml': '[tool.setuptools.packages.find]\nwhere = ["src"]\n',
+        'src/lib/__init__.py': '',
+        'src/other/__init__.py': '',
+    }) == ['lib-1.0/src/lib']
+
+
+def test_src_layout(tmp_path):
+    # no metadata, every package found under src/ when none is named after the library
+    assert entry_points(tmp_path, 'lib', {
+        'setup.py': 'from setuptools import setup\nsetup()\n',
+        'src/one/__init__.py': '',
+        'src/two/__init__.py': '',
+        'src/notapkg/data.txt': '',
+    }) == ['lib-1.0/src/one', 'lib-1.0/src/two']
+
+
+def test_setup_py_only_package(tmp_path):
+    assert entry_points(tmp_path, 'My-Lib', {
+        'setup.py': '',
+        'conftest.py': '',
+        'my_lib/__init__.py': '',
+        'other/__init__.py': '',
+        'tests/__init__.py': '',
+        'docs/conf.py': '',
+    }) == ['lib-1.0/my_lib']
+
+
+def test_setup_py_only_module(tmp_path):
+    assert entry_points(tmp_path, 'six', {
+        'setup.py': '',
+        'test_six.py': '',
+        'six.py': '',
+    }) == ['lib-1.0/six.py']
+
+
+def test_nothing_found(tmp_path):
+    assert entry_points(tmp_path, 'lib', {
+        'setup.py': '',
+        'README.rst': '',
+        'tests/__init__.py': '',
+    }) is None
+
+
+def test_zip_sdist(tmp_path):
+    assert entry_points(tmp_path, 'lib', {
+        'lib.egg-info/top_level.txt': 'lib\n',
+        'lib/__init__.py': '',
+    }, archive='lib-1.0.zip') == ['lib-1.0/lib']
+
+
+def test_tar_keeps_only_the_sources_of_the_packages(tmp_path):
+    path = write_sdist(tmp_path / 'lib-1.0.tar.gz', {
+        'lib-1.0/setup.cfg': '[options]\npackages = lib\n',
+        'lib-1.0/lib/__init__.py': 'x = 1\n',
+        'lib-1.0/lib/data.txt': 'data',
+        'lib-1.0/tests/test_lib.py': 'def test(): pass\n',
+    })
+    with open_sdist(path) as source_tree:
+        points = sdist_entry_points(source_tree, 'lib')
+        source_tree.keep_sources(points)
+        assert source_tree.read_bytes('lib-1.0/lib/__init__.py') == b'x = 1\n'
+        # listed, so the tree keeps its shape, but never buffered
+        assert source_tree.isfile('lib-1.0/tests/test_lib.py')
+        with pytest.raises(FileNotFoundError):
+            source_tree.read_bytes('lib-1.0/tests/test_lib.py')
+        with pytest.raises(FileNotFoundError):
+            source_tree.read_bytes('lib-1.0/lib/data.txt')
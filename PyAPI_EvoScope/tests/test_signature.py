@@ -0,0 +1,65 @@
+import ast
+
+import pytest
+
+from core.blob_store import BlobStore
+from core.compact_node import tree_index
+from core.signature import EMPTY_SIGNATURE, default_source, get_keywords, signature_fingerprint
+from generate_API_profile import process_single_module
+
+
+def function(source):
+    return ast.parse(source).body[0]
+
+
+def fingerprint(source):
+    return signature_fingerprint(function(source).args)
+
+
+def test_default_source_ignores_formatting():
+    a = function('def f(x=( 1+2 ), y={"a" :[1,2]}): pass')
+    b = function("def f(x=1 + 2, y={'a': [1, 2]}): pass")
+    assert [default_source(d) for d in a.args.defaults] == [default_source(d) for d in b.args.defaults]
+    assert default_source(None) is None
+
+
+def test_get_keywords():
+    names, defaults, fp = get_keywords(function('def f(self, a, b=None, *args, c=1, **kw): pass'))
+    assert names == ['self', 'a', 'b']
+    assert defaults == ['None']
+    assert fp == fingerprint('def f(self, a, b=None, *args, c=1, **kw): pass')
+
+
+def test_same_signature_same_fingerprint():
+    assert fingerprint('def f(a, b=1, *, c=None): pass') == \
+        fingerprint('def f(a,\n      b = 1,\n      *,\n      c = None):\n    """doc"""\n    return a')
+    assert fingerprint('async def f(x): pass') == fingerprint('def f(x): return x')
+    assert fingerprint('def f(): pass') == EMPTY_SIGNATURE
+    assert len(EMPTY_SIGNATURE) == 16
+
+
+@pytest.mark.parametrize('changed', [
+    'def f(a, c=1): pass',          # renamed parameter
+    'def f(a, b=2): pass',          # other default
+    'def f(a, b): pass',            # default dropped
+    'def f(a, b=1, c=2): pass',     # parameter added
+    'def f(a, /, b=1): pass',       # made positional-only
+    'def f(a, *, b=1): pass',       # made keyword-only
+    'def f(a, b=1, *args): pass',   # *args added
+    'def f(a, b=1, **kw): pass',    # **kwargs added
+    'def f(b=1, a=None): pass',     # reordered
+])
+def test_signature_change_changes_fingerprint(changed):
+    assert fingerprint(changed) != fingerprint('def f(a, b=1): pass')
+
+
+def test_profile_nodes_carry_fingerprints(tmp_path):
+    (tmp_path / 'pkg').mkdir()
+    (tmp_path / 'pkg' / '__init__.py').write_text('')
+    (tmp_path / 'pkg' / 'm.py').write_text(
+        'def f(a, b=1): pass\nclass C:\n    def __init__(self, x=None): pass\nclass D:\n    pass\n')
+    pf_tree, _ = process_single_module(str(tmp_path / 'pkg'), BlobStore.open(str(tmp_path / 'src')))
+    index = tree_index(pf_tree)
+    assert index[('pkg.m.f', 'api')].signature == fingerprint('def f(a, b=1): pass')
+    assert index[('pkg.m.C', 'class')].signature == fingerprint('def __init__(self, x=None): pass')
+    assert index[('pkg.m.D', 'class')].signature == EMPTY_SIGNATURE
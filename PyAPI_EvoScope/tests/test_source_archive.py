@@ -0,0 +1,90 @@
+import os
+import pickle
+import hashlib
+
+import pytest
+
+from core.blob_store import BlobStore, is_blob_id, load_source, load_source_lines
+from core.source_archive import SourceArchive, write_source_archive
+
+TEXTS = ['def f():\n    pass\n', 'x = 1\n' * 500, 'def grüße(): return "☃"\n', '']
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / 'blobs'))
+
+
+def test_blob_store(store):
+    ids = [store.put(text) for text in TEXTS]
+    assert ids[0] == hashlib.sha256(TEXTS[0].encode()).hexdigest()
+    assert all(is_blob_id(blob_id) for blob_id in ids)
+    assert store.put(TEXTS[0]) == ids[0]
+    assert (store.n_written, store.n_deduplicated) == (4, 1)
+    assert [store.get(blob_id) for blob_id in ids] == TEXTS
+    # another store on the same root finds the blobs on disk
+    other = BlobStore(store.root)
+    other.put(TEXTS[1])
+    assert (other.n_written, other.n_deduplicated) == (0, 1)
+    assert pickle.loads(pickle.dumps(store)).get(ids[2]) == TEXTS[2]
+    with pytest.raises(FileNotFoundError):
+        store.get('0' * 64)
+
+
+def test_load_source(store, tmp_path):
+    blob_id = store.put('a\r\nb\n')
+    assert load_source(blob_id, store) == 'a\r\nb\n'
+    assert load_source_lines(blob_id, store) == ['a\n', 'b\n']
+    assert load_source(None) == '' and load_source('') == ''
+    # older profiles refer to a file per API
+    path = tmp_path / 'old.py'
+    path.write_text('old\n')
+    assert load_source(str(path), store) == 'old\n'
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_round_trip(store, tmp_path, compress):
+    ids = [store.put(text) for text in TEXTS]
+    path = str(tmp_path / 'pkg.srcpack')
+    # duplicates are packed once
+    assert write_source_archive(path, ids + ids[:2], store, compress=compress) == len(TEXTS)
+    with SourceArchive(path) as archive:
+        assert len(archive) == len(TEXTS)
+        for blob_id, text in zip(ids, TEXTS):
+            assert blob_id in archive
+            assert archive.get(blob_id) == text
+    if compress:
+        assert os.path.getsize(path) < len(TEXTS[1])
+
+
+def test_missing_id(store, tmp_path):
+    path = str(tmp_path / 'pkg.srcpack')
+    write_source_archive(path, [store.put(text) for text in TEXTS[:2]], store)
+    archive = SourceArchive(path)
+    missing = store.put('not packed')
+    assert missing not in archive
+    assert 'not a blob id' not in archive
+    with pytest.raises(KeyError):
+        archive.get(missing)
+    with pytest.raises(KeyError):
+        archive.get('not a blob id')
+    # a pickled archive reopens the file
+    assert pickle.loads(pickle.dumps(archive)).get(store.put(TEXTS[0])) == TEXTS[0]
+    archive.close()
+
+
+def test_empty_archive(store, tmp_path):
+    path = str(tmp_path / 'empty.srcpack')
+    assert write_source_archive(path, [], store) == 0
+    with SourceArchive(path) as archive:
+        assert len(archive) == 0
+        assert store.put(TEXTS[0]) not in archive
+        with pytest.raises(KeyError):
+            archive.get(store.put(TEXTS[0]))
+
+
+def test_not_an_archive(tmp_path):
+    path = tmp_path / 'junk.srcpack'
+    path.write_bytes(b'\x00' * 64)
+    with pytest.raises(ValueError):
+        SourceArchive(str(path))
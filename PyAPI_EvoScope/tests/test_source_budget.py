@@ -0,0 +1,84 @@
+import pickle
+
+from core.blob_store import BlobStore, load_source
+from core.compact_node import tree_index
+from generate_API_profile import FileFacts, SourceBudget, extract_file, process_single_module
+
+SOURCE = 'def f(x):\n    return x\n\nclass C:\n    def m(self):\n        pass\n'
+
+
+class CountingLoader:
+    def __init__(self, source):
+        self.source = source
+        self.n_reads = 0
+
+    def __call__(self):
+        self.n_reads += 1
+        return self.source
+
+
+def test_reserve_and_release():
+    budget = SourceBudget(100)
+    assert budget.reserve(60)
+    assert not budget.reserve(50)
+    assert budget.used == 60
+    budget.release(60)
+    assert budget.reserve(100)
+    # each process gets its own ceiling of the same size
+    copy = pickle.loads(pickle.dumps(budget))
+    assert (copy.max_bytes, copy.used) == (100, 0)
+
+
+def test_source_within_the_budget_is_held():
+    budget, loader = SourceBudget(1000), CountingLoader(SOURCE)
+    facts = FileFacts(SOURCE, extract_file(SOURCE), loader, budget)
+    assert budget.used == len(SOURCE)
+    assert facts.segment(None, 'f') == 'def f(x):\n    return x'
+    assert facts.segment('C', 'm') == 'def m(self):\n        pass'
+    assert loader.n_reads == 0
+    facts.release()
+    assert budget.used == 0
+    assert facts.segments == {}
+
+
+def test_source_over_the_budget_is_read_again():
+    budget, loader = SourceBudget(10), CountingLoader(SOURCE)
+    facts = FileFacts(SOURCE, extract_file(SOURCE), loader, budget)
+    assert budget.used == 0
+    assert facts.segment(None, 'f') == 'def f(x):\n    return x'
+    assert facts.segment(None, 'f') == 'def f(x):\n    return x'
+    # neither the text nor the segment is kept
+    assert loader.n_reads == 2
+    assert facts.segments == {}
+    facts.release()
+    assert budget.used == 0
+
+
+def test_source_read_again_is_held_once_it_fits():
+    budget, loader = SourceBudget(len(SOURCE)), CountingLoader(SOURCE)
+    assert budget.reserve(1)
+    facts = FileFacts(SOURCE, extract_file(SOURCE), loader, budget)
+    assert budget.used == 1
+    budget.release(1)
+    facts.segment(None, 'f')
+    facts.segment('C', None)
+    assert loader.n_reads == 1
+    assert budget.used == len(SOURCE)
+    facts.release()
+    assert budget.used == 0
+
+
+def test_profile_under_a_tight_budget(tmp_path):
+    package = {'pkg/__init__.py': 'from .a import f\n', 'pkg/a.py': SOURCE, 'pkg/b.py': 'def g(y=2):\n    pass\n'}
+    for path, source in package.items():
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(source)
+    budget = SourceBudget(20)
+    bounded_store, full_store = BlobStore.open(str(tmp_path / 'bounded')), BlobStore.open(str(tmp_path / 'full'))
+    bounded, _ = process_single_module(str(tmp_path / 'pkg'), bounded_store, source_budget=budget)
+    full, _ = process_single_module(str(tmp_path / 'pkg'), full_store)
+    assert budget.used == 0
+    assert list(tree_index(bounded)) == list(tree_index(full))
+    for key, node in tree_index(full).items():
+        if getattr(node, 'source', None):
+            assert load_source(tree_index(bounded)[key].source, bounded_store) == load_source(node.source, full_store)
@@ -0,0 +1,92 @@
+from zipfile import ZipFile
+
+import pytest
+
+from core.blob_store import BlobStore
+from core.compact_node import tree_index
+from core.source_tree import ArchiveSourceTree, LocalSourceTree, ZipSourceTree
+from generate_API_profile import process_single_module, process_wheel
+
+MEMBERS = {
+    'pkg/__init__.py': 'from .core import run\n',
+    'pkg/core.py': 'def run(x, y=2): pass\nclass Job:\n    def start(self): pass\n',
+    'pkg/sub/__init__.py': '',
+    'pkg/sub/util.py': 'def helper(): pass\n',
+    'pkg/data/table.csv': 'a,b\n',
+    'pkg-1.0.dist-info/top_level.txt': 'pkg\n',
+}
+
+
+@pytest.fixture
+def wheel_dir(tmp_path):
+    v_dir = tmp_path / 'pkg' / '1.0'
+    v_dir.mkdir(parents=True)
+    # no directory entries, as most wheels are written
+    with ZipFile(str(v_dir / 'pkg-1.0-py3-none-any.whl'), 'w') as zf:
+        for name, source in MEMBERS.items():
+            zf.writestr(name, source)
+    return v_dir
+
+
+@pytest.fixture
+def extracted(tmp_path):
+    root = tmp_path / 'extracted'
+    for name, source in MEMBERS.items():
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text(source)
+    return root
+
+
+def sorted_walk(tree):
+    return sorted((root, sorted(dirs), sorted(files)) for root, dirs, files in tree.walk())
+
+
+def test_zip_tree_matches_the_extracted_directory(wheel_dir, extracted):
+    with ZipSourceTree(ZipFile(str(wheel_dir / 'pkg-1.0-py3-none-any.whl'))) as zip_tree:
+        local_tree = LocalSourceTree(str(extracted))
+        assert sorted_walk(zip_tree) == sorted_walk(local_tree)
+        for path in ('', 'pkg', 'pkg/sub', 'pkg/data'):
+            assert zip_tree.isdir(path)
+            assert sorted(zip_tree.listdir(path)) == sorted(local_tree.listdir(path))
+        assert zip_tree.isfile('pkg/core.py') and not zip_tree.isdir('pkg/core.py')
+        assert zip_tree.read_bytes('pkg/sub/util.py') == local_tree.read_bytes('pkg/sub/util.py')
+        with pytest.raises(FileNotFoundError):
+            zip_tree.read_bytes('pkg/missing.py')
+        with pytest.raises(NotADirectoryError):
+            zip_tree.listdir('pkg/core.py')
+
+
+def test_walk_can_be_pruned():
+    tree = ArchiveSourceTree(['a/b/c.py', 'a/skip/d.py', 'e.py'], lambda name: b'')
+    seen = []
+    for root, dirs, files in tree.walk():
+        seen.append(root)
+        if 'skip' in dirs:
+            dirs.remove('skip')
+    assert seen == ['', 'a', 'a/b']
+
+
+def test_members_outside_the_tree_are_ignored():
+    tree = ArchiveSourceTree(['./', '/abs/x.py', '../evil.py', 'pkg/', 'pkg/./m.py'], lambda name: name.encode())
+    assert tree.listdir('') == ['abs', 'pkg']
+    assert tree.listdir('pkg') == ['m.py']
+    assert tree.read_bytes('pkg/m.py') == b'pkg/./m.py'
+    assert not tree.isfile('evil.py') and not tree.isfile('../evil.py')
+
+
+def test_process_wheel_profiles_in_place(wheel_dir, extracted, tmp_path):
+    source_tree, entry_points = process_wheel(str(wheel_dir), 'pkg')
+    assert isinstance(source_tree, ZipSourceTree)
+    assert entry_points == ['pkg']
+    with source_tree:
+        from_zip, _ = process_single_module(entry_points[0], BlobStore.open(str(tmp_path / 'zip_src')), source_tree)
+    from_disk, _ = process_single_module(str(extracted / 'pkg'), BlobStore.open(str(tmp_path / 'disk_src')))
+    # the same nodes, os.listdir order aside
+    assert sorted(map(str, tree_index(from_zip))) == sorted(map(str, tree_index(from_disk)))
+    assert ('pkg.core.run', 'api') in tree_index(from_zip)
+    # nothing was written next to the wheel
+    assert [p.name for p in wheel_dir.iterdir()] == ['pkg-1.0-py3-none-any.whl']
+
+
+def test_process_wheel_without_a_wheel(tmp_path):
+    assert process_wheel(str(tmp_path), 'pkg') == (None, None)
@@ -0,0 +1,84 @@
+import io
+import pickle
+from collections import deque
+
+from core.blob_store import BlobStore
+from core.compact_node import full_name_key, index_nodes, load_profile, tree_index
+from generate_API_profile import (APIAliasNode, APINode, ClassNode, ModuleOrPackageNode, Tree, find_node_by_name,
+                                  process_single_module)
+from aggregate_API_profile import AggeragatedAPINode, AggeragatedClassNode, AggeragatedModuleOrPackageNode
+
+PACKAGE = {
+    'pkg/__init__.py': 'from .mod import Thing\n',
+    'pkg/mod.py': 'class Thing:\n    def __init__(self, a=1): pass\n    def run(self): pass\n'
+                  'def helper(): pass\n',
+}
+
+
+def bfs_index(root):
+    index = {}
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+        index[full_name_key(node)] = node
+        queue.extend(getattr(node, 'children', ()))
+    return index
+
+
+def test_child_index_follows_appended_children():
+    root = ModuleOrPackageNode('pkg')
+    first = ModuleOrPackageNode('a')
+    root.children.append(first)
+    assert root.child('a') is first
+    assert root.child('b') is None
+    # children added after the first lookup are found too, and the first of a name wins
+    second, duplicate = ModuleOrPackageNode('b'), ModuleOrPackageNode('a')
+    root.children.extend([second, duplicate])
+    assert root.child('b') is second
+    assert root.child('a') is first
+
+
+def test_modules_found_with_or_without_extension():
+    root = Tree('pkg')
+    module, package = Tree('mod.py'), Tree('sub')
+    root.children.extend([module, package])
+    assert find_node_by_name(root, 'mod') is module
+    assert find_node_by_name(root, 'mod.py') is module
+    assert find_node_by_name(root, 'sub') is package
+    assert find_node_by_name(root, 'missing') is None
+
+
+def test_full_name_key_tells_classes_from_constructors():
+    cls, api, alias, module = ClassNode('Thing'), APINode('Thing'), APIAliasNode('Thing'), ModuleOrPackageNode('m')
+    for node in (cls, api, alias):
+        node.full_name = 'pkg.Thing'
+    module.full_name = 'pkg.m'
+    table = {}
+    index_nodes(table, [cls, api, alias, module])
+    assert table == {('pkg.Thing', 'class'): cls, ('pkg.Thing', 'api'): api,
+                     ('pkg.Thing', 'api_alias'): alias, 'pkg.m': module}
+
+
+def test_aggregate_nodes_share_the_profile_keys():
+    nodes = (AggeragatedClassNode('Thing'), AggeragatedAPINode('Thing'), AggeragatedModuleOrPackageNode('pkg'))
+    for node in nodes:
+        node.full_name = 'pkg.Thing'
+    assert [full_name_key(node) for node in nodes] == [('pkg.Thing', 'class'), ('pkg.Thing', 'api'), 'pkg.Thing']
+
+
+def test_profile_index_matches_the_tree(tmp_path):
+    for path, source in PACKAGE.items():
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(source)
+    pf_tree, _ = process_single_module(str(tmp_path / 'pkg'), BlobStore.open(str(tmp_path / 'src')))
+    index = tree_index(pf_tree)
+    assert dict(index) == bfs_index(pf_tree)
+    assert ('pkg.mod.Thing', 'class') in index
+    assert ('pkg.mod.Thing', 'api') in index
+    assert index[('pkg.Thing', 'class_alias')].real_class is index[('pkg.mod.Thing', 'class')]
+
+    # the index is not pickled, a loaded tree rebuilds the same keys on first use
+    loaded = load_profile(io.BytesIO(pickle.dumps(pf_tree)))
+    assert not hasattr(loaded, '_full_name_index')
+    assert list(tree_index(loaded)) == list(index)
+    assert tree_index(loaded) is tree_index(loaded)
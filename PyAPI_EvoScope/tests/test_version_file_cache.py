@@ -0,0 +1,93 @@
+import zipfile
+
+import pytest
+
+import generate_API_profile
+from generate_API_profile import VersionFileCache, last_version_files, profile_version, remember_version_files
+
+FILES = {
+    'pkg/__init__.py': 'from .a import f\n',
+    'pkg/a.py': 'def f(x, y=1):\n    return x\n',
+    'pkg/b.py': 'class C:\n    def m(self):\n        pass\n',
+}
+
+
+def write_wheel(tmp_path, version, files, record):
+    v_dir = tmp_path / 'libs' / 'pkg' / version
+    v_dir.mkdir(parents=True)
+    with zipfile.ZipFile(str(v_dir / 'pkg-{}-py3-none-any.whl'.format(version)), 'w') as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+        zf.writestr('pkg-{}.dist-info/top_level.txt'.format(version), 'pkg\n')
+        if record is not None:
+            zf.writestr('pkg-{}.dist-info/RECORD'.format(version), record)
+    return str(v_dir)
+
+
+def record(digests):
+    return ''.join('{},sha256={},10\n'.format(name, digest) for name, digest in digests.items())
+
+
+@pytest.fixture
+def profile(tmp_path):
+    last_version_files.pop('pkg', None)
+
+    def profile(version, files, record_text):
+        v_dir = write_wheel(tmp_path, version, files, record_text)
+        pf_trees = profile_version('pkg', version, v_dir, str(tmp_path / 'out'), str(tmp_path / 'src'))
+        return pf_trees, last_version_files['pkg']
+    yield profile
+    last_version_files.pop('pkg', None)
+
+
+def signature_of(pf_trees, full_name):
+    queue = list(pf_trees)
+    while queue:
+        node = queue.pop(0)
+        if node.full_name == full_name and type(node).__name__ == 'APINode':
+            return node.kws, node.default_values
+        queue.extend(getattr(node, 'children', ()))
+
+
+def test_unchanged_files_are_reused(profile):
+    digests = {'pkg/__init__.py': 'i1', 'pkg/a.py': 'a1', 'pkg/b.py': 'b1'}
+    _, cache = profile('1.0', FILES, record(digests))
+    assert (cache.n_reused, cache.n_parsed) == (0, 3)
+
+    changed = dict(FILES, **{'pkg/a.py': 'def f(x, y=2, z=3):\n    return x\n'})
+    pf_trees, cache = profile('1.1', changed, record(dict(digests, **{'pkg/a.py': 'a2'})))
+    # the changed hash is parsed again, the others are taken from 1.0
+    assert (cache.n_reused, cache.n_parsed) == (2, 1)
+    assert signature_of(pf_trees, 'pkg.a.f')[1] == ['2', '3']
+
+
+@pytest.mark.parametrize('record_text', [None, '\x00not,a\nrecord', 'pkg/a.py,md5=a1,10\n'])
+def test_missing_or_corrupt_record_falls_back_to_parsing(profile, record_text):
+    digests = {'pkg/__init__.py': 'i1', 'pkg/a.py': 'a1', 'pkg/b.py': 'b1'}
+    profile('1.0', FILES, record(digests))
+    pf_trees, cache = profile('1.1', FILES, record_text)
+    assert (cache.n_reused, cache.n_parsed) == (0, 3)
+    assert signature_of(pf_trees, 'pkg.a.f')[1] == ['1']
+
+
+def test_only_the_latest_libraries_are_remembered(monkeypatch):
+    monkeypatch.setattr(generate_API_profile, 'MAX_REMEMBERED_LIBS', 2)
+    monkeypatch.setattr(generate_API_profile, 'last_version_files', {})
+    caches = {name: VersionFileCache({}) for name in ('a', 'b', 'c')}
+    remember_version_files('a', caches['a'])
+    remember_version_files('b', caches['b'])
+    remember_version_files('a', caches['a'])
+    remember_version_files('c', caches['c'])
+    # 'b' was used least recently
+    assert generate_API_profile.last_version_files == {'a': caches['a'], 'c': caches['c']}
+
+
+def test_reuse_by_digest():
+    previous = VersionFileCache({'x.py': 'd1'})
+    previous.add('x.py', 'facts')
+    cache = VersionFileCache({'y.py': 'd1', 'z.py': 'd2'}, previous)
+    # a renamed file with the same content is still reused
+    assert cache.reuse('y.py') == 'facts'
+    assert cache.reuse('z.py') is None
+    assert cache.reuse('missing.py') is None
+    assert (cache.n_reused, cache.n_parsed) == (1, 0)
@@ -12,6 +12,8 @@ import seaborn as sns
 import networkx as nx
 from matplotlib.patches import Rectangle
 import json
+from core.profile_shards import ShardedProfile, is_sharded_profile
+from core.columnar_profile import ColumnarProfile, is_columnar_profile
 
 # 设置样式
 plt.rcParams['font.sans-serif'] = ['SimHei', 'Arial Unicode MS', 'DejaVu Sans']
@@ -503,8 +505,29 @@ def convert_to_serializable(obj):
         return obj
 
 
-def visualize_all_trees(lib_name=None):
-    """主函数：可视化所有树形结构"""
+def list_aggregated_libs():
+    """output_agg 中的聚合剖面, 每个库一个: 优先列式格式, 其次分片目录, 最后单个 pickle"""
+    preference = {'.cols': 0, '.shards': 1, '.pickle': 2}
+    found = {}
+    for f in sorted(os.listdir('output_agg')):
+        lib_name, ext = os.path.splitext(f)
+        path = os.path.join('output_agg', f)
+        if ext == '.pickle' or ext == '.cols' and is_columnar_profile(path) or \
+                ext == '.shards' and is_sharded_profile(path):
+            if lib_name not in found or preference[ext] < preference[os.path.splitext(found[lib_name])[1]]:
+                found[lib_name] = f
+    return list(found.values())
+
+
+def load_tree(path):
+    """加载剖面树: 列式格式直接映射读取, 不需要 unpickle"""
+    if is_columnar_profile(path):
+        return ColumnarProfile(path).root()
+    return load_pickle_file(path)
+
+
+def visualize_all_trees(lib_name=None, subpackage=None):
+    """主函数：可视化所有树形结构, 分片的聚合树可以只加载一个子包"""
     print("=" * 60)
     print("PyMevol 树形结构可视化工具")
     print("=" * 60)
@@ -518,7 +541,7 @@ def visualize_all_trees(lib_name=None):
         print("⚠  warning: output_profile目录不存在，只能显示聚合树")
 
     # 查找可用的库
-    lib_files = [f for f in os.listdir('output_agg') if f.endswith('.pickle')]
+    lib_files = list_aggregated_libs()
 
     if not lib_files:
         print("错误: 未找到聚合剖面文件")
@@ -526,20 +549,22 @@ def visualize_all_trees(lib_name=None):
 
     print(f"  找到 {len(lib_files)} 个库:")
     for i, file in enumerate(lib_files, 1):
-        print(f"  {i}. {file.replace('.pickle', '')}")
+        print(f"  {i}. {os.path.splitext(file)[0]}")
 
     # 选择库
     if lib_name is None:
         lib_file = lib_files[0]
-        lib_name = lib_file.replace('.pickle', '')
+        lib_name = os.path.splitext(lib_file)[0]
         print(f"\n  自动选择第一个库: {lib_name}")
     else:
-        lib_file = f"{lib_name}.pickle" if not lib_name.endswith('.pickle') else lib_name
-        if lib_file not in lib_files:
+        lib_name = lib_name.replace('.pickle', '')
+        candidates = [f for f in lib_files if os.path.splitext(f)[0] == lib_name]
+        if not candidates:
             print(f"⚠ 未找到库 {lib_name}，使用第一个库")
             lib_file = lib_files[0]
-            lib_name = lib_file.replace('.pickle', '')
+            lib_name = os.path.splitext(lib_file)[0]
         else:
+            lib_file = candidates[0]
             print(f"\n  分析指定库: {lib_name}")
 
     # 创建输出目录
@@ -552,7 +577,15 @@ def visualize_all_trees(lib_name=None):
         # 1. 加载聚合树
         print(f"\n  加载聚合树...")
         agg_file = os.path.join('output_agg', lib_file)
-        agg_tree = load_pickle_file(agg_file)
+        if is_sharded_profile(agg_file):
+            sharded = ShardedProfile(agg_file, unpickler=CustomUnpickler)
+            if subpackage in sharded.shard_names:
+                # 只加载这个子包的分片
+                agg_tree = sharded.shard(subpackage)
+            else:
+                agg_tree = sharded.tree()
+        else:
+            agg_tree = load_tree(agg_file)
         print("  聚合树加载成功")
 
         # 2. 创建聚合树形图
@@ -584,8 +617,11 @@ def visualize_all_trees(lib_name=None):
                         pickle_files = [f for f in os.listdir(version_dir) if f.endswith('.pickle')]
                         if pickle_files:
                             single_pickle = os.path.join(version_dir, pickle_files[0])
+                            # convert_profile.py 转换过的版本有列式格式
+                            if is_columnar_profile(single_pickle[:-len('.pickle')] + '.cols'):
+                                single_pickle = single_pickle[:-len('.pickle')] + '.cols'
                             try:
-                                single_tree = load_pickle_file(single_pickle)
+                                single_tree = load_tree(single_pickle)
                                 print(f"    加载版本 {version}")
 
                                 # 创建单个版本的树形图
@@ -744,13 +780,14 @@ def main():
 
     if len(sys.argv) > 1:
         lib_name = sys.argv[1]
-        visualize_all_trees(lib_name)
+        # 第二个参数: 只可视化分片聚合树中的一个子包
+        subpackage = sys.argv[2] if len(sys.argv) > 2 else None
+        visualize_all_trees(lib_name, subpackage)
     else:
         # 可视化第一个库
-        lib_files = [f for f in os.listdir('output_agg') if f.endswith('.pickle')] if os.path.exists(
-            'output_agg') else []
+        lib_files = list_aggregated_libs() if os.path.exists('output_agg') else []
         if lib_files:
-            lib_name = lib_files[0].replace('.pickle', '')
+            lib_name = os.path.splitext(lib_files[0])[0]
             visualize_all_trees(lib_name)
         else:
             print("  未找到任何库数据")